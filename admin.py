@@ -8,11 +8,145 @@ from kivy.uix.textinput import TextInput
 from kivy.uix.button import Button
 from kivy.uix.modalview import ModalView
 from kivy.uix.gridlayout import GridLayout
+from kivy.uix.progressbar import ProgressBar
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
 
 from utils import show_popup
 from database import db
+from money import Money
+from plans import plan_catalog
 from admin_verify import admin_verifier
+from auto_payment import auto_payment
+from exporter import data_exporter, ExportCancelled
+from tasks import task_executor
 import json
+from datetime import datetime
+
+class PagedRecycleView(RecycleView):
+    """RecycleView that pulls keyset-paginated pages as the admin scrolls.
+
+    fetch_page(cursor, limit) must return (rows, next_cursor), with
+    next_cursor None on the last page; to_data turns a row into the dict
+    handed to the viewclass. Only the rows on screen are materialized.
+    """
+    
+    def __init__(self, fetch_page, to_data, viewclass, row_height, screen, page_size=50, **kwargs):
+        super().__init__(**kwargs)
+        self.fetch_page = fetch_page
+        self.to_data = to_data
+        self.viewclass = viewclass
+        self.screen = screen
+        self.page_size = page_size
+        
+        rows = RecycleBoxLayout(
+            orientation='vertical',
+            default_size=(None, row_height),
+            default_size_hint=(1, None),
+            size_hint_y=None,
+            spacing=5
+        )
+        rows.bind(minimum_height=rows.setter('height'))
+        self.add_widget(rows)
+        
+        self.bind(scroll_y=self.on_scroll)
+        self.reload()
+    
+    def reload(self):
+        """Start again from the first page"""
+        self.cursor = None
+        self.exhausted = False
+        self.data = []
+        self.load_more()
+        self.scroll_y = 1
+    
+    def load_more(self):
+        """Append the next page, if there is one"""
+        if self.exhausted:
+            return
+        rows, self.cursor = self.fetch_page(self.cursor, self.page_size)
+        self.exhausted = self.cursor is None
+        self.data.extend(self.to_data(row) for row in rows)
+    
+    def on_scroll(self, instance, scroll_y):
+        # scroll_y hits 0 at the bottom; fetch a bit before the end
+        if scroll_y <= 0.1:
+            self.load_more()
+
+class UserRow(RecycleDataViewBehavior, BoxLayout):
+    """A user list row; rebound to new data as it scrolls instead of being rebuilt"""
+    
+    def __init__(self, **kwargs):
+        super().__init__(orientation='horizontal', padding=10, **kwargs)
+        self.user_id = None
+        self.rv = None
+        
+        user_info = BoxLayout(orientation='vertical')
+        self.phone_label = Label(font_size='14sp', bold=True)
+        self.wallet_label = Label(font_size='12sp')
+        self.joined_label = Label(font_size='10sp')
+        user_info.add_widget(self.phone_label)
+        user_info.add_widget(self.wallet_label)
+        user_info.add_widget(self.joined_label)
+        
+        actions = BoxLayout(orientation='horizontal', size_hint_x=None, width=200)
+        
+        view_btn = Button(text='View', size_hint_x=None, width=60)
+        view_btn.bind(on_press=lambda x: self.rv.screen.view_user_details(self.user_id))
+        
+        adjust_btn = Button(text='Adjust', size_hint_x=None, width=60)
+        adjust_btn.bind(on_press=lambda x: self.rv.screen.adjust_user_wallet(self.user_id))
+        
+        delete_btn = Button(text='Delete', size_hint_x=None, width=60)
+        delete_btn.bind(on_press=lambda x: self.rv.screen.delete_user(self.user_id))
+        
+        actions.add_widget(view_btn)
+        actions.add_widget(adjust_btn)
+        actions.add_widget(delete_btn)
+        
+        self.add_widget(user_info)
+        self.add_widget(actions)
+    
+    def refresh_view_attrs(self, rv, index, data):
+        self.rv = rv
+        self.user_id = data['user_id']
+        self.phone_label.text = data['phone_text']
+        self.wallet_label.text = data['wallet_text']
+        self.joined_label.text = data['joined_text']
+        return super().refresh_view_attrs(rv, index, data)
+
+class TransactionRow(RecycleDataViewBehavior, BoxLayout):
+    """A ledger row; rebound to new data as it scrolls instead of being rebuilt"""
+    
+    def __init__(self, **kwargs):
+        super().__init__(orientation='vertical', padding=10, spacing=5, **kwargs)
+        
+        top_row = BoxLayout(size_hint_y=None, height=20)
+        self.user_label = Label(font_size='12sp', halign='left')
+        self.date_label = Label(font_size='10sp', halign='right')
+        top_row.add_widget(self.user_label)
+        top_row.add_widget(self.date_label)
+        
+        middle_row = BoxLayout(size_hint_y=None, height=30)
+        self.type_label = Label(font_size='14sp', bold=True, halign='left')
+        self.amount_label = Label(font_size='14sp', bold=True, halign='right')
+        middle_row.add_widget(self.type_label)
+        middle_row.add_widget(self.amount_label)
+        
+        self.desc_label = Label(font_size='12sp', halign='left')
+        
+        self.add_widget(top_row)
+        self.add_widget(middle_row)
+        self.add_widget(self.desc_label)
+    
+    def refresh_view_attrs(self, rv, index, data):
+        self.user_label.text = data['user_text']
+        self.date_label.text = data['date_text']
+        self.type_label.text = data['type_text']
+        self.amount_label.text = data['amount_text']
+        self.desc_label.text = data['desc_text']
+        return super().refresh_view_attrs(rv, index, data)
 
 class AdminScreen(Screen):
     def __init__(self, **kwargs):
@@ -153,12 +287,10 @@ class AdminScreen(Screen):
         self.add_widget(scroll)
     
     def show_users_list(self, instance):
-        """Show list of all users"""
+        """Show list of all users, paged from the database as the admin scrolls"""
         self.clear_widgets()
         
-        scroll = ScrollView()
-        layout = BoxLayout(orientation='vertical', spacing=10, padding=20, size_hint_y=None)
-        layout.bind(minimum_height=layout.setter('height'))
+        layout = BoxLayout(orientation='vertical', spacing=10, padding=20)
         
         # Header
         header = BoxLayout(size_hint_y=None, height=50)
@@ -176,58 +308,40 @@ class AdminScreen(Screen):
         header.add_widget(back_btn)
         layout.add_widget(header)
         
-        # Users list
-        users = db.get_all_users()
-        
-        if not users:
-            layout.add_widget(Label(text='No users found', font_size='16sp'))
-        else:
-            for user in users:
-                user_id, phone, wallet, referral, created_at = user
-                
-                user_card = BoxLayout(
-                    orientation='horizontal', 
-                    size_hint_y=None, 
-                    height=80,
-                    padding=10
-                )
-                
-                user_info = BoxLayout(orientation='vertical')
-                user_info.add_widget(Label(
-                    text=f'📱 {phone}',
-                    font_size='14sp',
-                    bold=True
-                ))
-                user_info.add_widget(Label(
-                    text=f'💰 ₹{wallet:.2f} | 🎯 {referral}',
-                    font_size='12sp'
-                ))
-                user_info.add_widget(Label(
-                    text=f'Joined: {created_at[:10]}',
-                    font_size='10sp'
-                ))
-                
-                actions = BoxLayout(orientation='horizontal', size_hint_x=None, width=200)
-                
-                view_btn = Button(text='View', size_hint_x=None, width=60)
-                view_btn.bind(on_press=lambda x, uid=user_id: self.view_user_details(uid))
-                
-                adjust_btn = Button(text='Adjust', size_hint_x=None, width=60)
-                adjust_btn.bind(on_press=lambda x, uid=user_id: self.adjust_user_wallet(uid))
-                
-                delete_btn = Button(text='Delete', size_hint_x=None, width=60)
-                delete_btn.bind(on_press=lambda x, uid=user_id: self.delete_user(uid))
-                
-                actions.add_widget(view_btn)
-                actions.add_widget(adjust_btn)
-                actions.add_widget(delete_btn)
-                
-                user_card.add_widget(user_info)
-                user_card.add_widget(actions)
-                layout.add_widget(user_card)
+        # Search by referral code or user id
+        search_bar = BoxLayout(size_hint_y=None, height=44, spacing=5)
+        self.user_search = TextInput(
+            hint_text='Referral code or user ID',
+            multiline=False
+        )
+        search_btn = Button(text='Search', size_hint_x=None, width=80)
+        search_bar.add_widget(self.user_search)
+        search_bar.add_widget(search_btn)
+        layout.add_widget(search_bar)
+        
+        # Users list - only the visible rows are ever built as widgets
+        self.users_view = PagedRecycleView(
+            fetch_page=lambda cursor, limit: db.get_users_page(cursor, limit, self.user_search.text),
+            to_data=self.user_row_data,
+            viewclass=UserRow,
+            row_height=80,
+            screen=self
+        )
+        search_btn.bind(on_press=lambda x: self.users_view.reload())
+        self.user_search.bind(on_text_validate=lambda x: self.users_view.reload())
+        layout.add_widget(self.users_view)
         
-        scroll.add_widget(layout)
-        self.add_widget(scroll)
+        self.add_widget(layout)
+    
+    @staticmethod
+    def user_row_data(user):
+        user_id, phone, wallet, referral, created_at = user
+        return {
+            'user_id': user_id,
+            'phone_text': f'📱 {phone}',
+            'wallet_text': f'💰 ₹{wallet:.2f} | 🎯 {referral}',
+            'joined_text': f'Joined: {created_at[:10]}',
+        }
     
     def view_user_details(self, user_id):
         """Show detailed user information"""
@@ -253,9 +367,9 @@ class AdminScreen(Screen):
         info_text = f'''
         User ID: {user_info[0]}
         Phone: {user_info[1]}
-        Wallet: ₹{user_info[3]:.2f}
-        Referral: {user_info[4]}
-        Joined: {user_info[5]}
+        Wallet: ₹{user_info[5]:.2f}
+        Referral: {user_info[6]}
+        Joined: {user_info[7]}
         '''
         
         layout.add_widget(Label(text=info_text, font_size='12sp'))
@@ -271,7 +385,7 @@ class AdminScreen(Screen):
         
         if investments:
             for inv in investments:
-                inv_text = f'Plan {inv[2]}: ₹{inv[3]} | Days: {inv[7]}/{inv[6]} | Profit: ₹{inv[8]:.2f}'
+                inv_text = f'Plan {inv[2]}: ₹{inv[3]} | Days left: {inv[6]}/{inv[5]} | Profit: ₹{inv[7]:.2f}'
                 layout.add_widget(Label(text=inv_text, font_size='10sp'))
         else:
             layout.add_widget(Label(text='No investments', font_size='12sp'))
@@ -334,10 +448,10 @@ class AdminScreen(Screen):
     def apply_wallet_adjustment(self, user_id, popup):
         """Apply wallet adjustment"""
         try:
-            amount = float(self.adjust_amount.text)
+            amount = Money.from_rupees(self.adjust_amount.text)
             reason = self.adjust_reason.text or "Admin adjustment"
             
-            if amount == 0:
+            if not amount:
                 show_popup('Error', 'Amount cannot be zero')
                 return
             
@@ -506,6 +620,8 @@ class AdminScreen(Screen):
 
     def mark_as_verified(self, transaction_id):
         success, message = admin_verifier.verify_payment(transaction_id)
+        if success:
+            auto_payment.notify_payment_verified(transaction_id)
         show_popup('Verification', message)
         self.show_auto_verify_screen(None) # Refresh the screen
     
@@ -572,6 +688,7 @@ class AdminScreen(Screen):
         popup.dismiss() # Dismiss the current popup first
         success, message = admin_verifier.verify_payment(transaction_id)
         if success:
+            auto_payment.notify_payment_verified(transaction_id)
             show_popup('Success', 'Payment verified! Investment activated.')
             # Refresh the view by opening a new, updated popup
             self.show_payment_verification(None)
@@ -581,13 +698,11 @@ class AdminScreen(Screen):
             self.show_payment_verification(None)
     
     def show_transactions_list(self, instance):
-        """Show all transactions"""
+        """Show the transaction ledger, paged from the database as the admin scrolls"""
         self.clear_widgets()
-
-        scroll = ScrollView()
-        layout = BoxLayout(orientation='vertical', spacing=10, padding=20, size_hint_y=None)
-        layout.bind(minimum_height=layout.setter('height'))
-
+        
+        layout = BoxLayout(orientation='vertical', spacing=10, padding=20)
+        
         # Header
         header = BoxLayout(size_hint_y=None, height=50)
         header.add_widget(Label(
@@ -599,35 +714,57 @@ class AdminScreen(Screen):
         back_btn.bind(on_press=lambda x: self.show_admin_dashboard())
         header.add_widget(back_btn)
         layout.add_widget(header)
-
-        # Transactions list
-        transactions = db.get_all_transactions(limit=200)
-
-        if not transactions:
-            layout.add_widget(Label(text='No transactions found.', font_size='16sp'))
-        else:
-            for txn in transactions:
-                txn_id, user_id, txn_type, amount, desc, status, bank_details, created_at, phone = txn
-
-                card = BoxLayout(orientation='vertical', size_hint_y=None, height=100, padding=10, spacing=5)
-                
-                # Top row: User and Date
-                top_row = BoxLayout(size_hint_y=None, height=20)
-                top_row.add_widget(Label(text=f"User: {phone}", font_size='12sp', halign='left'))
-                top_row.add_widget(Label(text=f"{created_at[:16]}", font_size='10sp', halign='right'))
-                card.add_widget(top_row)
-
-                # Middle row: Type and Amount
-                middle_row = BoxLayout(size_hint_y=None, height=30)
-                middle_row.add_widget(Label(text=f"Type: {txn_type.capitalize()}", font_size='14sp', bold=True, halign='left'))
-                middle_row.add_widget(Label(text=f"₹{amount:,.2f}", font_size='14sp', bold=True, halign='right'))
-                card.add_widget(middle_row)
-
-                card.add_widget(Label(text=f"Desc: {desc}", font_size='12sp', halign='left'))
-                layout.add_widget(card)
-
-        scroll.add_widget(layout)
-        self.add_widget(scroll)
+        
+        # Filters - type, status, user and a date range (YYYY-MM-DD)
+        self.ledger_filters = {
+            'type': TextInput(hint_text='Type', multiline=False),
+            'status': TextInput(hint_text='Status', multiline=False),
+            'user_id': TextInput(hint_text='User ID', multiline=False, input_filter='int'),
+            'start': TextInput(hint_text='From', multiline=False),
+            'end': TextInput(hint_text='To', multiline=False),
+        }
+        filter_bar = BoxLayout(size_hint_y=None, height=44, spacing=5)
+        for field in self.ledger_filters.values():
+            filter_bar.add_widget(field)
+            field.bind(on_text_validate=lambda x: self.transactions_view.reload())
+        filter_btn = Button(text='Filter', size_hint_x=None, width=80)
+        filter_bar.add_widget(filter_btn)
+        layout.add_widget(filter_bar)
+        
+        # Transactions list - only the visible rows are ever built as widgets
+        self.transactions_view = PagedRecycleView(
+            fetch_page=self.fetch_ledger_page,
+            to_data=self.transaction_row_data,
+            viewclass=TransactionRow,
+            row_height=100,
+            screen=self
+        )
+        filter_btn.bind(on_press=lambda x: self.transactions_view.reload())
+        layout.add_widget(self.transactions_view)
+        
+        self.add_widget(layout)
+    
+    def fetch_ledger_page(self, cursor, limit):
+        filters = {name: field.text.strip() or None for name, field in self.ledger_filters.items()}
+        if filters['type']:
+            filters['type'] = filters['type'].lower()
+        if filters['user_id']:
+            filters['user_id'] = int(filters['user_id'])
+        if filters['end'] and len(filters['end']) == 10:
+            # A bare date means "up to the end of that day"
+            filters['end'] += ' 23:59:59.999'
+        return db.get_ledger_page(cursor, limit, **filters)
+    
+    @staticmethod
+    def transaction_row_data(txn):
+        txn_id, user_id, txn_type, amount, desc, status, bank_details, created_at, phone = txn
+        return {
+            'user_text': f"User: {phone}",
+            'date_text': f"{created_at[:16]}",
+            'type_text': f"Type: {txn_type.capitalize()}",
+            'amount_text': f"₹{amount:,.2f}",
+            'desc_text': f"Desc: {desc}",
+        }
     
     def show_admin_tools(self, instance):
         """Show admin tools"""
@@ -642,6 +779,9 @@ class AdminScreen(Screen):
         
         tools = [
             ('🔄 Process Daily Returns', self.process_daily_returns),
+            ('🧮 Reconcile Stats', self.reconcile_stats),
+            ('📒 Verify Ledger', self.verify_ledger),
+            ('📉 Liability Projection', self.liability_projection),
             ('📊 Export Data', self.export_data),
             ('🛠️ System Info', self.system_info)
         ]
@@ -659,22 +799,164 @@ class AdminScreen(Screen):
         popup.open()
     
     def process_daily_returns(self, instance):
-        """Manually process daily returns"""
-        db.calculate_daily_returns()
-        show_popup('Success', 'Daily returns processed successfully')
+        """Manually process daily returns on a worker thread"""
+        def on_done(credited):
+            instance.disabled = False
+            show_popup('Success', f'Daily returns processed successfully\n{credited} returns credited')
+        
+        def on_failed(error):
+            instance.disabled = False
+            show_popup('Error', f'Processing daily returns failed: {error}')
+        
+        instance.disabled = True
+        task_executor.submit(db.calculate_daily_returns, on_success=on_done, on_error=on_failed,
+                             name='calculate_daily_returns')
+    
+    def reconcile_stats(self, instance):
+        """Recompute dashboard stats from the underlying tables"""
+        db.reconcile_platform_stats()
+        show_popup('Success', 'Platform stats reconciled')
+    
+    def verify_ledger(self, instance):
+        """Check every balance against the full ledger history on a worker thread"""
+        def on_done(result):
+            instance.disabled = False
+            if result['ok']:
+                show_popup('Success', f"Ledger balanced\n{result['accounts']} accounts, {result['postings']} postings")
+            else:
+                show_popup('Error', f"Ledger mismatches found\n"
+                                    f"{len(result['mismatches'])} accounts, "
+                                    f"{len(result['wallet_mismatches'])} wallets, "
+                                    f"imbalance ₹{result['imbalance']:.2f}")
+        
+        def on_failed(error):
+            instance.disabled = False
+            show_popup('Error', f'Ledger verification failed: {error}')
+        
+        instance.disabled = True
+        task_executor.submit(db.reconcile_ledger, full=True, on_success=on_done, on_error=on_failed,
+                             name='verify_ledger')
+    
+    def liability_projection(self, instance):
+        """Show what active investments will be owed over the coming days"""
+        def on_done(projection):
+            instance.disabled = False
+            cumulative = projection['cumulative']
+            lines = [
+                f"From {projection['start']:%d %b %Y}, {projection['investments']} active investments",
+                *(f"Next {days} days: ₹{Money(int(cumulative[days - 1])):,.2f}"
+                  for days in (7, 30, 90) if days <= projection['horizon']),
+                f"Owed until maturity: ₹{projection['outstanding']:,.2f}",
+                '',
+            ]
+            for plan_id, plan in projection['by_plan'].items():
+                name = getattr(plan_catalog.get(plan_id, db.conn), 'name', f'Plan {plan_id}')
+                lines.append(f"{name}: ₹{plan['total']:,.2f} ({plan['investments']} investments)")
+            
+            week = min(7, projection['horizon'])
+            lines += [
+                '',
+                f"Maturing in {week} days: {int(projection['maturities'][:week].sum())} investments, "
+                f"₹{Money(int(projection['maturing_principal'][:week].sum())):,.2f} invested",
+            ]
+            show_popup('Liability Projection', '\n'.join(lines))
+        
+        def on_failed(error):
+            instance.disabled = False
+            show_popup('Error', f'Projection failed: {error}')
+        
+        instance.disabled = True
+        task_executor.submit(db.project_liabilities, 90, on_success=on_done, on_error=on_failed,
+                             name='project_liabilities')
     
     def export_data(self, instance):
-        """Export database data"""
-        # Implement data export functionality
-        show_popup('Info', 'Export feature coming soon')
+        """Export database tables to CSV or JSONL in the background"""
+        popup = ModalView(size_hint=(0.8, 0.6), auto_dismiss=False)
+        layout = BoxLayout(orientation='vertical', padding=20, spacing=15)
+        
+        layout.add_widget(Label(
+            text='📊 Export Data',
+            font_size='18sp',
+            bold=True
+        ))
+        
+        status = Label(text='Choose a format', font_size='14sp')
+        progress = ProgressBar(max=1, value=0, size_hint_y=None, height=20)
+        layout.add_widget(status)
+        layout.add_widget(progress)
+        
+        formats = BoxLayout(size_hint_y=None, height=50, spacing=5)
+        
+        def on_progress(table, done, total):
+            progress.max = max(total, 1)
+            progress.value = done
+            status.text = f'Exporting {table}... {done:,} / {total:,} rows'
+        
+        def on_complete(results):
+            rows = sum(count for path, count in results.values())
+            status.text = f'✅ Exported {rows:,} rows to\n{out_dir}'
+            close_btn.text = 'Close'
+        
+        def on_error(error):
+            status.text = '⛔ Export cancelled' if isinstance(error, ExportCancelled) else f'❌ Export failed: {error}'
+            close_btn.text = 'Close'
+        
+        def start(fmt, compress):
+            nonlocal out_dir
+            if data_exporter.running:
+                return
+            out_dir = os.path.join(App.get_running_app().user_data_dir, 'exports',
+                                   datetime.now().strftime('%Y%m%d_%H%M%S'))
+            formats.disabled = True
+            close_btn.text = 'Cancel'
+            status.text = 'Starting export...'
+            data_exporter.export_in_background(out_dir, fmt, compress, on_progress=on_progress,
+                                               on_complete=on_complete, on_error=on_error)
+        
+        out_dir = None
+        for text, fmt, compress in (('CSV', 'csv', False), ('JSONL', 'jsonl', False), ('CSV.gz', 'csv', True)):
+            btn = Button(text=text)
+            btn.bind(on_press=lambda x, fmt=fmt, compress=compress: start(fmt, compress))
+            formats.add_widget(btn)
+        layout.add_widget(formats)
+        
+        def close(x):
+            if data_exporter.running:
+                data_exporter.cancel()
+            else:
+                popup.dismiss()
+        
+        close_btn = Button(text='Close', size_hint_y=None, height=50)
+        close_btn.bind(on_press=close)
+        layout.add_widget(close_btn)
+        
+        popup.add_widget(layout)
+        popup.open()
     
     def system_info(self, instance):
         """Show system information"""
         import platform
+        from db_connection import connection_pool
+        from sms_service import sms_service
+        from rate_limiter import rate_limiter
+        from password_hasher import password_hasher
+        pool = connection_pool.metrics()
+        tasks = task_executor.metrics()
+        sms = sms_service.batcher.metrics()
+        limits = rate_limiter.stats()
+        kdf = password_hasher.metrics()
         info = f'''
         Python: {platform.python_version()}
         Platform: {platform.platform()}
         Database: SQLite
         Total Users: {db.get_platform_stats()["total_users"]}
+        DB Connections: {pool["open_connections"]} open, {pool["checkouts"]} checkouts
+        DB Wait: {pool["avg_wait_ms"]:.3f} ms avg, {pool["max_wait_ms"]:.3f} ms max
+        Background Tasks: {tasks["running"]} running, {tasks["completed"]} done, {tasks["failed"]} failed
+        Task Time: {tasks["avg_run_ms"]:.0f} ms avg, {tasks["max_run_ms"]:.0f} ms max
+        SMS Batches: {sms["batches"]} sent, {sms["avg_batch_size"]:.1f} avg size, {sms["api_calls_saved"]} calls saved
+        SMS Latency: {sms["avg_latency_ms"]:.0f} ms avg, {sms["max_latency_ms"]:.0f} ms max
+        Rate Limiter: {limits["keys"]} keys ({limits["backend"]}), {limits["blocked"]} of {limits["checks"]} blocked
+        Hashing: {kdf["hashes"]} ({kdf["mode"]} x{kdf["workers"]}), {kdf["hashes_per_sec"]:.1f}/s, {kdf["avg_ms"]:.0f} ms avg
         '''
         show_popup('System Info', info)
\ No newline at end of file
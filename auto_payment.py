@@ -1,17 +1,22 @@
 # auto_payment.py
 import webbrowser
 from urllib.parse import quote
-import sqlite3
 from kivy.logger import Logger
 from kivy.clock import Clock
 import time
 from datetime import datetime
+from db_connection import connection_pool
+from ledger import ledger, RETURNS
+from money import Money
+from plans import plan_catalog
+from queries import PAYMENT_INTENT_STATUS
 
 class AutomatedPayment:
     def __init__(self):
         self.upi_id = "9308691451@ybl"
         self.merchant_name = "Invest Kar"
         self.payment_timeout = 300  # 5 minutes
+        self.verifier = PaymentVerificationDispatcher(self)
         
     def generate_upi_deep_link(self, amount, transaction_id, description):
         """Generate UPI deep link with FIXED amount"""
@@ -57,124 +62,109 @@ class AutomatedPayment:
     
     def store_payment_intent(self, transaction_id, user_id, plan_id, amount):
         """Store payment intent for verification"""
-        conn = sqlite3.connect("investkar_data.db")
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS payment_intents (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                transaction_id TEXT UNIQUE,
-                user_id INTEGER,
-                plan_id INTEGER,
-                amount REAL,
-                status TEXT DEFAULT 'pending',
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                verified_at TEXT,
-                verification_attempts INTEGER DEFAULT 0,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
-        
-        cursor.execute('''
-            INSERT OR REPLACE INTO payment_intents 
-            (transaction_id, user_id, plan_id, amount, status)
-            VALUES (?, ?, ?, ?, 'pending')
-        ''', (transaction_id, user_id, plan_id, amount))
-        
-        conn.commit()
-        conn.close()
+        with connection_pool.connection() as conn:
+            # payment_intents is created by the schema migrations at startup
+            conn.execute('''
+                INSERT OR REPLACE INTO payment_intents 
+                (transaction_id, user_id, plan_id, amount, status)
+                VALUES (?, ?, ?, ?, 'pending')
+            ''', (transaction_id, user_id, plan_id, Money.from_rupees(amount)))
     
     def start_payment_verification(self, transaction_id, user_id, plan_id, amount):
         """Start automatic payment verification"""
         Logger.info(f"Starting payment verification: {transaction_id}")
         
-        def check_payment(dt):
-            success = self.verify_payment_automated(transaction_id, user_id, plan_id, amount)
-            if success:
-                return False  # Stop checking
-            return True  # Continue checking
-        
-        # Check every 10 seconds for 5 minutes
-        Clock.schedule_interval(check_payment, 10)
-        
-        # Auto-stop after 5 minutes
-        Clock.schedule_once(lambda dt: self.cleanup_pending_payment(transaction_id), self.payment_timeout)
+        # One shared dispatcher checks every pending payment together
+        self.verifier.track(transaction_id, user_id, plan_id, amount, self.payment_timeout)
+    
+    def notify_payment_verified(self, transaction_id):
+        """Called when an admin marks a payment verified, to activate it right away"""
+        self.verifier.check_soon(transaction_id)
     
     def verify_payment_automated(self, transaction_id, user_id, plan_id, amount):
         """Automatically verify payment and activate investment"""
         try:
-            conn = sqlite3.connect("investkar_data.db")
-            cursor = conn.cursor()
-            
-            # Check if payment is already processed
-            cursor.execute('SELECT status FROM payment_intents WHERE transaction_id = ?', (transaction_id,))
-            result = cursor.fetchone()
-            
-            if result and result[0] == 'completed':
-                conn.close()
-                return True
-            
-            # In REAL system, you would:
-            # 1. Check your bank statement via API
-            # 2. Verify UPI transaction via bank webhook
-            # 3. Use payment gateway callbacks
-            
-            # Since we can't automatically detect UPI payments, we'll simulate
-            # For now, we'll use a manual trigger that YOU control
-            
-            # Check if admin has verified this payment
-            cursor.execute('''
-                SELECT id FROM payment_intents 
-                WHERE transaction_id = ? AND status = 'verified'
-            ''', (transaction_id,))
-            
-            verified_result = cursor.fetchone()
-            
-            if verified_result:
-                # PAYMENT VERIFIED - ACTIVATE INVESTMENT
-                self.activate_investment(user_id, plan_id, amount, transaction_id)
+            with connection_pool.connection() as conn:
+                cursor = conn.cursor()
+                
+                # Check if payment is already processed
+                cursor.execute(PAYMENT_INTENT_STATUS, (transaction_id,))
+                result = cursor.fetchone()
                 
-                # Update payment status
+                if result and result[0] == 'completed':
+                    return True
+                
+                # In REAL system, you would:
+                # 1. Check your bank statement via API
+                # 2. Verify UPI transaction via bank webhook
+                # 3. Use payment gateway callbacks
+                
+                # Since we can't automatically detect UPI payments, we'll simulate
+                # For now, we'll use a manual trigger that YOU control
+                
+                # Check if admin has verified this payment
+                if result and result[0] == 'verified':
+                    # PAYMENT VERIFIED - ACTIVATE INVESTMENT
+                    self.complete_verified_payment(transaction_id, user_id, plan_id, amount)
+                    return True
+                
+                # Increment verification attempts
                 cursor.execute('''
                     UPDATE payment_intents 
-                    SET status = 'completed', verified_at = ?
+                    SET verification_attempts = verification_attempts + 1 
                     WHERE transaction_id = ?
-                ''', (datetime.now().isoformat(), transaction_id))
-                
-                conn.commit()
-                conn.close()
+                ''', (transaction_id,))
                 
-                Logger.info(f"Payment verified and investment activated: {transaction_id}")
-                return True
-            
-            # Increment verification attempts
-            cursor.execute('''
-                UPDATE payment_intents 
-                SET verification_attempts = verification_attempts + 1 
-                WHERE transaction_id = ?
-            ''', (transaction_id,))
-            
-            conn.commit()
-            conn.close()
-            return False
+                return False
             
         except Exception as e:
             Logger.error(f"Payment verification error: {str(e)}")
             return False
     
-    def activate_investment(self, user_id, plan_id, amount, transaction_id):
-        """Activate investment and add first day return"""
-        try:
-            conn = sqlite3.connect("investkar_data.db")
-            cursor = conn.cursor()
+    def complete_verified_payment(self, transaction_id, user_id, plan_id, amount):
+        """Mark an admin-verified payment completed and activate its investment.
+
+        Both happen in one transaction, and only the call that moves the
+        intent from 'verified' to 'completed' activates, so a payment is
+        never activated twice or completed without its investment. Returns
+        False if the payment was not (or no longer) waiting to be completed.
+        """
+        with connection_pool.connection() as conn:
+            claimed = conn.execute('''
+                UPDATE payment_intents 
+                SET status = 'completed', verified_at = ?
+                WHERE transaction_id = ? AND status = 'verified'
+            ''', (datetime.now().isoformat(), transaction_id)).rowcount
+            if not claimed:
+                Logger.info(f"Payment {transaction_id} is not awaiting activation")
+                return False
             
-            # Calculate returns based on plan
-            plan_returns = {1: 0.04, 2: 0.04, 3: 0.05}  # 4%, 4%, 5%
-            daily_return_rate = plan_returns.get(plan_id, 0.04)
-            daily_return = amount * daily_return_rate
+            # Runs inside this transaction, so a failure also undoes the status change
+            amount, daily_return = self.activate_investment(user_id, plan_id, amount, transaction_id)
+        
+        Logger.info(f"Payment verified and investment activated: {transaction_id}")
+        
+        # Show success notification
+        self.show_success_notification(user_id, amount, daily_return)
+        return True
+    
+    def activate_investment(self, user_id, plan_id, amount, transaction_id):
+        """Activate investment and add first day return; returns (amount, daily_return).
+
+        Raises ValueError for a plan the catalog doesn't know; database
+        errors propagate too, so the caller never marks a payment completed
+        without its investment.
+        """
+        with connection_pool.connection() as conn:
+            # Returns come from the shared plan catalog, same as manual investments
+            plan = plan_catalog.get(plan_id, conn)
+            if not plan:
+                raise ValueError(f"Unknown plan {plan_id} for {transaction_id}")
+            terms = plan.quote(amount)
+            amount, daily_return = terms.amount, terms.daily_return
+            total_days = plan.days
             
-            plan_days = {1: 80, 2: 110, 3: 150}
-            total_days = plan_days.get(plan_id, 80)
+            cursor = conn.cursor()
             
             # Add investment
             cursor.execute('''
@@ -184,10 +174,8 @@ class AutomatedPayment:
             ''', (user_id, plan_id, amount, daily_return, total_days, total_days))
             
             # Add first day return to wallet IMMEDIATELY
-            cursor.execute('''
-                UPDATE users SET wallet_balance = wallet_balance + ? 
-                WHERE id = ?
-            ''', (daily_return, user_id))
+            ledger.transfer(cursor, user_id, daily_return, RETURNS, 'return',
+                            'First day return - Auto', transaction_id)
             
             # Record transactions
             cursor.execute('''
@@ -199,17 +187,9 @@ class AutomatedPayment:
                 INSERT INTO transactions (user_id, type, amount, description, status)
                 VALUES (?, 'return', ?, 'First day return - Auto', 'completed')
             ''', (user_id, daily_return))
-            
-            conn.commit()
-            conn.close()
-            
-            Logger.info(f"Investment activated: User {user_id}, Plan {plan_id}, Return ₹{daily_return}")
-            
-            # Show success notification
-            self.show_success_notification(user_id, amount, daily_return)
-            
-        except Exception as e:
-            Logger.error(f"Investment activation error: {str(e)}")
+        
+        Logger.info(f"Investment activated: User {user_id}, Plan {plan_id}, Return ₹{daily_return}")
+        return amount, daily_return
     
     def show_success_notification(self, user_id, amount, daily_return):
         """Show payment success notification"""
@@ -229,19 +209,117 @@ Your investment is now active!
     
     def cleanup_pending_payment(self, transaction_id):
         """Clean up pending payments after timeout"""
-        conn = sqlite3.connect("investkar_data.db")
-        cursor = conn.cursor()
+        with connection_pool.connection() as conn:
+            conn.execute('''
+                UPDATE payment_intents 
+                SET status = 'timeout' 
+                WHERE transaction_id = ? AND status = 'pending'
+            ''', (transaction_id,))
         
-        cursor.execute('''
-            UPDATE payment_intents 
-            SET status = 'timeout' 
-            WHERE transaction_id = ? AND status = 'pending'
-        ''', (transaction_id,))
+        Logger.info(f"Payment timeout: {transaction_id}")
+
+class PaymentVerificationDispatcher:
+    """Verifies all pending payment intents from a single Clock timer.
+
+    Pending payments are tracked in memory and checked together with one
+    batched query per tick, instead of one timer and connection per payment.
+    The timer only runs while something is pending.
+    """
+    
+    BATCH_SIZE = 500  # transaction ids per IN (...) query
+    
+    def __init__(self, payments, interval=10):
+        self.payments = payments
+        self.interval = interval
+        self.pending = {}  # transaction_id -> (user_id, plan_id, amount, deadline)
+        self._event = None
+    
+    def track(self, transaction_id, user_id, plan_id, amount, timeout):
+        """Add a payment to the pending set and make sure the timer is running"""
+        self.pending[transaction_id] = (user_id, plan_id, amount, time.time() + timeout)
+        if self._event is None:
+            self._event = Clock.schedule_interval(self.check_pending, self.interval)
+    
+    def check_soon(self, transaction_id=None):
+        """Run a check on the next frame instead of waiting for the next tick"""
+        if transaction_id is None or transaction_id in self.pending:
+            Clock.schedule_once(self.check_pending)
+    
+    def stop(self):
+        """Cancel the timer; pending payments are kept until the next track()"""
+        if self._event is not None:
+            self._event.cancel()
+            self._event = None
+    
+    def check_pending(self, dt=None):
+        """Check every pending payment in one pass"""
+        if not self.pending:
+            self.stop()
+            return False
         
-        conn.commit()
-        conn.close()
+        now = time.time()
+        ids = list(self.pending)
+        try:
+            statuses = {}
+            with connection_pool.connection() as conn:
+                for i in range(0, len(ids), self.BATCH_SIZE):
+                    chunk = ids[i:i + self.BATCH_SIZE]
+                    placeholders = ','.join('?' * len(chunk))
+                    statuses.update(conn.execute(
+                        f'SELECT transaction_id, status FROM payment_intents WHERE transaction_id IN ({placeholders})',
+                        chunk
+                    ).fetchall())
+            
+            waiting, expired = [], []
+            for transaction_id in ids:
+                user_id, plan_id, amount, deadline = self.pending[transaction_id]
+                status = statuses.get(transaction_id)
+                
+                if status == 'verified':
+                    try:
+                        self.payments.complete_verified_payment(transaction_id, user_id, plan_id, amount)
+                    except Exception as e:
+                        # Rolled back and still 'verified'; try again next tick until the deadline
+                        Logger.error(f"Payment activation failed for {transaction_id}: {e}")
+                        if now >= deadline:
+                            del self.pending[transaction_id]
+                        continue
+                    del self.pending[transaction_id]
+                elif status != 'pending':
+                    # Completed, timed out or removed elsewhere - nothing left to do
+                    del self.pending[transaction_id]
+                elif now >= deadline:
+                    expired.append(transaction_id)
+                    del self.pending[transaction_id]
+                else:
+                    waiting.append(transaction_id)
+            
+            with connection_pool.connection() as conn:
+                for i in range(0, len(waiting), self.BATCH_SIZE):
+                    chunk = waiting[i:i + self.BATCH_SIZE]
+                    conn.execute(f'''
+                        UPDATE payment_intents 
+                        SET verification_attempts = verification_attempts + 1 
+                        WHERE transaction_id IN ({','.join('?' * len(chunk))})
+                    ''', chunk)
+                for i in range(0, len(expired), self.BATCH_SIZE):
+                    chunk = expired[i:i + self.BATCH_SIZE]
+                    conn.execute(f'''
+                        UPDATE payment_intents 
+                        SET status = 'timeout' 
+                        WHERE transaction_id IN ({','.join('?' * len(chunk))}) AND status = 'pending'
+                    ''', chunk)
+            
+            for transaction_id in expired:
+                Logger.info(f"Payment timeout: {transaction_id}")
         
-        Logger.info(f"Payment timeout: {transaction_id}")
+        except Exception as e:
+            Logger.error(f"Payment verification error: {str(e)}")
+        
+        if not self.pending:
+            self.stop()
+            return False
+        return True
 
 # Global instance
 auto_payment = AutomatedPayment()
\ No newline at end of file
@@ -0,0 +1,318 @@
+# benchmarks.py
+"""Performance benchmarks for the Invest Kar data layer.
+
+Usage: python benchmarks.py [benchmark ...]
+Runs every benchmark when no name is given.
+"""
+import os
+import sys
+import random
+import secrets
+import sqlite3
+import tempfile
+import threading
+import time
+import statistics
+from datetime import date, datetime, timedelta, timezone
+
+from database import Database
+from plans import plan_catalog
+from rate_limiter import rate_limiter, MemoryBackend
+
+
+def seed_database(db, users=2000, investments=20000):
+    """Fill a fresh database with synthetic users and active investments."""
+    cursor = db.conn.cursor()
+    cursor.executemany(
+        "INSERT INTO users (phone, security_code_hash, salt, referral_code) VALUES (?, 'x', 'x', ?)",
+        ((f"9{i:09d}", f"R{i:06d}") for i in range(users))
+    )
+    # Terms from the seeded plan catalog, as a real investment would get them
+    offers = [(plan, option) for plan in plan_catalog.all(db.conn) for option in plan.options]
+    # Made about a day before its first accrual, plus one day per accrual since,
+    # at any time of day; created_at is UTC like the CURRENT_TIMESTAMP default
+    cursor.executemany('''
+        INSERT INTO investments (user_id, plan_id, amount, daily_return, total_days, days_remaining, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, datetime('now', printf('-%d days', ? - ? + 1), printf('%+d seconds', ?)))
+    ''', (
+        (random.randint(1, users), plan.id, option.amount, option.daily_return, plan.days, remaining,
+         plan.days, remaining, random.randint(-43200, 43200))
+        for plan, option, remaining in (
+            (plan, option, random.randint(1, plan.days)) for plan, option in (random.choice(offers) for _ in range(investments))
+        )
+    ))
+    db.conn.commit()
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def bench_reader_latency(users=2000, investments=50000):
+    """Admin-style reader latency while calculate_daily_returns is writing."""
+    print("Reader latency during calculate_daily_returns")
+    for profile in ('default', 'tuned'):
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, 'bench.db')
+            db = Database(db_path)
+            if profile == 'default':
+                # Undo the connection profile to get SQLite's stock behaviour
+                db.conn.execute('PRAGMA journal_mode = DELETE')
+                db.conn.execute('PRAGMA synchronous = FULL')
+            seed_database(db, users, investments)
+
+            latencies = []
+            done = threading.Event()
+
+            def reader():
+                if profile == 'default':
+                    conn = sqlite3.connect(db_path, timeout=30)
+                else:
+                    from db_connection import connect
+                    conn = connect(db_path)
+                while not done.is_set():
+                    started = time.perf_counter()
+                    conn.execute('SELECT COUNT(*), SUM(wallet_balance) FROM users').fetchone()
+                    latencies.append(time.perf_counter() - started)
+                conn.close()
+
+            thread = threading.Thread(target=reader)
+            thread.start()
+            time.sleep(0.05)  # let the reader warm up before the write starts
+            started = time.perf_counter()
+            db.calculate_daily_returns()
+            write_time = time.perf_counter() - started
+            done.set()
+            thread.join()
+            db.conn.close()
+
+        ms = [l * 1000 for l in latencies]
+        print(f"  {profile:8s} accrual {write_time:6.3f}s | reads {len(ms):6d} | "
+              f"p50 {statistics.median(ms):7.2f}ms  p95 {_percentile(ms, 95):7.2f}ms  max {max(ms):7.2f}ms")
+
+
+def bench_catch_up(users=2000, investments=50000, missed=7):
+    """Catch-up accrual after missed days, checked against a per-investment count."""
+    print(f"Catch-up accrual ({investments:,} investments, last run {missed} days ago)")
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, 'bench.db'))
+        seed_database(db, users, investments)
+        conn = db.conn
+        today = date.today()
+        conn.execute('INSERT INTO daily_run_log (run_date) VALUES (?)', ((today - timedelta(days=missed)).isoformat(),))
+        conn.commit()
+
+        # Owed days: what is left, capped by the missed days and by the local
+        # days since it was made, worked out here rather than in SQL
+        def days_held(created_at):
+            made = datetime.strptime(created_at, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+            return (today - made.astimezone().date()).days
+
+        expected = {
+            investment_id: min(remaining, missed, days_held(created_at))
+            for investment_id, remaining, created_at in conn.execute(
+                'SELECT id, days_remaining, created_at FROM investments'
+            )
+        }
+        capped = sum(1 for owed in expected.values() if owed < missed)
+        before = dict(conn.execute('SELECT id, days_remaining FROM investments'))
+
+        started = time.perf_counter()
+        credited = db.calculate_daily_returns()
+        elapsed = time.perf_counter() - started
+
+        wrong = sum(
+            1 for investment_id, remaining in conn.execute('SELECT id, days_remaining FROM investments')
+            if before[investment_id] - remaining != expected[investment_id]
+        )
+        assert credited == sum(expected.values())
+        assert db.reconcile_ledger(full=True)['ok']
+        print(f"  {credited:,} returns in {elapsed:6.3f}s | {capped:,} investments capped by age or term | "
+              f"wrong day counts: {wrong}")
+        conn.close()
+
+
+def bench_login_throughput(logins=200):
+    """Logins per second as the hashing pool grows, in process and thread mode."""
+    from concurrent.futures import ThreadPoolExecutor
+    from security import Security
+    from password_hasher import PasswordHasher, pbkdf2, KDF_ITERATIONS
+
+    print(f"Login throughput ({KDF_ITERATIONS:,} PBKDF2 iterations, {logins} logins)")
+    salt = secrets.token_hex(16)
+    code_hash = pbkdf2('123456', salt, KDF_ITERATIONS)
+    counts = sorted({1, 2, 4, os.cpu_count() or 1})
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, 'bench.db'))
+        phones = [f"9{i:09d}" for i in range(logins)]
+        db.conn.executemany(
+            "INSERT INTO users (phone, phone_index, security_code_hash, salt, referral_code) VALUES (?, ?, ?, ?, ?)",
+            ((phone, Security.phone_index(phone), code_hash, salt, phone[-6:]) for phone in phones)
+        )
+        db.conn.commit()
+
+        for use_processes in (True, False):
+            for workers in counts:
+                db.hasher = PasswordHasher(workers=workers, use_processes=use_processes)
+                db.hasher.hash('warmup', salt, 1)  # start the workers outside the timing
+                # Enough concurrent callers to keep every hashing worker busy
+                with ThreadPoolExecutor(max_workers=workers * 2) as clients:
+                    started = time.perf_counter()
+                    results = list(clients.map(lambda phone: db.login_user(phone, '123456'), phones))
+                    elapsed = time.perf_counter() - started
+                metrics = db.hasher.metrics()
+                db.hasher.shutdown()
+                # Each phone may only try a few times per window; start every round fresh
+                rate_limiter.backend = MemoryBackend()
+
+                ok = sum(1 for success, _ in results if success)
+                print(f"  {metrics['mode']:7s} x{workers:<2d} {logins / elapsed:8.1f} logins/s | "
+                      f"hash avg {metrics['avg_ms']:7.1f}ms  max {metrics['max_ms']:7.1f}ms | {ok}/{logins} ok")
+        db.conn.close()
+
+
+def bench_encryption(values=20000):
+    """Field encryption: per-call key setup vs the shared cipher and batch APIs."""
+    import base64
+    import json
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    from encryption import Encryption, NONCE_SIZE
+
+    print(f"Encryption throughput ({values} bank-detail records)")
+    records = [
+        {'account_holder': f'User {i}', 'account_number': f'{random.randrange(10**11, 10**12)}', 'ifsc_code': 'SBIN0001234'}
+        for i in range(values)
+    ]
+    enc = Encryption()
+    key = os.urandom(32)
+    enc._cipher = AESGCM(key)
+
+    def per_call_setup(record):
+        # What a naive helper does: build the cipher for every value
+        nonce = os.urandom(NONCE_SIZE)
+        ciphertext = AESGCM(key).encrypt(nonce, json.dumps(record).encode('utf-8'), None)
+        return base64.urlsafe_b64encode(nonce + ciphertext).decode('ascii')
+
+    def timed(label, func):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        print(f"  {label:28s} {values / elapsed:10,.0f} values/s")
+        return result
+
+    timed('encrypt, setup per call', lambda: [per_call_setup(record) for record in records])
+    timed('encrypt, shared cipher', lambda: [enc.encrypt_json(record) for record in records])
+    timed('encrypt_json_batch', lambda: enc.encrypt_json_batch(records, parallel=False))
+    tokens = timed('encrypt_json_batch parallel', lambda: enc.encrypt_json_batch(records, parallel=True))
+    timed('decrypt, one at a time', lambda: [enc.decrypt_json(token) for token in tokens])
+    timed('decrypt_json_batch', lambda: enc.decrypt_json_batch(tokens, parallel=False))
+    decrypted = timed('decrypt_json_batch parallel', lambda: enc.decrypt_json_batch(tokens, parallel=True))
+    assert decrypted == records
+
+
+def bench_money(credits=500000, wallets=5000, rounds=5):
+    """Sums and wallet accrual over REAL rupees vs INTEGER paise: speed and exactness."""
+    from decimal import Decimal
+    from money import Money
+
+    print(f"Money aggregates ({credits:,} credits over {wallets:,} wallets)")
+    rng = random.Random(7)
+    # Daily returns as the plans produce them, e.g. 4% of ₹599 = ₹23.96
+    amounts = [
+        Money.from_rupees(rng.choice([599, 1099, 1799, 3050, 10000, 20000])).percent(rng.choice([4, 5]))
+        for _ in range(credits)
+    ]
+    rows = [(rng.randint(1, wallets), amount) for amount in amounts]
+    exact_total = sum(amounts).rupees
+
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE credits_real (user_id INTEGER, amount REAL)')
+    conn.execute('CREATE TABLE credits_paise (user_id INTEGER, amount INTEGER)')
+    conn.executemany('INSERT INTO credits_real VALUES (?, ?)', ((user_id, float(a.rupees)) for user_id, a in rows))
+    conn.executemany('INSERT INTO credits_paise VALUES (?, ?)', rows)
+
+    def best(sql):
+        times = []
+        for _ in range(rounds):
+            started = time.perf_counter()
+            result = conn.execute(sql).fetchall()
+            times.append(time.perf_counter() - started)
+        return min(times), result
+
+    for label, table, to_rupees in (('REAL rupees', 'credits_real', Decimal),
+                                    ('INTEGER paise', 'credits_paise', lambda paise: Money(paise).rupees)):
+        total_time, ((total,),) = best(f'SELECT SUM(amount) FROM {table}')
+        group_time, _ = best(f'SELECT user_id, SUM(amount) FROM {table} GROUP BY user_id')
+        error = abs(to_rupees(total) - exact_total)
+        print(f"  {label:14s} SUM {total_time * 1000:7.2f}ms | GROUP BY {group_time * 1000:7.2f}ms | "
+              f"total off by ₹{error:.2E}")
+
+    # Accrual: wallets grow one credit at a time, day after day
+    for label, column in (('REAL rupees', 'REAL'), ('INTEGER paise', 'INTEGER')):
+        conn.execute(f'CREATE TABLE wallets_{column} (id INTEGER PRIMARY KEY, balance {column} NOT NULL DEFAULT 0)')
+        conn.executemany(f'INSERT INTO wallets_{column} (id) VALUES (?)', ((i,) for i in range(1, wallets + 1)))
+        source = 'credits_real' if column == 'REAL' else 'credits_paise'
+        credited = conn.execute(f'SELECT amount, user_id FROM {source} ORDER BY rowid').fetchall()
+        started = time.perf_counter()
+        conn.executemany(f'UPDATE wallets_{column} SET balance = balance + ? WHERE id = ?', credited)
+        elapsed = time.perf_counter() - started
+
+        expected = {}
+        for user_id, amount in rows:
+            expected[user_id] = expected.get(user_id, Money()) + amount
+        to_rupees = Decimal if column == 'REAL' else (lambda paise: Money(paise).rupees)
+        off = [
+            abs(to_rupees(balance) - expected.get(wallet_id, Money()).rupees)
+            for wallet_id, balance in conn.execute(f'SELECT id, balance FROM wallets_{column}')
+        ]
+        wrong = sum(1 for error in off if error)
+        print(f"  {label:14s} accrual {elapsed * 1000:7.2f}ms | {wrong:,}/{wallets:,} wallets inexact, "
+              f"max error ₹{max(off):.2E}")
+    conn.close()
+
+
+def bench_projection(users=20000, investments=1000000, horizon=150):
+    """Liability projection over a large book of active investments."""
+    print(f"Liability projection ({investments:,} active investments, {horizon}-day horizon)")
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(os.path.join(tmp, 'bench.db'))
+        seed_database(db, users, investments)
+
+        timings = []
+        for _ in range(3):
+            started = time.perf_counter()
+            projection = db.project_liabilities(horizon)
+            timings.append(time.perf_counter() - started)
+
+        # Same figures the slow way: walk every investment day by day
+        rows = db.conn.execute(
+            "SELECT daily_return, days_remaining FROM investments WHERE status = 'active' AND days_remaining > 0"
+        ).fetchall()
+        started = time.perf_counter()
+        naive = [0] * horizon
+        for daily_return, days_remaining in rows:
+            for day in range(min(days_remaining, horizon)):
+                naive[day] += daily_return
+        naive_time = time.perf_counter() - started
+
+        print(f"  project_liabilities  best {min(timings):6.3f}s  worst {max(timings):6.3f}s | "
+              f"total ₹{projection['total']:,.2f}")
+        print(f"  per-day Python loop       {naive_time:6.3f}s (rows already fetched) | "
+              f"matches: {naive == projection['daily'].tolist()}")
+        db.conn.close()
+
+
+BENCHMARKS = {
+    'reader_latency': bench_reader_latency,
+    'catch_up': bench_catch_up,
+    'login_throughput': bench_login_throughput,
+    'encryption': bench_encryption,
+    'money': bench_money,
+    'projection': bench_projection,
+}
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or list(BENCHMARKS):
+        BENCHMARKS[name]()
@@ -5,7 +5,7 @@ package.domain = com.investkar.app
 source.dir = .
 source.include_exts = py,png,jpg,kv,atlas,txt,json
 version = 1.0
-requirements = python3,kivy,sqlite3,requests,openssl
+requirements = python3,kivy,sqlite3,requests,openssl,cryptography,numpy
 
 # Android specific
 android.permissions = INTERNET, ACCESS_NETWORK_STATE
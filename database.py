@@ -1,160 +1,182 @@
 import sqlite3
 import hashlib
 import secrets
-from datetime import datetime
+import time
+import threading
+from datetime import datetime, timedelta
 import json
+from contextlib import contextmanager
 from kivy.logger import Logger
-from security import rate_limit
+from security import rate_limit, Security
 from encryption import encryption
+from db_connection import connection_pool
+from sms_service import sms_service
+from password_hasher import password_hasher, KDF_ITERATIONS, HasherBusy
+from ledger import ledger, RETURNS, REFERRALS, PAYOUTS, ADJUSTMENTS
+from money import Money
+from plans import plan_catalog
+import queries
+import schema
+
+# (checkpoint name, table, plaintext column, ciphertext column, plaintext is JSON)
+ENCRYPTION_MIGRATIONS = [
+    ('users_phone', 'users', 'phone', 'phone_encrypted', False),
+    ('transactions_bank_details', 'transactions', 'bank_details', 'bank_details_encrypted', True),
+    ('withdrawals_bank_details', 'withdrawal_requests', 'bank_details', 'bank_details_encrypted', True),
+]
+
+ENCRYPTION_CHUNK_SIZE = 1000
+
+REFERRAL_BONUS = Money.from_rupees(50)
+MIN_WITHDRAWAL = Money.from_rupees(100)
+
+# Platform stats holding paise; the rest are counts
+MONEY_STATS = ('total_investment_amount', 'total_returns_paid', 'total_withdrawals', 'total_wallet_balance')
+
+
+def _with_money(rows, *columns):
+    """rows with the paise at the given column positions wrapped in Money"""
+    return [
+        tuple(Money(value) if i in columns and value is not None else value for i, value in enumerate(row))
+        for row in rows
+    ]
+
+
+def _legacy_json(value):
+    """Plaintext bank details were stored as JSON text; encrypt the parsed value"""
+    try:
+        return json.loads(value)
+    except (TypeError, ValueError):
+        return value
+
 
 class Database:
     def __init__(self, db_path):
         # Use the provided path to connect to the database
-        self.plans = {}
-        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.db_path = db_path
+        # Connections and transaction nesting are kept per thread, so work run
+        # on the task executor never interleaves with the UI thread's transactions
+        self._local = threading.local()
+        self.hasher = password_hasher
+        # Adds the ciphertext columns to databases that predate encryption; the
+        # plaintext is encrypted by migrate_encryption(), which the app runs in
+        # the background once it is up
         self.create_tables()
-        self.migrate_encryption()  # Encrypt existing data
+    
+    @property
+    def conn(self):
+        """This thread's connection to the database, from the shared pool."""
+        return connection_pool.get(self.db_path)
+    
+    @property
+    def _tx_depth(self):
+        """Nesting level of transaction() blocks on this thread."""
+        return getattr(self._local, 'tx_depth', 0)
+    
+    @_tx_depth.setter
+    def _tx_depth(self, depth):
+        self._local.tx_depth = depth
     
     def create_tables(self):
-        cursor = self.conn.cursor()
-        
-        # Users table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                phone TEXT UNIQUE NOT NULL,
-                security_code_hash TEXT NOT NULL,
-                phone_encrypted TEXT,
-                salt TEXT NOT NULL,
-                wallet_balance REAL DEFAULT 0,
-                referral_code TEXT UNIQUE,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Investments table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS investments (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                plan_id INTEGER,
-                amount REAL,
-                daily_return REAL,
-                total_days INTEGER,
-                days_remaining INTEGER,
-                total_profit REAL DEFAULT 0,
-                status TEXT DEFAULT 'active',
-                payment_method TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
-        
-        # Transactions table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS transactions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                type TEXT,  -- investment, withdrawal, return, referral, withdrawal_payment
-                amount REAL,
-                description TEXT,
-                status TEXT DEFAULT 'completed',
-                bank_details_encrypted TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
-        
-        # OTP storage table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS otp_store (
-                phone TEXT PRIMARY KEY,
-                otp TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Withdrawal requests table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS withdrawal_requests (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                amount REAL,
-                bank_details_encrypted TEXT,
-                status TEXT DEFAULT 'pending',  -- pending, paid, completed, cancelled
-                payment_transaction_id TEXT,
-                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
-        
-        # Log for daily return processing to prevent multiple runs
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS daily_run_log (
-                run_date TEXT PRIMARY KEY,
-                run_timestamp TEXT DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        self.conn.commit()
+        """Create or upgrade all tables; a no-op when the schema is current."""
+        schema.migrate(self.conn)
     
-    def migrate_encryption(self):
-        """Migrate existing data to encrypted format"""
-        cursor = self.conn.cursor()
-        try:
-            # Check if we need to migrate
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='users'")
-            if not cursor.fetchone():
-                return
+    def migrate_encryption(self, chunk_size=ENCRYPTION_CHUNK_SIZE):
+        """Encrypt plaintext left over from before encryption, resumably.
+        
+        Rows are handled in id order, chunk_size at a time. Each chunk and
+        its checkpoint commit together, so after a crash the next run picks
+        up at the first unfinished chunk. Safe to run on the task executor
+        while the app is in use. Returns the number of rows encrypted.
+        """
+        total = 0
+        for name, table, source, target, is_json in ENCRYPTION_MIGRATIONS:
+            columns = [col[1] for col in self.conn.execute(f"PRAGMA table_info({table})")]
+            if source not in columns:
+                continue  # Created after encryption; nothing in plaintext
             
-            # Check if encryption is already applied
-            cursor.execute("PRAGMA table_info(users)")
-            columns = [col[1] for col in cursor.fetchall()]
+            checkpoint = self.conn.execute(
+                'SELECT last_id, rows_done, completed FROM migration_checkpoints WHERE name = ?', (name,)
+            ).fetchone()
+            last_id, rows_done, completed = checkpoint or (0, 0, 0)
+            if completed:
+                continue
             
-            if 'phone_encrypted' not in columns:
-                # Add encrypted columns
-                cursor.execute('ALTER TABLE users ADD COLUMN phone_encrypted TEXT;')
-                cursor.execute('ALTER TABLE transactions ADD COLUMN bank_details_encrypted TEXT;')
-                cursor.execute('ALTER TABLE withdrawal_requests ADD COLUMN bank_details_encrypted TEXT;')
-                
-                # Migrate existing phone numbers
-                cursor.execute("SELECT id, phone FROM users")
-                users = cursor.fetchall()
-                for user_id, phone in users:
-                    encrypted_phone = encryption.encrypt_string(phone)
-                    cursor.execute(
-                        "UPDATE users SET phone_encrypted = ? WHERE id = ?",
-                        (encrypted_phone, user_id)
-                    )
-                
-                # Migrate bank details in transactions
-                cursor.execute("SELECT id, bank_details FROM transactions WHERE bank_details IS NOT NULL")
-                transactions = cursor.fetchall()
-                for txn_id, bank_details in transactions:
-                    if bank_details:
-                        encrypted_bank = encryption.encrypt_json(bank_details)
-                        cursor.execute(
-                            "UPDATE transactions SET bank_details_encrypted = ? WHERE id = ?",
-                            (encrypted_bank, txn_id)
-                        )
-                
-                self.conn.commit()
-                Logger.info("Database: Encryption migration completed")
-                
-        except Exception as e:
-            Logger.error(f"Database: Migration failed - {e}")
-            self.conn.rollback()
+            started = time.perf_counter()
+            done_before = rows_done
+            try:
+                while True:
+                    rows = self.conn.execute(f'''
+                        SELECT id, {source} FROM {table}
+                        WHERE id > ? AND {source} IS NOT NULL AND {source} != '' AND {target} IS NULL
+                        ORDER BY id LIMIT ?
+                    ''', (last_id, chunk_size)).fetchall()
+                    
+                    with self.transaction() as cursor:
+                        if rows:
+                            values = [value for _, value in rows]
+                            if is_json:
+                                ciphertexts = encryption.encrypt_json_batch(map(_legacy_json, values))
+                            else:
+                                ciphertexts = encryption.encrypt_strings(values)
+                            cursor.executemany(
+                                f"UPDATE {table} SET {target} = ? WHERE id = ?",
+                                zip(ciphertexts, (row_id for row_id, _ in rows))
+                            )
+                            last_id = rows[-1][0]
+                            rows_done += len(rows)
+                        cursor.execute('''
+                            INSERT OR REPLACE INTO migration_checkpoints (name, last_id, rows_done, completed, updated_at)
+                            VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+                        ''', (name, last_id, rows_done, int(len(rows) < chunk_size)))
+                    
+                    if len(rows) < chunk_size:
+                        break
+            except Exception as e:
+                Logger.error(f"Database: Encryption migration '{name}' stopped at id {last_id} - {e}")
+                raise
+            
+            elapsed = time.perf_counter() - started
+            total += rows_done - done_before
+            Logger.info(f"Database: Encryption migration '{name}' completed - {rows_done - done_before} rows "
+                        f"in {elapsed:.2f}s")
+        return total
     
-    def initialize_plans(self, plans_data):
-        self.plans = plans_data
+    @contextmanager
+    def transaction(self):
+        """Group several operations into a single unit of work.
+
+        Methods called inside the block defer their commits to the outermost
+        transaction(), which commits once on success or rolls everything back
+        if an exception escapes. Blocks can be nested freely.
+
+        The outermost block begins the transaction up front, taking the write
+        lock, so connection_pool.connection() blocks run inside it (as
+        savepoints) see it and leave the commit to it.
+        """
+        if self._tx_depth == 0 and not self.conn.in_transaction:
+            self.conn.execute('BEGIN IMMEDIATE')
+        self._tx_depth += 1
+        try:
+            yield self.conn.cursor()
+        except BaseException:
+            self._tx_depth -= 1
+            if self._tx_depth == 0:
+                self.conn.rollback()
+            raise
+        else:
+            self._tx_depth -= 1
+            if self._tx_depth == 0:
+                self.conn.commit()
 
-    def hash_security_code(self, code, salt):
-        """Hashes the security code with a salt using PBKDF2."""
-        # The salt should be bytes. If it's a hex string from the DB, convert it.
-        salt_bytes = bytes.fromhex(salt) if isinstance(salt, str) else salt
-        # Use PBKDF2 for key derivation, which is more secure than simple hashing.
-        dk = hashlib.pbkdf2_hmac('sha256', code.encode('utf-8'), salt_bytes, 100000)
-        return dk.hex()
+    def _commit(self):
+        """Commit now, unless an enclosing transaction() will commit for us."""
+        if self._tx_depth == 0:
+            self.conn.commit()
+
+    def hash_security_code(self, code, salt, iterations=KDF_ITERATIONS):
+        """Hashes the security code with a salt using PBKDF2, on the hashing pool."""
+        return self.hasher.hash(code, salt, iterations)
     
     def store_otp(self, phone, otp):
         cursor = self.conn.cursor()
@@ -162,7 +184,7 @@ class Database:
             INSERT OR REPLACE INTO otp_store (phone, otp, created_at)
             VALUES (?, ?, ?)
         ''', (phone, otp, datetime.now().isoformat()))
-        self.conn.commit()
+        self._commit()
     
     @rate_limit(max_attempts=5, timeout=600) # 5 attempts per 10 minutes
     def verify_otp(self, phone, otp):
@@ -183,34 +205,38 @@ class Database:
     def register_user(self, phone, security_code, referral_code=None):
         cursor = self.conn.cursor()
         
-        # ✅ Encrypt phone number before storing
-        encrypted_phone = encryption.encrypt_string(phone)
-        
         # Check if user exists
-        cursor.execute('SELECT id FROM users WHERE phone_encrypted = ?', (encrypted_phone,))
-        if cursor.fetchone():
+        phone_index = Security.phone_index(phone)
+        cursor.execute(queries.PHONE_REGISTERED, (phone_index,))
+        if cursor.fetchone() or self._find_unindexed_user(phone):
             return False, "Phone already registered"
         
+        # ✅ Encrypt phone number before storing
+        encrypted_phone = encryption.encrypt_string(phone)
+        
         # Generate a new salt for the user
         salt = secrets.token_hex(16)
-        security_hash = self.hash_security_code(security_code, salt)
+        try:
+            security_hash = self.hash_security_code(security_code, salt)
+        except HasherBusy:
+            return False, "Server busy, please try again in a moment"
         ref_code = phone[-6:]  # Use original phone for referral code
         
         try:
-            cursor.execute('''
-                INSERT INTO users (phone, phone_encrypted, security_code_hash, salt, referral_code)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (phone, encrypted_phone, security_hash, salt, ref_code))  # Keep plain phone for SMS
-            
-            # Handle referral
-            if referral_code:
-                referrer = self.get_user_by_referral(referral_code)
-                if referrer:
-                    # Give ₹50 referral bonus
-                    self.update_wallet(referrer[0], 50)
-                    self.add_transaction(referrer[0], 'referral', 50, f'Referral bonus from {phone}')
+            with self.transaction() as cursor:
+                cursor.execute('''
+                    INSERT INTO users (phone, phone_encrypted, phone_index, security_code_hash, salt, kdf_iterations, referral_code)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', (phone, encrypted_phone, phone_index, security_hash, salt, KDF_ITERATIONS, ref_code))  # Keep plain phone for SMS
+                
+                # Handle referral
+                if referral_code:
+                    referrer = self.get_user_by_referral(referral_code)
+                    if referrer:
+                        # Give ₹50 referral bonus
+                        self.update_wallet(referrer[0], REFERRAL_BONUS, REFERRALS, 'referral', f'Referral bonus from {phone}')
+                        self.add_transaction(referrer[0], 'referral', REFERRAL_BONUS, f'Referral bonus from {phone}')
             
-            self.conn.commit()
             return True, "Registration successful"
         except Exception as e:
             return False, str(e)
@@ -218,80 +244,126 @@ class Database:
     @rate_limit(max_attempts=10, timeout=1800) # 10 attempts per 30 minutes
     def login_user(self, phone, security_code):
         cursor = self.conn.cursor()
-        # --- SECURITY FIX: Always use encrypted phone for lookup ---
-        encrypted_phone = encryption.encrypt_string(phone)
-        cursor.execute('SELECT id, security_code_hash, salt FROM users WHERE phone_encrypted = ?', (encrypted_phone,))
-        result = cursor.fetchone()
+        # Look up by blind index; the stored ciphertext is never compared or decrypted
+        cursor.execute(queries.LOGIN_LOOKUP, (Security.phone_index(phone),))
+        result = cursor.fetchone() or self._find_unindexed_user(phone)
         
         if not result:
             return False, "User not found"
         
-        user_id, stored_hash, salt = result
-        if self.hash_security_code(security_code, salt) == stored_hash:
-            return True, user_id
-        else:
-            return False, "Invalid security code"
+        user_id, stored_hash, salt, iterations = result
+        try:
+            if not self.hasher.verify(security_code, salt, stored_hash, iterations):
+                return False, "Invalid security code"
+            
+            if self.hasher.needs_rehash(iterations):
+                # The code is known to be right, so upgrade the hash to the current cost
+                salt = secrets.token_hex(16)
+                cursor.execute(
+                    'UPDATE users SET security_code_hash = ?, salt = ?, kdf_iterations = ? WHERE id = ?',
+                    (self.hash_security_code(security_code, salt), salt, KDF_ITERATIONS, user_id)
+                )
+                self._commit()
+                Logger.info(f"Database: Re-hashed security code for user {user_id} ({iterations} -> {KDF_ITERATIONS} iterations)")
+        except HasherBusy:
+            return False, "Server busy, please try again in a moment"
+        
+        return True, user_id
+    
+    def _find_unindexed_user(self, phone):
+        """Find a user the phone index backfill hasn't reached yet, and index them"""
+        row = self.conn.execute(queries.LOGIN_LOOKUP_UNINDEXED, (phone,)).fetchone()
+        if row:
+            self.conn.execute('UPDATE users SET phone_index = ? WHERE id = ?', (Security.phone_index(phone), row[0]))
+            self._commit()
+        return row
+    
+    def backfill_phone_index(self, batch_size=1000):
+        """Fill phone_index for users created before it existed, one committed batch at a time"""
+        started = time.perf_counter()
+        filled = 0
+        last_id = 0
+        try:
+            while True:
+                rows = self.conn.execute(queries.PHONE_INDEX_BACKLOG, (last_id, batch_size)).fetchall()
+                if not rows:
+                    break
+                with self.transaction() as cursor:
+                    cursor.executemany(
+                        'UPDATE users SET phone_index = ? WHERE id = ?',
+                        [(Security.phone_index(phone), user_id) for user_id, phone in rows]
+                    )
+                filled += len(rows)
+                last_id = rows[-1][0]
+        except Exception as e:
+            Logger.error(f"Database: Phone index backfill stopped after {filled} users - {e}")
+            raise
+        
+        if filled:
+            Logger.info(f"Database: Indexed {filled} phones in {time.perf_counter() - started:.2f}s")
+        return filled
     
     def get_user(self, user_id):
         cursor = self.conn.cursor()
-        cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
-        user = cursor.fetchone()
-        
-        if user:
-            # Return user with decrypted phone
-            decrypted_phone = encryption.decrypt_string(user[3]) if user[3] else user[1]
-            return (user[0], decrypted_phone, user[2], user[3], user[4], user[5], user[6])
-        return None
+        # The plain phone is kept for SMS, so no decryption is needed here
+        cursor.execute('''
+            SELECT id, phone, security_code_hash, phone_encrypted, salt, wallet_balance, referral_code
+            FROM users WHERE id = ?
+        ''', (user_id,))
+        row = cursor.fetchone()
+        return _with_money([row], 5)[0] if row else None
     
     def get_user_by_referral(self, referral_code):
         cursor = self.conn.cursor()
         cursor.execute('SELECT id FROM users WHERE referral_code = ?', (referral_code,))
         return cursor.fetchone()
     
-    def update_wallet(self, user_id, amount):
-        cursor = self.conn.cursor()
-        cursor.execute('UPDATE users SET wallet_balance = wallet_balance + ? WHERE id = ?', (amount, user_id))
-        self.conn.commit()
+    def update_wallet(self, user_id, amount, counter=ADJUSTMENTS, kind='adjustment',
+                      description='Wallet adjustment', reference=None):
+        """Move amount into a wallet (out of it if negative) as a ledger entry against counter.
+        
+        users.wallet_balance follows from the posting; it is never updated directly.
+        """
+        amount = Money.from_rupees(amount)
+        ledger.transfer(self.conn.cursor(), user_id, amount, counter, kind, description, reference)
+        self._commit()
     
     def get_wallet_balance(self, user_id):
         cursor = self.conn.cursor()
         cursor.execute('SELECT wallet_balance FROM users WHERE id = ?', (user_id,))
         result = cursor.fetchone()
-        return result[0] if result else 0
+        return Money(result[0] if result else 0)
     
     def add_investment(self, user_id, plan_id, amount, payment_method):
-        plan = self.plans.get(plan_id)
+        plan = plan_catalog.get(plan_id, self.conn)
         if not plan:
             return False
         
-        daily_return = amount * (plan['return_rate'] / 100.0)
+        terms = plan.quote(amount)
+        amount, daily_return = terms.amount, terms.daily_return
         
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            INSERT INTO investments (user_id, plan_id, amount, daily_return, total_days, days_remaining, payment_method)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (user_id, plan_id, amount, daily_return, plan['days'], plan['days'], payment_method))
-        
-        self.add_transaction(user_id, 'investment', amount, f'Invested in Plan {plan_id}')
-        
-        # Add first day return immediately
-        self.update_wallet(user_id, daily_return)
-        self.add_transaction(user_id, 'return', daily_return, f'First day return from Plan {plan_id}')
+        with self.transaction() as cursor:
+            cursor.execute('''
+                INSERT INTO investments (user_id, plan_id, amount, daily_return, total_days, days_remaining, payment_method)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (user_id, plan_id, amount, daily_return, plan.days, plan.days, payment_method))
+            
+            self.add_transaction(user_id, 'investment', amount, f'Invested in Plan {plan_id}')
+            
+            # Add first day return immediately
+            self.update_wallet(user_id, daily_return, RETURNS, 'return', f'First day return from Plan {plan_id}')
+            self.add_transaction(user_id, 'return', daily_return, f'First day return from Plan {plan_id}')
         
-        self.conn.commit()
         return True
     
     def get_active_investments(self, user_id):
         cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT * FROM investments 
-            WHERE user_id = ? AND status = 'active' 
-            ORDER BY created_at DESC
-        ''', (user_id,))
-        return cursor.fetchall()
+        cursor.execute(queries.ACTIVE_INVESTMENTS, (user_id,))
+        return _with_money(cursor.fetchall(), 3, 4, 7)
     
     def add_transaction(self, user_id, type, amount, description, bank_details=None):
         cursor = self.conn.cursor()
+        amount = Money.from_rupees(amount)
         
         # ✅ Encrypt bank details
         encrypted_bank = encryption.encrypt_json(bank_details) if bank_details else None
@@ -301,39 +373,29 @@ class Database:
             VALUES (?, ?, ?, ?, ?)
         ''', (user_id, type, amount, description, encrypted_bank))
         
-        self.conn.commit()
+        self._commit()
     
     def get_transactions(self, user_id, limit=20):
         cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT id, user_id, type, amount, description, status, created_at, 
-                   bank_details_encrypted
-            FROM transactions 
-            WHERE user_id = ? 
-            ORDER BY created_at DESC 
-            LIMIT ?
-        ''', (user_id, limit))
-        
-        transactions = []
-        for txn in cursor.fetchall():
-            txn_id, user_id, type, amount, desc, status, created_at, bank_encrypted = txn
-            
-            # Use encrypted bank details if available
-            bank_details = None
-            if bank_encrypted:
-                bank_details = encryption.decrypt_json(bank_encrypted)
-            
-            transactions.append((txn_id, user_id, type, amount, desc, status, bank_details, created_at))
-        return transactions
+        cursor.execute(queries.USER_TRANSACTIONS, (user_id, limit))
+        
+        rows = cursor.fetchall()
+        # Decrypt the whole page in one batch with a shared cipher
+        bank_details = encryption.decrypt_json_batch(row[7] for row in rows)
+        return [
+            (txn_id, user_id, type, Money(amount), desc, status, bank, created_at)
+            for (txn_id, user_id, type, amount, desc, status, created_at, _), bank in zip(rows, bank_details)
+        ]
     
     def create_withdrawal_request(self, user_id, amount, bank_details):
         """Create withdrawal request with encrypted bank details"""
         cursor = self.conn.cursor()
         
         current_balance = self.get_wallet_balance(user_id)
+        amount = Money.from_rupees(amount)
         
-        if amount < 100:
-            return False, "Minimum withdrawal is ₹100"
+        if amount < MIN_WITHDRAWAL:
+            return False, f"Minimum withdrawal is ₹{MIN_WITHDRAWAL:.0f}"
         
         if amount > current_balance:
             return False, "Insufficient balance"
@@ -346,19 +408,16 @@ class Database:
             VALUES (?, ?, ?, 'pending')
         ''', (user_id, amount, encrypted_bank))
         
-        self.conn.commit()
+        self._commit()
         return True, "Withdrawal request created"
     
     def complete_withdrawal_after_payment(self, user_id, amount, transaction_id):
         """Complete withdrawal after user makes payment"""
         cursor = self.conn.cursor()
+        amount = Money.from_rupees(amount)
         
         # Find pending withdrawal
-        cursor.execute('''
-            SELECT id FROM withdrawal_requests 
-            WHERE user_id = ? AND amount = ? AND status = 'pending'
-            ORDER BY created_at DESC LIMIT 1
-        ''', (user_id, amount))
+        cursor.execute(queries.PENDING_WITHDRAWAL_FOR_AMOUNT, (user_id, amount))
         
         result = cursor.fetchone()
         if not result:
@@ -366,42 +425,40 @@ class Database:
         
         withdrawal_id = result[0]
         
-        # Deduct from wallet
-        self.update_wallet(user_id, -amount)
-        
-        # Update withdrawal status
-        cursor.execute('''
-            UPDATE withdrawal_requests 
-            SET status = 'completed', payment_transaction_id = ?
-            WHERE id = ?
-        ''', (transaction_id, withdrawal_id))
-        
-        # Add transaction record
-        self.add_transaction(user_id, 'withdrawal', amount, 'Withdrawal completed', {})
+        with self.transaction() as cursor:
+            # Deduct from wallet
+            self.update_wallet(user_id, -amount, PAYOUTS, 'withdrawal', 'Withdrawal completed',
+                               reference=f'withdrawal:{withdrawal_id}')
+            
+            # Update withdrawal status
+            cursor.execute('''
+                UPDATE withdrawal_requests 
+                SET status = 'completed', payment_transaction_id = ?
+                WHERE id = ?
+            ''', (transaction_id, withdrawal_id))
+            
+            # Add transaction record
+            self.add_transaction(user_id, 'withdrawal', amount, 'Withdrawal completed', {})
         
-        self.conn.commit()
+        self._notify_user(user_id, 'withdrawal_completed')
         return True, "Withdrawal completed successfully"
     
+    def _notify_user(self, user_id, template):
+        """Queue an SMS notification for one user; batched with others by sms_service"""
+        row = self.conn.execute("SELECT phone FROM users WHERE id = ?", (user_id,)).fetchone()
+        if row:
+            sms_service.notify(row[0], template)
+    
     def get_pending_withdrawals(self, user_id):
         cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT * FROM withdrawal_requests 
-            WHERE user_id = ? AND status = 'pending'
-            ORDER BY created_at DESC
-        ''', (user_id,))
-        return cursor.fetchall()
+        cursor.execute(queries.USER_PENDING_WITHDRAWALS, (user_id,))
+        return _with_money(cursor.fetchall(), 2)
     
     def get_all_pending_withdrawals(self):
         """Get all pending withdrawal requests for admin view"""
         cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT w.id, w.user_id, w.amount, w.bank_details_encrypted, w.created_at, u.phone
-            FROM withdrawal_requests w
-            JOIN users u ON w.user_id = u.id
-            WHERE w.status = 'pending'
-            ORDER BY w.created_at ASC
-        ''')
-        return cursor.fetchall()
+        cursor.execute(queries.ALL_PENDING_WITHDRAWALS)
+        return _with_money(cursor.fetchall(), 2)
 
     def admin_approve_withdrawal(self, request_id):
         """Admin: Approve a withdrawal request, deduct from wallet, and log transaction."""
@@ -417,24 +474,26 @@ class Database:
                 return False, "Withdrawal request not found."
 
             user_id, amount, status = result
+            amount = Money(amount)
             if status != 'pending':
                 return False, f"Request is already '{status}', cannot approve."
 
-            # 1. Deduct from user's wallet
-            self.update_wallet(user_id, -amount)
+            with self.transaction() as cursor:
+                # 1. Deduct from user's wallet
+                self.update_wallet(user_id, -amount, PAYOUTS, 'withdrawal', 'Admin approved withdrawal',
+                                   reference=f'withdrawal:{request_id}')
 
-            # 2. Update withdrawal request status to 'completed'
-            cursor.execute("UPDATE withdrawal_requests SET status = 'completed' WHERE id = ?", (request_id,))
+                # 2. Update withdrawal request status to 'completed'
+                cursor.execute("UPDATE withdrawal_requests SET status = 'completed' WHERE id = ?", (request_id,))
 
-            # 3. Add a transaction log for the withdrawal
-            self.add_transaction(user_id, 'withdrawal', amount, f'Admin approved withdrawal of ₹{amount:.2f}')
+                # 3. Add a transaction log for the withdrawal
+                self.add_transaction(user_id, 'withdrawal', amount, f'Admin approved withdrawal of ₹{amount:.2f}')
 
-            self.conn.commit()
             Logger.info(f"Admin approved withdrawal request {request_id} for user {user_id}.")
+            self._notify_user(user_id, 'withdrawal_completed')
             return True, "Withdrawal approved successfully. Funds deducted from user wallet."
 
         except Exception as e:
-            self.conn.rollback()
             Logger.error(f"Database: Failed to approve withdrawal {request_id} - {e}")
             return False, f"An error occurred: {e}"
 
@@ -451,56 +510,131 @@ class Database:
             if result[0] != 'pending':
                 return False, f"Request is already '{result[0]}', cannot cancel."
 
-            cursor.execute("UPDATE withdrawal_requests SET status = 'cancelled' WHERE id = ?", (request_id,))
-            self.conn.commit()
+            with self.transaction() as cursor:
+                cursor.execute("UPDATE withdrawal_requests SET status = 'cancelled' WHERE id = ?", (request_id,))
             Logger.info(f"Admin cancelled withdrawal request {request_id}.")
             return True, "Withdrawal request has been cancelled."
         except Exception as e:
-            self.conn.rollback()
             Logger.error(f"Database: Failed to cancel withdrawal {request_id} - {e}")
             return False, f"An error occurred: {e}"
 
-    def calculate_daily_returns(self):
-        """Calculate and credit daily returns for all active investments"""
-        cursor = self.conn.cursor()
+    def calculate_daily_returns(self, catch_up=True):
+        """Calculate and credit daily returns for all active investments.
 
-        # --- SECURITY FIX: Ensure this runs only once per day ---
-        today_str = datetime.now().strftime('%Y-%m-%d')
-        cursor.execute('SELECT run_date FROM daily_run_log WHERE run_date = ?', (today_str,))
-        if cursor.fetchone():
-            Logger.info("Daily returns have already been processed today.")
-            return # Already ran today, do nothing.
-        
-        # Log that we are running for today
-        cursor.execute('INSERT INTO daily_run_log (run_date) VALUES (?)', (today_str,))
-        
-        # Get all active investments
-        cursor.execute('SELECT * FROM investments WHERE status = "active"')
-        investments = cursor.fetchall()
-        
-        for inv in investments:
-            inv_id, user_id, plan_id, amount, daily_return, total_days, days_remaining, total_profit, status, payment_method, created_at = inv
-            
-            if days_remaining > 0:
-                # Credit daily return
-                self.update_wallet(user_id, daily_return)
-                
-                # Update investment
+        The accrual is done with a handful of set-based statements inside a
+        single transaction instead of a per-investment Python loop, so the
+        cost is one commit regardless of how many investments are active.
+
+        With catch_up enabled, every day since the last daily_run_log entry
+        is credited in the same pass, so a job that didn't run for a few
+        days recovers in one operation instead of losing those returns.
+        """
+        today = datetime.now().date()
+        today_str = today.strftime('%Y-%m-%d')
+
+        # Day offsets 0..days-1, oldest missed day first
+        accrual_days = '''
+            WITH RECURSIVE accrual_days(n) AS (
+                SELECT 0 UNION ALL SELECT n + 1 FROM accrual_days WHERE n + 1 < :days
+            )
+        '''
+        # Days owed to one investment: no more than it has left, than the run
+        # covers, or than have passed since it was made (the day it was made
+        # is paid by its first-day return). created_at is a UTC timestamp and
+        # run dates are local, so it is compared as a local date.
+        days_held = "CAST(julianday(:today) - julianday(date(created_at, 'localtime')) AS INTEGER)"
+        owed_days = f'MIN(days_remaining, :days, {days_held})'
+
+        started = time.perf_counter()
+        try:
+            with self.transaction() as cursor:
+                # --- SECURITY FIX: Ensure this runs only once per day ---
+                # Claiming today's log row takes the write lock, so a second run
+                # (another thread or process) waits here and then finds the row
+                try:
+                    cursor.execute('INSERT INTO daily_run_log (run_date) VALUES (?)', (today_str,))
+                except sqlite3.IntegrityError:
+                    Logger.info("Daily returns have already been processed today.")
+                    return 0 # Already ran today, do nothing.
+
+                # Work out how many accrual days are owed (today plus any missed days)
+                days = 1
+                if catch_up:
+                    last_run = cursor.execute(
+                        'SELECT MAX(run_date) FROM daily_run_log WHERE run_date < ?', (today_str,)
+                    ).fetchone()[0]
+                    if last_run:
+                        days = max(1, (today - datetime.strptime(last_run, '%Y-%m-%d').date()).days)
+                params = {'days': days, 'today': today_str}
+
+                # Everyone about to be credited gets a notification afterwards
                 cursor.execute('''
-                    UPDATE investments 
-                    SET days_remaining = days_remaining - 1, 
-                        total_profit = total_profit + ?
-                    WHERE id = ?
-                ''', (daily_return, inv_id))
-                
-                # Add transaction
-                self.add_transaction(user_id, 'return', daily_return, f'Daily return from Plan {plan_id}')
-                
-                # Mark as completed if no days remaining
-                if days_remaining - 1 == 0:
-                    cursor.execute('UPDATE investments SET status = "completed" WHERE id = ?', (inv_id,))
-        
-        self.conn.commit()
+                    SELECT phone FROM users WHERE id IN (
+                        SELECT user_id FROM investments WHERE status = 'active' AND ''' + owed_days + ''' > 0
+                    )
+                ''', params)
+                phones = [row[0] for row in cursor.fetchall()]
+
+                # Log the missed days too, so none of them is credited twice
+                cursor.execute('''
+                    INSERT INTO daily_run_log (run_date)
+                ''' + accrual_days + '''
+                    SELECT date(:today, printf('-%d days', :days - 1 - n)) FROM accrual_days
+                    WHERE n < :days - 1
+                ''', params)
+
+                # 1. Record one 'return' transaction per investment per day owed,
+                #    dated on the day it accrued; an investment made during the
+                #    missed days starts on the day after it was made
+                cursor.execute('''
+                    INSERT INTO transactions (user_id, type, amount, description, created_at)
+                ''' + accrual_days + '''
+                    SELECT i.user_id, 'return', i.daily_return, 'Daily return from Plan ' || i.plan_id,
+                           datetime('now', printf('-%d days', :days - 1 - d.n))
+                    FROM (
+                        SELECT id, user_id, plan_id, daily_return,
+                               :days - MIN(:days, ''' + days_held + ''') AS first_day,
+                               ''' + owed_days + ''' AS owed
+                        FROM investments
+                        WHERE status = 'active' AND ''' + owed_days + ''' > 0
+                    ) i
+                    JOIN accrual_days d ON d.n >= i.first_day AND d.n < i.first_day + i.owed
+                    ORDER BY d.n, i.id
+                ''', params)
+                credited = cursor.rowcount
+
+                # 2. Credit each wallet with the sum of its investments' returns,
+                #    as one ledger entry with a posting per user
+                ledger.post_wallet_credits(cursor, 'return', f'Daily returns for {days} day(s) to {today_str}', '''
+                    SELECT user_id, SUM(daily_return * ''' + owed_days + ''') AS amount
+                    FROM investments
+                    WHERE status = 'active' AND ''' + owed_days + ''' > 0
+                    GROUP BY user_id
+                ''', params, RETURNS)
+
+                # 3. Advance every credited investment by the days owed
+                cursor.execute('''
+                    UPDATE investments
+                    SET total_profit = total_profit + daily_return * ''' + owed_days + ''',
+                        days_remaining = days_remaining - ''' + owed_days + '''
+                    WHERE status = 'active' AND ''' + owed_days + ''' > 0
+                ''', params)
+
+                # 4. Mark as completed if no days remaining
+                cursor.execute('''
+                    UPDATE investments SET status = 'completed'
+                    WHERE status = 'active' AND days_remaining <= 0
+                ''')
+
+        except Exception as e:
+            Logger.error(f"Database: Daily returns failed - {e}")
+            raise
+
+        elapsed = time.perf_counter() - started
+        rate = credited / elapsed if elapsed > 0 else float(credited)
+        Logger.info(f"Database: Credited {credited} returns over {days} day(s) in {elapsed:.3f}s ({rate:,.0f} rows/s)")
+        sms_service.notify(phones, 'returns_credited')
+        return credited
     
     def get_all_users(self):
         """Get all users for admin view"""
@@ -509,7 +643,29 @@ class Database:
             SELECT id, phone, wallet_balance, referral_code, created_at 
             FROM users ORDER BY created_at DESC
         ''')
-        return cursor.fetchall()
+        return _with_money(cursor.fetchall(), 2)
+    
+    def get_users_page(self, cursor=None, limit=50, search=None):
+        """Get one page of users for the admin list, newest first.
+
+        Pages are keyset-paginated on (created_at, id): pass the returned
+        next_cursor back in to get the following page; it is None on the
+        last page. search matches a referral code or a numeric user id.
+        Returns (rows, next_cursor).
+        """
+        if search:
+            search = search.strip().upper()
+            user_id = int(search) if search.isdigit() else -1
+            rows = self.conn.execute(queries.USERS_SEARCH, (search, user_id, limit)).fetchall()
+            return _with_money(rows, 2), None
+        
+        if cursor:
+            rows = self.conn.execute(queries.USERS_PAGE_AFTER, (cursor[0], cursor[1], limit)).fetchall()
+        else:
+            rows = self.conn.execute(queries.USERS_PAGE_FIRST, (limit,)).fetchall()
+        
+        next_cursor = (rows[-1][4], rows[-1][0]) if len(rows) == limit else None
+        return _with_money(rows, 2), next_cursor
     
     def get_all_investments(self):
         """Get all investments for admin view"""
@@ -520,7 +676,7 @@ class Database:
             JOIN users u ON i.user_id = u.id 
             ORDER BY i.created_at DESC
         ''')
-        return cursor.fetchall()
+        return _with_money(cursor.fetchall(), 3, 4, 7)
     
     def get_all_transactions(self, limit=100):
         """Get all transactions for admin view"""
@@ -532,50 +688,177 @@ class Database:
             ORDER BY t.created_at DESC 
             LIMIT ?
         ''', (limit,))
-        return cursor.fetchall()
+        return _with_money(cursor.fetchall(), 3)
+    
+    def get_ledger_page(self, cursor=None, limit=50, type=None, status=None, user_id=None, start=None, end=None):
+        """Get one page of the transaction ledger, newest first.
+
+        Keyset-paginated on (created_at, id) like get_users_page, so every
+        page costs the same no matter how deep into the ledger it is.
+        Optional filters: type, status, user_id and a created_at range
+        [start, end). Returns (rows, next_cursor).
+        """
+        conditions, params = [], []
+        if type:
+            conditions.append('t.type = ?')
+            params.append(type)
+        if status:
+            conditions.append('t.status = ?')
+            params.append(status)
+        if user_id is not None:
+            conditions.append('t.user_id = ?')
+            params.append(user_id)
+        if start:
+            conditions.append('t.created_at >= ?')
+            params.append(start)
+        if end:
+            conditions.append('t.created_at < ?')
+            params.append(end)
+        if cursor:
+            conditions.append('(t.created_at, t.id) < (?, ?)')
+            params.extend(cursor)
+        
+        rows = self.conn.execute(queries.ledger_page(conditions), params + [limit]).fetchall()
+        
+        next_cursor = (rows[-1][7], rows[-1][0]) if len(rows) == limit else None
+        return _with_money(rows, 3), next_cursor
+    
+    def project_liabilities(self, horizon=90):
+        """Returns owed to active investments over the next horizon accrual days.
+
+        Investments are summed per plan and days_remaining in SQL, leaving
+        at most plans x plan length buckets for projections.py to turn into
+        daily liability curves, per-plan totals and a maturity calendar.
+        """
+        # numpy is only loaded once a report is actually asked for
+        from projections import project_liabilities
+        
+        started = time.perf_counter()
+        buckets = self.conn.execute('''
+            SELECT plan_id, days_remaining, SUM(daily_return), SUM(amount), COUNT(*)
+            FROM investments
+            WHERE status = 'active' AND days_remaining > 0
+            GROUP BY plan_id, days_remaining
+        ''').fetchall()
+        
+        # Day 0 is the next accrual: today unless today's has already run
+        today = datetime.now().date()
+        ran_today = self.conn.execute(
+            'SELECT 1 FROM daily_run_log WHERE run_date = ?', (today.strftime('%Y-%m-%d'),)
+        ).fetchone()
+        projection = project_liabilities(buckets, horizon, today + timedelta(days=1) if ran_today else today)
+        
+        Logger.info(f"Database: Projected {projection['investments']} investments over {projection['horizon']} days "
+                    f"in {time.perf_counter() - started:.3f}s")
+        return projection
     
     def get_platform_stats(self):
-        """Get platform statistics for admin dashboard"""
+        """Get platform statistics for admin dashboard.
+
+        Reads the platform_stats summary that triggers keep current, so this
+        is constant time regardless of how many rows the tables hold.
+        """
         cursor = self.conn.cursor()
+        stats = dict(cursor.execute('SELECT name, value FROM platform_stats').fetchall())
+        if len(stats) < len(schema.PLATFORM_STATS):
+            return self.reconcile_platform_stats()
         
-        stats = {
-            'total_users': cursor.execute('SELECT COUNT(*) FROM users').fetchone()[0],
-            'total_investments': cursor.execute('SELECT COUNT(*) FROM investments').fetchone()[0],
-            'active_investments': cursor.execute('SELECT COUNT(*) FROM investments WHERE status = "active"').fetchone()[0],
-            'total_investment_amount': cursor.execute('SELECT SUM(amount) FROM investments').fetchone()[0] or 0,
-            'total_returns_paid': cursor.execute('SELECT SUM(amount) FROM transactions WHERE type = "return"').fetchone()[0] or 0,
-            'total_withdrawals': cursor.execute('SELECT SUM(amount) FROM transactions WHERE type = "withdrawal"').fetchone()[0] or 0,
-            'total_wallet_balance': cursor.execute('SELECT SUM(wallet_balance) FROM users').fetchone()[0] or 0,
-        }
+        for name in MONEY_STATS:
+            stats[name] = Money(stats[name])
+        return stats
+    
+    def reconcile_platform_stats(self):
+        """Recompute platform stats from the base tables and repair any drift"""
+        with self.transaction() as cursor:
+            cached = dict(cursor.execute('SELECT name, value FROM platform_stats').fetchall())
+            stats = {}
+            for name, query in schema.PLATFORM_STATS.items():
+                stats[name] = cursor.execute(query).fetchone()[0]
+                if name in cached and cached[name] != stats[name]:
+                    Logger.warning(f"Database: platform stat {name} drifted ({cached[name]} != {stats[name]})")
+            cursor.executemany(
+                'INSERT OR REPLACE INTO platform_stats (name, value) VALUES (?, ?)', stats.items()
+            )
         
+        Logger.info("Database: Platform stats reconciled")
+        for name in MONEY_STATS:
+            stats[name] = Money(stats[name])
         return stats
     
+    def reconcile_ledger(self, full=False):
+        """Verify cached wallet and account balances against the ledger postings"""
+        with self.transaction() as cursor:
+            return ledger.reconcile(cursor, full)
+    
+    def write_balance_checkpoints(self):
+        """Checkpoint every wallet's balance at the start of each month not done yet.
+
+        Meant for a background job; each month is its own short transaction
+        and builds on the one before, so catching up is incremental.
+        Returns the number of months checkpointed.
+        """
+        conn = self.conn
+        period = conn.execute('SELECT MAX(period) FROM ledger_checkpoints').fetchone()[0]
+        if period is None:
+            first = conn.execute('SELECT created_at FROM ledger_postings ORDER BY id LIMIT 1').fetchone()
+            if not first:
+                return 0
+            period = conn.execute("SELECT date(?, 'start of month')", (first[0],)).fetchone()[0]
+        current = conn.execute("SELECT date('now', 'start of month')").fetchone()[0]
+        
+        months = 0
+        started = time.perf_counter()
+        while True:
+            period = conn.execute("SELECT date(?, '+1 month')", (period,)).fetchone()[0]
+            if period > current:
+                break
+            with self.transaction() as cursor:
+                accounts = ledger.write_checkpoint(cursor, period)
+            months += 1
+            Logger.info(f"Database: Checkpointed {accounts} wallet balances for {period}")
+        
+        if months:
+            Logger.info(f"Database: Wrote {months} month(s) of balance checkpoints in {time.perf_counter() - started:.3f}s")
+        return months
+    
+    def get_statement(self, user_id, start, end):
+        """Wallet statement for [start, end) ('YYYY-MM-DD' dates, UTC).
+
+        Returns {'opening_balance', 'closing_balance', 'entries'} where each
+        entry is (created_at, kind, description, amount, balance), or None
+        for an unknown user. Starts from the nearest monthly checkpoint, so
+        a month's statement costs about that month's postings.
+        """
+        return ledger.statement(self.conn.cursor(), user_id, start, end)
+    
     def update_user_wallet(self, user_id, amount, reason=""):
         """Admin: Update user wallet balance"""
-        cursor = self.conn.cursor()
-        cursor.execute('UPDATE users SET wallet_balance = wallet_balance + ? WHERE id = ?', (amount, user_id))
-        
-        # Add transaction record
-        self.add_transaction(user_id, 'admin_adjustment', amount, f'Admin adjustment: {reason}')
+        amount = Money.from_rupees(amount)
+        with self.transaction() as cursor:
+            self.update_wallet(user_id, amount, ADJUSTMENTS, 'admin_adjustment', f'Admin adjustment: {reason}')
+            
+            # Add transaction record
+            self.add_transaction(user_id, 'admin_adjustment', amount, f'Admin adjustment: {reason}')
         
-        self.conn.commit()
         return True
     
     def delete_user(self, user_id):
         """Admin: Delete user and all their data"""
-        cursor = self.conn.cursor()
-        
         try:
-            # Delete user's data from all tables
-            cursor.execute('DELETE FROM transactions WHERE user_id = ?', (user_id,))
-            cursor.execute('DELETE FROM investments WHERE user_id = ?', (user_id,))
-            cursor.execute('DELETE FROM withdrawal_requests WHERE user_id = ?', (user_id,))
-            cursor.execute('DELETE FROM users WHERE id = ?', (user_id,))
+            with self.transaction() as cursor:
+                # Close the wallet in the ledger; its postings stay for the audit trail
+                balance = ledger.balance(cursor, user_id)
+                if balance:
+                    self.update_wallet(user_id, -balance, ADJUSTMENTS, 'closing', f'Account {user_id} deleted')
+                
+                # Delete user's data from all tables
+                cursor.execute('DELETE FROM transactions WHERE user_id = ?', (user_id,))
+                cursor.execute('DELETE FROM investments WHERE user_id = ?', (user_id,))
+                cursor.execute('DELETE FROM withdrawal_requests WHERE user_id = ?', (user_id,))
+                cursor.execute('DELETE FROM users WHERE id = ?', (user_id,))
             
-            self.conn.commit()
             return True, "User deleted successfully"
         except Exception as e:
-            self.conn.rollback()
             return False, str(e)
     
     def get_user_detailed_info(self, user_id):
@@ -596,6 +879,10 @@ class Database:
             ORDER BY created_at DESC LIMIT 20
         ''', (user_id,)).fetchall()
         
+        user, = _with_money([user], 5)
+        investments = _with_money(investments, 3, 4, 7)
+        transactions = _with_money(transactions, 3)
+        
         return {
             'user_info': user,
             'investments': investments,
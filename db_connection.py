@@ -0,0 +1,151 @@
+# db_connection.py
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from kivy.logger import Logger
+
+# Connection profile applied to every connection the app opens.
+# WAL lets the admin screens keep reading while daily returns are being
+# written, and NORMAL sync is crash-safe in WAL mode with far fewer fsyncs.
+CONNECTION_PRAGMAS = [
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('cache_size', -8000),           # ~8 MB page cache (negative = KiB)
+    ('mmap_size', 64 * 1024 * 1024),  # 64 MB memory-mapped reads
+    ('temp_store', 'MEMORY'),
+]
+
+BUSY_TIMEOUT = 5.0  # seconds to wait on a locked database before failing
+
+# Used until the app points the pool at the real database in user_data_dir
+DEFAULT_DB_PATH = "investkar_data.db"
+
+
+def configure_connection(conn):
+    """Apply the connection profile to an already open connection."""
+    for name, value in CONNECTION_PRAGMAS:
+        try:
+            conn.execute(f'PRAGMA {name} = {value}')
+        except sqlite3.DatabaseError as e:
+            # e.g. mmap is unavailable on some platforms; keep going with the rest
+            Logger.warning(f"Database: Could not set PRAGMA {name} - {e}")
+    conn.execute(f'PRAGMA busy_timeout = {int(BUSY_TIMEOUT * 1000)}')
+    return conn
+
+
+def connect(db_path, **kwargs):
+    """Open a SQLite connection with the app's connection profile."""
+    kwargs.setdefault('timeout', BUSY_TIMEOUT)
+    conn = sqlite3.connect(db_path, **kwargs)
+    return configure_connection(conn)
+
+
+class ConnectionPool:
+    """Process-wide registry of SQLite connections.
+
+    Connections are keyed on the real path of the database file and kept
+    per thread, so every module that borrows one for the same file on the
+    same thread reuses a single open, profiled connection.
+    """
+
+    def __init__(self, default_path=DEFAULT_DB_PATH):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        self._keys = {}  # db_path -> realpath, so hot lookups skip the filesystem
+        self.default_path = os.path.realpath(default_path)
+        self.checkouts = 0
+        self.opened = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+
+    def set_default_path(self, db_path):
+        """Point borrowers that don't name a database at db_path."""
+        self.default_path = os.path.realpath(db_path)
+
+    def get(self, db_path=None):
+        """Return this thread's connection to db_path, opening it if needed."""
+        started = time.perf_counter()
+        if db_path:
+            key = self._keys.get(db_path)
+            if key is None:
+                key = self._keys[db_path] = os.path.realpath(db_path)
+        else:
+            key = self.default_path
+
+        connections = getattr(self._local, 'connections', None)
+        if connections is None:
+            connections = self._local.connections = {}
+
+        conn = connections.get(key)
+        opened = conn is None
+        if opened:
+            conn = connect(key, check_same_thread=False)
+            connections[key] = conn
+
+        wait = time.perf_counter() - started
+        with self._lock:
+            if opened:
+                self._connections.append(conn)
+                self.opened += 1
+            self.checkouts += 1
+            self.wait_time += wait
+            self.max_wait = max(self.max_wait, wait)
+        return conn
+
+    @contextmanager
+    def connection(self, db_path=None):
+        """Borrow a connection; commits on success, rolls back on error.
+
+        Connections are shared per thread, so when the borrowed one is
+        already inside a transaction (e.g. a Database.transaction() block)
+        the work runs in a savepoint instead: an error undoes only this
+        block, and the enclosing transaction decides when to commit.
+        """
+        conn = self.get(db_path)
+        if conn.in_transaction:
+            conn.execute('SAVEPOINT pool_connection')
+            try:
+                yield conn
+            except BaseException:
+                conn.execute('ROLLBACK TO pool_connection')
+                conn.execute('RELEASE pool_connection')
+                raise
+            else:
+                conn.execute('RELEASE pool_connection')
+            return
+
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        else:
+            conn.commit()
+
+    def metrics(self):
+        """Checkout counters and wait times, for diagnostics."""
+        with self._lock:
+            return {
+                'checkouts': self.checkouts,
+                'open_connections': self.opened,
+                'total_wait_ms': self.wait_time * 1000,
+                'avg_wait_ms': self.wait_time * 1000 / self.checkouts if self.checkouts else 0.0,
+                'max_wait_ms': self.max_wait * 1000,
+            }
+
+    def close_all(self):
+        """Close every connection the pool has handed out."""
+        with self._lock:
+            for conn in self._connections:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self._connections = []
+        self._local = threading.local()
+
+# Global instance
+connection_pool = ConnectionPool()
@@ -0,0 +1,101 @@
+# encryption.py
+"""Field encryption for phone numbers and bank details.
+
+AES-256-GCM with a fresh random nonce per value, keyed from key_manager.
+Encryption is randomized - the same input never gives the same token - so
+lookups go through Security.phone_index rather than comparing ciphertexts.
+The cipher is set up once and shared; the batch APIs reuse it across a
+whole list and can spread large lists over a thread pool.
+"""
+import base64
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from kivy.logger import Logger
+
+from key_manager import key_manager
+
+NONCE_SIZE = 12
+PARALLEL_THRESHOLD = 5000          # batches at least this long are split across threads
+MAX_WORKERS = os.cpu_count() or 2
+
+
+class Encryption:
+    def __init__(self, key_name='field_encryption'):
+        self.key_name = key_name
+        self._cipher = None
+        self._pool = None
+        self._lock = threading.Lock()
+
+    @property
+    def cipher(self):
+        # Built on first use, after the app has pointed key_manager at its data dir
+        if self._cipher is None:
+            with self._lock:
+                if self._cipher is None:
+                    self._cipher = AESGCM(key_manager.get_key(self.key_name))
+        return self._cipher
+
+    def encrypt_string(self, value):
+        """Encrypt a string; None stays None"""
+        if value is None:
+            return None
+        nonce = os.urandom(NONCE_SIZE)
+        return base64.urlsafe_b64encode(nonce + self.cipher.encrypt(nonce, value.encode('utf-8'), None)).decode('ascii')
+
+    def decrypt_string(self, token):
+        """Decrypt a token from encrypt_string; returns None if it can't be decrypted"""
+        if not token:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(token)
+            return self.cipher.decrypt(raw[:NONCE_SIZE], raw[NONCE_SIZE:], None).decode('utf-8')
+        except (InvalidTag, ValueError) as e:
+            Logger.error(f"Encryption: Could not decrypt value - {type(e).__name__}")
+            return None
+
+    def encrypt_json(self, value):
+        """Encrypt any JSON-serializable value"""
+        return None if value is None else self.encrypt_string(json.dumps(value))
+
+    def decrypt_json(self, token):
+        plain = self.decrypt_string(token)
+        return None if plain is None else json.loads(plain)
+
+    def _map(self, func, values, parallel):
+        values = list(values)
+        if parallel is None:
+            parallel = len(values) >= PARALLEL_THRESHOLD
+        if not parallel or len(values) < 2:
+            return [func(value) for value in values]
+
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='crypto')
+        # One contiguous slice per worker keeps the per-task overhead negligible
+        size = -(-len(values) // MAX_WORKERS)
+        chunks = [values[i:i + size] for i in range(0, len(values), size)]
+        results = []
+        for chunk in self._pool.map(lambda chunk: [func(value) for value in chunk], chunks):
+            results.extend(chunk)
+        return results
+
+    def encrypt_strings(self, values, parallel=None):
+        """Encrypt a list of strings with one shared cipher; order is preserved"""
+        return self._map(self.encrypt_string, values, parallel)
+
+    def decrypt_strings(self, tokens, parallel=None):
+        return self._map(self.decrypt_string, tokens, parallel)
+
+    def encrypt_json_batch(self, values, parallel=None):
+        return self._map(self.encrypt_json, values, parallel)
+
+    def decrypt_json_batch(self, tokens, parallel=None):
+        return self._map(self.decrypt_json, tokens, parallel)
+
+# Global instance
+encryption = Encryption()
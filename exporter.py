@@ -0,0 +1,158 @@
+# exporter.py
+"""Streaming table export to CSV or JSONL.
+
+Rows are pulled with fetchmany and written out chunk by chunk, so memory
+use stays at one chunk no matter how large the table is. Amounts are
+written as stored, in integer paise.
+"""
+import csv
+import gzip
+import json
+import os
+import threading
+import time
+from kivy.clock import Clock
+from kivy.logger import Logger
+
+from db_connection import connect, connection_pool
+from tasks import task_executor
+
+EXPORT_TABLES = ['users', 'investments', 'transactions', 'withdrawal_requests', 'payment_intents']
+EXPORT_FORMATS = ('csv', 'jsonl')
+
+# Credentials never leave the device, even in an admin export
+EXCLUDED_COLUMNS = {
+    'users': {'security_code_hash', 'salt'},
+}
+
+CHUNK_SIZE = 1000
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+class DataExporter:
+    def __init__(self, chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.running = False
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        """Ask a running export to stop after the current chunk"""
+        self._cancel.set()
+
+    def _columns(self, conn, table):
+        excluded = EXCLUDED_COLUMNS.get(table, set())
+        return [row[1] for row in conn.execute(f'PRAGMA table_info({table})') if row[1] not in excluded]
+
+    def _open(self, path, compress):
+        if compress:
+            return gzip.open(path, 'wt', encoding='utf-8', newline='')
+        return open(path, 'w', encoding='utf-8', newline='')
+
+    def export_table(self, conn, table, path, fmt='csv', compress=False, progress=None):
+        """Stream one table to path; returns the number of rows written.
+
+        progress(rows_written) is called after every chunk.
+        """
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format: {fmt}")
+
+        columns = self._columns(conn, table)
+        cursor = conn.execute(f"SELECT {', '.join(columns)} FROM {table} ORDER BY rowid")
+        written = 0
+
+        with self._open(path, compress) as out:
+            if fmt == 'csv':
+                writer = csv.writer(out)
+                writer.writerow(columns)
+
+            while True:
+                if self._cancel.is_set():
+                    raise ExportCancelled(table)
+                rows = cursor.fetchmany(self.chunk_size)
+                if not rows:
+                    break
+                if fmt == 'csv':
+                    writer.writerows(rows)
+                else:
+                    out.writelines(
+                        json.dumps(dict(zip(columns, row)), ensure_ascii=False, default=str) + '\n'
+                        for row in rows
+                    )
+                written += len(rows)
+                if progress:
+                    progress(written)
+
+        return written
+
+    def export_all(self, out_dir, tables=None, fmt='csv', compress=False, db_path=None, progress=None):
+        """Export tables into out_dir from one consistent snapshot.
+
+        progress(table, rows_done, rows_total) is called after every chunk.
+        Returns {table: (path, rows)}.
+        """
+        tables = tables or EXPORT_TABLES
+        os.makedirs(out_dir, exist_ok=True)
+        extension = f".{fmt}.gz" if compress else f".{fmt}"
+
+        # A private connection so the export never shares a transaction with the app
+        conn = connect(db_path or connection_pool.default_path)
+        results = {}
+        started = time.perf_counter()
+        self._cancel.clear()
+        self.running = True
+        try:
+            # One read transaction for every table, so the files agree with each other
+            conn.execute('BEGIN')
+            totals = {table: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0] for table in tables}
+            rows_total = sum(totals.values())
+            rows_before = 0
+
+            for table in tables:
+                path = os.path.join(out_dir, table + extension)
+                report = None
+                if progress:
+                    report = lambda written, table=table, base=rows_before: progress(table, base + written, rows_total)
+                rows = self.export_table(conn, table, path, fmt, compress, report)
+                results[table] = (path, rows)
+                rows_before += rows
+
+            elapsed = time.perf_counter() - started
+            Logger.info(f"Exporter: Exported {rows_before} rows from {len(tables)} tables in {elapsed:.2f}s "
+                        f"({rows_before / elapsed if elapsed else 0:.0f} rows/s) to {out_dir}")
+            return results
+        except ExportCancelled:
+            Logger.info(f"Exporter: Export cancelled after {len(results)} of {len(tables)} tables")
+            raise
+        except Exception as e:
+            Logger.error(f"Exporter: Export failed - {e}")
+            raise
+        finally:
+            self.running = False
+            conn.rollback()
+            conn.close()
+
+    def export_in_background(self, out_dir, fmt='csv', compress=False, tables=None,
+                             on_progress=None, on_complete=None, on_error=None):
+        """Run export_all on the task executor; callbacks run on the Kivy main thread.
+
+        Returns the Task; use cancel() to stop the export itself.
+        """
+        if self.running:
+            raise RuntimeError("An export is already running")
+
+        def progress(table, done, total):
+            if on_progress:
+                Clock.schedule_once(lambda dt: on_progress(table, done, total))
+
+        # Claimed before the worker starts, so a second tap can't queue another export
+        self.running = True
+        return task_executor.submit(
+            self.export_all, out_dir, tables, fmt, compress, progress=progress,
+            on_success=on_complete, on_error=on_error, name='export'
+        )
+
+# Global instance
+data_exporter = DataExporter()
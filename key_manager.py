@@ -0,0 +1,61 @@
+# key_manager.py
+"""Secret keys used for encryption and blind indexes.
+
+A key named NAME comes from the INVESTKAR_NAME_KEY environment variable
+(hex) when it is set, otherwise from <key_dir>/NAME.key, which is created
+with a random key the first time it is needed.
+"""
+import os
+import secrets
+import threading
+from kivy.logger import Logger
+
+KEY_SIZE = 32  # bytes
+
+
+class KeyManager:
+    def __init__(self, key_dir='.'):
+        self.key_dir = key_dir
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    def set_key_dir(self, key_dir):
+        """Keep key files in key_dir (the app's private data directory)"""
+        with self._lock:
+            self.key_dir = key_dir
+            self._keys = {}
+
+    def get_key(self, name, size=KEY_SIZE):
+        """Return the key called name, creating it if it doesn't exist yet"""
+        with self._lock:
+            key = self._keys.get(name)
+            if key is None:
+                key = self._keys[name] = self._load(name, size)
+            return key
+
+    def _load(self, name, size):
+        env_key = os.environ.get(f"INVESTKAR_{name.upper()}_KEY")
+        if env_key:
+            return bytes.fromhex(env_key)
+
+        path = os.path.join(self.key_dir, f"{name}.key")
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            pass
+
+        key = secrets.token_bytes(size)
+        # Readable by the app only; O_EXCL so two processes never write different keys
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            with open(path, 'rb') as f:
+                return f.read()
+        with os.fdopen(fd, 'wb') as f:
+            f.write(key)
+        Logger.info(f"KeyManager: Created key '{name}' in {self.key_dir}")
+        return key
+
+# Global instance
+key_manager = KeyManager()
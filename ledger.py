@@ -0,0 +1,211 @@
+# ledger.py
+"""Double-entry ledger behind every wallet balance.
+
+Each change is a journal entry with postings that sum to exactly zero: a
+user's wallet account on one side, a system account (returns paid,
+payouts, referral bonuses, ...) on the other. Amounts are integer paise
+(Money), so balances check out exactly. Postings are append-only. Triggers
+keep ledger_accounts.balance and users.wallet_balance as running totals,
+so balance reads stay O(1), and reconcile() checks those totals against
+the postings without replaying history.
+"""
+import time
+from kivy.logger import Logger
+
+from money import Money
+import queries
+
+# System accounts have fixed ids, created by the schema migration
+OPENING = 'system:opening'          # balances carried over from before the ledger
+RETURNS = 'system:returns'          # daily returns paid into wallets
+REFERRALS = 'system:referrals'      # referral bonuses
+PAYOUTS = 'system:payouts'          # withdrawals paid out to bank accounts
+ADJUSTMENTS = 'system:adjustments'  # admin corrections and closed accounts
+
+SYSTEM_ACCOUNTS = [(1, OPENING), (2, RETURNS), (3, REFERRALS), (4, PAYOUTS), (5, ADJUSTMENTS)]
+
+
+class UnbalancedEntry(ValueError):
+    pass
+
+
+class Ledger:
+    def __init__(self):
+        self.account_ids = {code: account_id for account_id, code in SYSTEM_ACCOUNTS}
+
+    def wallet_account(self, cursor, user_id):
+        """The id of user_id's wallet account, opening it if needed"""
+        row = cursor.execute('SELECT id FROM ledger_accounts WHERE user_id = ?', (user_id,)).fetchone()
+        if row:
+            return row[0]
+        cursor.execute(
+            "INSERT INTO ledger_accounts (code, kind, user_id) VALUES (?, 'wallet', ?)", (f'wallet:{user_id}', user_id)
+        )
+        return cursor.lastrowid
+
+    def balance(self, cursor, user_id):
+        """user_id's wallet balance as recorded in the ledger"""
+        row = cursor.execute('SELECT balance FROM ledger_accounts WHERE user_id = ?', (user_id,)).fetchone()
+        return Money(row[0] if row else 0)
+
+    def post(self, cursor, kind, description, legs, reference=None):
+        """Record one journal entry; legs is [(account_id, Money), ...] summing to zero"""
+        if sum(amount for _, amount in legs):
+            raise UnbalancedEntry(f"Journal entry '{description}' does not balance")
+        cursor.execute(
+            'INSERT INTO ledger_journal (kind, description, reference) VALUES (?, ?, ?)',
+            (kind, description, reference)
+        )
+        journal_id = cursor.lastrowid
+        cursor.executemany(
+            'INSERT INTO ledger_postings (journal_id, account_id, amount) VALUES (?, ?, ?)',
+            [(journal_id, account_id, amount) for account_id, amount in legs]
+        )
+        return journal_id
+
+    def transfer(self, cursor, user_id, amount, counter, kind, description, reference=None):
+        """Credit amount to user_id's wallet from the counter system account (debit if negative)"""
+        return self.post(cursor, kind, description, [
+            (self.wallet_account(cursor, user_id), amount),
+            (self.account_ids[counter], -amount),
+        ], reference)
+
+    def post_wallet_credits(self, cursor, kind, description, credits_sql, params, counter):
+        """Credit many wallets in one journal entry.
+
+        credits_sql selects (user_id, amount) rows; the counter account takes
+        the total. Returns the journal id.
+        """
+        cursor.execute('INSERT INTO ledger_journal (kind, description) VALUES (?, ?)', (kind, description))
+        journal_id = cursor.lastrowid
+        params = dict(params, journal_id=journal_id, counter_id=self.account_ids[counter])
+        cursor.execute(f'''
+            INSERT INTO ledger_postings (journal_id, account_id, amount)
+            SELECT :journal_id, a.id, credit.amount
+            FROM ({credits_sql}) AS credit
+            JOIN ledger_accounts a ON a.user_id = credit.user_id
+        ''', params)
+        cursor.execute('''
+            INSERT INTO ledger_postings (journal_id, account_id, amount)
+            SELECT :journal_id, :counter_id, -SUM(amount) FROM ledger_postings WHERE journal_id = :journal_id
+            HAVING COUNT(*) > 0
+        ''', params)
+        return journal_id
+
+    def write_checkpoint(self, cursor, period):
+        """Record every wallet's balance at the start of period ('YYYY-MM-DD').
+
+        Each balance is the account's previous checkpoint plus the postings
+        since it, so a run only reads the postings of the period it closes.
+        Returns the number of checkpoints written.
+        """
+        cursor.execute('''
+            INSERT OR REPLACE INTO ledger_checkpoints (account_id, period, balance)
+            SELECT a.id, :period, COALESCE(c.balance, 0) + COALESCE((
+                SELECT SUM(p.amount) FROM ledger_postings p
+                WHERE p.account_id = a.id AND p.created_at >= COALESCE(c.period, '') AND p.created_at < :period
+            ), 0)
+            FROM ledger_accounts a
+            LEFT JOIN ledger_checkpoints c ON c.account_id = a.id AND c.period = (
+                SELECT MAX(period) FROM ledger_checkpoints WHERE account_id = a.id AND period < :period
+            )
+            WHERE a.kind = 'wallet'
+        ''', {'period': period})
+        return cursor.rowcount
+
+    def statement(self, cursor, user_id, start, end):
+        """user_id's wallet postings in [start, end) with running balances.
+
+        The opening balance comes from the nearest checkpoint at or before
+        start plus the few postings between the two, so the cost follows
+        the length of the statement, not of the account's history.
+        """
+        row = cursor.execute('SELECT id FROM ledger_accounts WHERE user_id = ?', (user_id,)).fetchone()
+        if not row:
+            return None
+        account_id = row[0]
+
+        checkpoint = cursor.execute(queries.STATEMENT_CHECKPOINT, (account_id, start)).fetchone()
+        since, opening = checkpoint or ('', 0)
+        opening += cursor.execute(
+            queries.STATEMENT_POSTINGS_TOTAL, (account_id, since, start)).fetchone()[0]
+        opening = Money(opening)
+
+        entries, balance = [], opening
+        for created_at, kind, description, amount in cursor.execute(
+                queries.STATEMENT_ENTRIES, (account_id, start, end)):
+            amount = Money(amount)
+            balance += amount
+            entries.append((created_at, kind, description, amount, balance))
+        return {'opening_balance': opening, 'closing_balance': balance, 'entries': entries}
+
+    def reconcile(self, cursor, full=False):
+        """Check cached balances against the postings.
+
+        Only postings newer than the last reconciliation are summed (all of
+        them when full=True), in one grouped pass, and each account's
+        verified balance is advanced by its share. The cost follows the
+        number of accounts and new postings, not the length of history.
+        """
+        started = time.perf_counter()
+        if full:
+            cursor.execute('UPDATE ledger_accounts SET verified_balance = 0')
+        last_verified = 0 if full else cursor.execute('SELECT last_posting_id FROM ledger_audit').fetchone()[0]
+        head = cursor.execute('SELECT COALESCE(MAX(id), 0) FROM ledger_postings').fetchone()[0]
+
+        cursor.execute('DROP TABLE IF EXISTS temp.ledger_deltas')
+        cursor.execute('''
+            CREATE TEMP TABLE ledger_deltas AS
+            SELECT account_id, SUM(amount) AS amount, COUNT(*) AS postings
+            FROM ledger_postings WHERE id > ? AND id <= ?
+            GROUP BY account_id
+        ''', (last_verified, head))
+        postings = cursor.execute('SELECT COALESCE(SUM(postings), 0) FROM temp.ledger_deltas').fetchone()[0]
+
+        accounts = cursor.execute('''
+            SELECT a.id, a.code, a.balance, a.verified_balance + COALESCE(d.amount, 0)
+            FROM ledger_accounts a LEFT JOIN temp.ledger_deltas d ON d.account_id = a.id
+        ''').fetchall()
+        mismatches = [
+            (code, Money(cached), Money(expected)) for _, code, cached, expected in accounts
+            if cached != expected
+        ]
+        wallets = [
+            (user_id, Money(wallet), Money(balance)) for user_id, wallet, balance in cursor.execute('''
+                SELECT u.id, u.wallet_balance, a.balance FROM users u
+                JOIN ledger_accounts a ON a.user_id = u.id
+                WHERE u.wallet_balance != a.balance
+            ''')
+        ]
+        imbalance = Money(sum(expected for _, _, _, expected in accounts))
+
+        # The verified balance always follows the postings, the source of truth
+        cursor.execute('''
+            UPDATE ledger_accounts SET verified_balance = verified_balance + d.amount
+            FROM temp.ledger_deltas d WHERE d.account_id = ledger_accounts.id
+        ''')
+        cursor.execute(
+            'UPDATE ledger_audit SET last_posting_id = ?, verified_at = CURRENT_TIMESTAMP', (head,)
+        )
+        cursor.execute('DROP TABLE temp.ledger_deltas')
+
+        for code, cached, expected in mismatches:
+            Logger.warning(f"Ledger: {code} balance {cached} != postings {expected}")
+        for user_id, wallet, balance in wallets:
+            Logger.warning(f"Ledger: user {user_id} wallet {wallet} != ledger {balance}")
+        if imbalance:
+            Logger.warning(f"Ledger: postings don't sum to zero (off by {imbalance})")
+
+        elapsed = time.perf_counter() - started
+        Logger.info(f"Ledger: Reconciled {len(accounts)} accounts and {postings} postings in {elapsed:.3f}s")
+        return {
+            'accounts': len(accounts),
+            'postings': postings,
+            'mismatches': mismatches,
+            'wallet_mismatches': wallets,
+            'imbalance': imbalance,
+            'ok': not mismatches and not wallets and not imbalance,
+        }
+
+# Global instance
+ledger = Ledger()
@@ -15,7 +15,14 @@ import os
 from kivy.lang import Builder
 
 from utils import show_popup, validate_database, optimize_app, show_support
+from db_connection import connection_pool
+from tasks import task_executor
+from rate_limiter import rate_limiter, SQLiteBackend
+from password_hasher import password_hasher
+from key_manager import key_manager
 from database import Database
+from money import Money
+from plans import plan_catalog
 from security import Security
 from sms_service import sms_service
 from auto_payment import auto_payment
@@ -29,12 +36,8 @@ Window.size = (360, 640)
 # Global database instance to be initialized in the App class
 db = None
 
-# Centralize plan definitions
-INVESTMENT_PLANS = {
-    1: {'name': 'Starter Plan', 'amounts': [599, 1099], 'return_rate': 4, 'days': 80, 'color': '#3b82f6'},
-    2: {'name': 'Growth Plan', 'amounts': [1799, 3050], 'return_rate': 4, 'days': 110, 'color': '#8b5cf6'},
-    3: {'name': 'Premium Plan', 'amounts': [10000, 20000], 'return_rate': 5, 'days': 150, 'color': '#ef4444'},
-}
+# Platform stats are maintained incrementally; reconcile them against the tables every 6 hours
+STATS_RECONCILE_INTERVAL = 6 * 60 * 60
 
 # Load the KV file. Although Kivy does this automatically,
 # it's good practice to do it explicitly for clarity.
@@ -82,22 +85,24 @@ class AuthScreen(Screen):
         otp = Security.generate_otp()
         security_code = Security.generate_security_code()
         
-        # Store only OTP in database (not security code)
-        db.store_otp(phone, otp)
-        
-        # Send SMS
-        result = sms_service.send_otp(phone, otp, security_code)
-        
-        if result.get('return'):
-            # Store security code temporarily for registration
-            self.temp_security_code = security_code
-            
-            self.current_view.otp_section.disabled = False
-            self.current_view.otp_section.opacity = 1
-            
-            if result.get('demo'):
-                # Show demo popup with codes
-                demo_msg = f'''
+        def deliver():
+            # Store only OTP in database (not security code)
+            db.store_otp(phone, otp)
+            # Send SMS
+            return sms_service.send_otp(phone, otp, security_code)
+        
+        def on_sent(result):
+            instance.disabled = False
+            if result.get('return'):
+                # Store security code temporarily for registration
+                self.temp_security_code = security_code
+                
+                self.current_view.otp_section.disabled = False
+                self.current_view.otp_section.opacity = 1
+                
+                if result.get('demo'):
+                    # Show demo popup with codes
+                    demo_msg = f'''
 📱 DEMO MODE - No real SMS sent
 
 📞 Phone: +91 {phone}
@@ -108,11 +113,19 @@ class AuthScreen(Screen):
 
 In production, this would be sent via SMS
 '''
-                show_popup('Demo OTP', demo_msg)
+                    show_popup('Demo OTP', demo_msg)
+                else:
+                    show_popup('Success', 'OTP sent to your mobile number')
             else:
-                show_popup('Success', 'OTP sent to your mobile number')
-        else:
-            show_popup('Error', f'Failed to send OTP: {result.get("message")}')
+                show_popup('Error', f'Failed to send OTP: {result.get("message")}')
+        
+        def on_failed(error):
+            instance.disabled = False
+            show_popup('Error', f'Failed to send OTP: {error}')
+        
+        # The SMS gateway can take seconds to answer; keep the UI responsive
+        instance.disabled = True
+        task_executor.submit(deliver, on_success=on_sent, on_error=on_failed, name='send_otp')
     def register(self, instance):
         phone = self.current_view.reg_phone.text.strip()
         otp = self.current_view.otp_input.text.strip()
@@ -124,23 +137,30 @@ In production, this would be sent via SMS
         if not Security.validate_phone(phone):
             show_popup('Error', 'Invalid phone number')
             return
-
-        otp_verified, otp_message = db.verify_otp(phone, otp)
-        if not otp_verified:
-            # This will now show rate-limit errors as well
-            show_popup('Error', 'Invalid or expired OTP')
-            return
-        
-        if not security_code or len(security_code) != 6:
-            show_popup('Error', 'Security code must be 6 digits')
-            return
-        
-        success, message = db.register_user(phone, security_code, referral_code)
         
-        if success:
+        def create_account():
+            otp_verified, otp_message = db.verify_otp(phone, otp)
+            if not otp_verified:
+                # This will now show rate-limit errors as well
+                return False, 'Invalid or expired OTP', None
+            
+            if not security_code or len(security_code) != 6:
+                return False, 'Security code must be 6 digits', None
+            
+            success, message = db.register_user(phone, security_code, referral_code)
+            if not success:
+                return False, message, None
+            
             # ✅ AUTO-LOGIN AFTER REGISTRATION
             login_success, user_id = db.login_user(phone, security_code)
-            if login_success:
+            return True, message, user_id if login_success else None
+        
+        def on_registered(outcome):
+            instance.disabled = False
+            success, message, user_id = outcome
+            if not success:
+                show_popup('Error', message)
+            elif user_id:
                 app = App.get_running_app()
                 app.user_id = user_id
                 app.root.current = 'home'
@@ -152,8 +172,14 @@ In production, this would be sent via SMS
             else:
                 show_popup('Error', 'Registration failed - please login manually')
                 self.show_login()
-        else:
-            show_popup('Error', message)
+        
+        def on_failed(error):
+            instance.disabled = False
+            show_popup('Error', f'Registration failed: {error}')
+        
+        # Hashing the security code is deliberately slow; keep it off the UI thread
+        instance.disabled = True
+        task_executor.submit(create_account, on_success=on_registered, on_error=on_failed, name='register')
     def login(self, instance):
         phone = self.current_view.phone_input.text.strip()
         security_code = self.current_view.security_input.text.strip()
@@ -166,15 +192,25 @@ In production, this would be sent via SMS
             show_popup('Error', 'Security code must be 6 digits')
             return
         
-        success, result = db.login_user(phone, security_code)
+        def on_result(outcome):
+            instance.disabled = False
+            success, result = outcome
+            if success:
+                app = App.get_running_app()
+                app.user_id = result
+                app.root.current = 'home'
+                show_popup('Success', 'Login successful!')
+            else:
+                show_popup('Error', result)
         
-        if success:
-            app = App.get_running_app()
-            app.user_id = result
-            app.root.current = 'home'
-            show_popup('Success', 'Login successful!')
-        else:
-            show_popup('Error', result)
+        def on_failed(error):
+            instance.disabled = False
+            show_popup('Error', f'Login failed: {error}')
+        
+        # Hashing the security code is deliberately slow; keep it off the UI thread
+        instance.disabled = True
+        task_executor.submit(db.login_user, phone, security_code,
+                             on_success=on_result, on_error=on_failed, name='login')
 
     def go_to_admin(self):
         """Navigate to admin screen"""
@@ -190,10 +226,9 @@ class HomeScreen(Screen):
         plans_layout = self.ids.plans_layout
         plans_layout.clear_widgets()
         
-        # Create plan cards from the centralized dictionary
-        for plan_id, plan_details in INVESTMENT_PLANS.items():
-            plan_card = self.create_plan_card(plan_id, **plan_details)
-            plans_layout.add_widget(plan_card)
+        # Create plan cards from the shared plan catalog, picking up any plan changes
+        for plan in plan_catalog.all(db.conn):
+            plans_layout.add_widget(self.create_plan_card(plan))
         
         # Customer Care
         care_card = Button(text='📞 Customer Support',
@@ -204,32 +239,29 @@ class HomeScreen(Screen):
 
         plans_layout.add_widget(care_card)
     
-    def create_plan_card(self, plan_id, name, amounts, return_rate, days, color, **kwargs):
+    def create_plan_card(self, plan):
         card = BoxLayout(orientation='vertical', size_hint_y=None, height=300, spacing=10)
         
         # Header
         header = Button(
-            text=f'{name}\n{return_rate}% Daily Return • {days} Days',
+            text=f'{plan.name}\n{plan.return_rate}% Daily Return • {plan.days} Days',
             size_hint_y=None,
             height=80,
-            background_color=self.hex_to_rgb(color),
+            background_color=self.hex_to_rgb(plan.color),
             color=(1, 1, 1, 1)
         )
         header.disabled = True
         card.add_widget(header)
         
-        # Amount options
-        for amount in amounts:
-            daily_return = amount * return_rate / 100
-            total_return = amount + (daily_return * days)
-            
+        # Amount options, with the catalog's precomputed terms
+        for option in plan.options:
             amount_btn = Button(
-                text=f'₹{amount}\nDaily: ₹{daily_return:.2f} • Total: ₹{total_return:.0f}',
+                text=f'₹{option.amount:.0f}\nDaily: ₹{option.daily_return:.2f} • Total: ₹{option.total_payout:.0f}',
                 size_hint_y=None,
                 height=70,
                 background_color=(0.9, 0.9, 0.9, 1)
             )
-            amount_btn.bind(on_press=lambda x, p=plan_id, a=amount: self.invest(p, a))
+            amount_btn.bind(on_press=lambda x, p=plan.id, a=option.amount: self.invest(p, a))
             card.add_widget(amount_btn)
         
         return card
@@ -559,7 +591,11 @@ class ProfileScreen(Screen):
         popup.open()
     
     def process_withdrawal(self, popup, method):
-        amount = float(self.withdraw_amount.text or 0)
+        try:
+            amount = Money.from_rupees(self.withdraw_amount.text or 0)
+        except ValueError:
+            show_popup('Error', 'Enter a valid amount.')
+            return
         
         bank_details = {
             'account_holder': Security.sanitize_input(self.account_holder.text),
@@ -597,14 +633,39 @@ class InvestKarApp(App):  # ✅ Changed from InvestmentApp
         # Ensure the user data directory exists
         os.makedirs(self.user_data_dir, exist_ok=True)
         
-        # Run database validation and optimization on startup
+        # Secret keys live next to the database in the app's private storage
+        key_manager.set_key_dir(self.user_data_dir)
+        
+        # Every module borrows connections to this file from the shared pool
+        connection_pool.set_default_path(db_path)
+        
+        # Creating the database runs any pending schema migrations, so
+        # validation and optimization come after it
+        db = Database(db_path)
+        # Attempt counts live in the database, so restarting the app doesn't reset them
+        rate_limiter.use(SQLiteBackend(db_path))
         validate_database(db_path)
         optimize_app(db_path)
         
-        db = Database(db_path)
-        db.initialize_plans(INVESTMENT_PLANS)
+        # Load the plan catalog once; screens and payments share it from here
+        plan_catalog.refresh(db.conn)
         # Calculate any missed daily returns on app start
         db.calculate_daily_returns()
+        # Index phones of users created before the lookup index existed
+        task_executor.submit(db.backfill_phone_index, name='backfill_phone_index')
+        # Encrypt plaintext left from older versions without holding up startup
+        task_executor.submit(db.migrate_encryption, name='migrate_encryption')
+        # Checkpoint wallet balances for any month that ended since the last run
+        task_executor.submit(db.write_balance_checkpoints, name='write_balance_checkpoints')
+        # Recompute the dashboard stats off the UI thread; it scans the base tables
+        Clock.schedule_interval(
+            lambda dt: task_executor.submit(db.reconcile_platform_stats, name='reconcile_platform_stats'),
+            STATS_RECONCILE_INTERVAL
+        )
+        # Check wallet balances against the ledger postings added since the last check
+        Clock.schedule_interval(
+            lambda dt: task_executor.submit(db.reconcile_ledger, name='reconcile_ledger'), STATS_RECONCILE_INTERVAL
+        )
         
         self.sm = ScreenManager()
         
@@ -623,6 +684,12 @@ class InvestKarApp(App):  # ✅ Changed from InvestmentApp
 
         return self.sm
     
+    def on_stop(self):
+        # Drop queued background work; running tasks and queued SMS finish on their own
+        task_executor.shutdown()
+        sms_service.stop()
+        password_hasher.shutdown()
+    
     def show_verification_popup(self, payment_type, plan_id, amount, method, transaction_id, user_phone):
         popup = ModalView(size_hint=(0.8, 0.6), auto_dismiss=False)
         layout = BoxLayout(orientation='vertical', padding=20, spacing=15)
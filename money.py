@@ -0,0 +1,120 @@
+# money.py
+"""Money as a whole number of paise.
+
+Amounts are stored and summed in SQLite as INTEGER paise, so credits never
+pick up binary floating-point drift and aggregates are exact integer sums.
+Money wraps that count in Python: arithmetic stays exact, percentages are
+rounded half-up to the paisa, values bind directly as SQLite parameters and
+format like a rupee amount, so f'₹{balance:,.2f}' keeps working.
+"""
+import sqlite3
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from functools import total_ordering
+
+PAISE_PER_RUPEE = 100
+
+
+def _round_paise(value):
+    return int(value.quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def _decimal(value):
+    # str() first so 0.1 means one tenth, not the nearest binary float
+    return value if isinstance(value, Decimal) else Decimal(str(value))
+
+
+@total_ordering
+class Money:
+    __slots__ = ('paise',)
+
+    def __init__(self, paise=0):
+        if not isinstance(paise, int) or isinstance(paise, bool):
+            raise TypeError(f"Money takes whole paise, got {type(paise).__name__}")
+        object.__setattr__(self, 'paise', paise)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Money is immutable")
+
+    @classmethod
+    def from_rupees(cls, value):
+        """Money for a rupee amount (number or numeric string), rounded to the paisa.
+
+        Money passes through unchanged. Raises ValueError for anything that
+        isn't a number.
+        """
+        if isinstance(value, Money):
+            return value
+        try:
+            rupees = _decimal(value)
+        except (InvalidOperation, ValueError, TypeError):
+            raise ValueError(f"Not an amount: {value!r}") from None
+        if not rupees.is_finite():
+            raise ValueError(f"Not an amount: {value!r}")
+        return cls(_round_paise(rupees * PAISE_PER_RUPEE))
+
+    @property
+    def rupees(self):
+        """Exact rupee value as a Decimal"""
+        return Decimal(self.paise) / PAISE_PER_RUPEE
+
+    def percent(self, rate):
+        """rate percent of this amount, rounded half-up to the paisa"""
+        return Money(_round_paise(Decimal(self.paise) * _decimal(rate) / 100))
+
+    def __add__(self, other):
+        if isinstance(other, Money):
+            return Money(self.paise + other.paise)
+        return NotImplemented
+
+    def __radd__(self, other):
+        # Lets sum() start from its default 0
+        if other == 0:
+            return self
+        return NotImplemented
+
+    def __sub__(self, other):
+        if isinstance(other, Money):
+            return Money(self.paise - other.paise)
+        return NotImplemented
+
+    def __mul__(self, factor):
+        if isinstance(factor, Money):
+            return NotImplemented
+        return Money(_round_paise(Decimal(self.paise) * _decimal(factor)))
+
+    __rmul__ = __mul__
+
+    def __neg__(self):
+        return Money(-self.paise)
+
+    def __abs__(self):
+        return Money(abs(self.paise))
+
+    def __bool__(self):
+        return self.paise != 0
+
+    def __eq__(self, other):
+        if isinstance(other, Money):
+            return self.paise == other.paise
+        return NotImplemented
+
+    def __lt__(self, other):
+        if isinstance(other, Money):
+            return self.paise < other.paise
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.paise)
+
+    def __format__(self, spec):
+        # Formats like the rupee Decimal; two decimals by default
+        return format(self.rupees, spec or '.2f')
+
+    def __str__(self):
+        return format(self)
+
+    def __repr__(self):
+        return f"Money('{self}')"
+
+# Money can be passed straight to execute() and is stored as its paise
+sqlite3.register_adapter(Money, lambda money: money.paise)
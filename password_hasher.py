@@ -0,0 +1,142 @@
+# password_hasher.py
+"""Security code hashing off the calling thread.
+
+PBKDF2 is deliberately slow, so hashes run on a small worker pool with a
+bounded number of requests in flight. Login and registration then scale
+with cores instead of queueing behind one another.
+"""
+import hashlib
+import hmac
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from kivy.logger import Logger
+
+# Current PBKDF2-HMAC-SHA256 cost. Raising it is safe: each user's hash is
+# upgraded the next time they log in.
+KDF_ITERATIONS = 100000
+
+MAX_WORKERS = os.cpu_count() or 2
+QUEUE_SIZE = 64         # hashes waiting for a worker before callers are turned away
+QUEUE_TIMEOUT = 5.0     # seconds a caller waits for a queue slot
+
+# Android can't start worker processes; PBKDF2 releases the GIL, so threads
+# still use every core there
+USE_PROCESSES = 'ANDROID_ARGUMENT' not in os.environ
+
+
+class HasherBusy(Exception):
+    """The hashing queue stayed full for QUEUE_TIMEOUT"""
+
+
+def pbkdf2(code, salt, iterations):
+    """Hash code with salt (hex string or bytes) using PBKDF2-HMAC-SHA256."""
+    salt_bytes = bytes.fromhex(salt) if isinstance(salt, str) else salt
+    return hashlib.pbkdf2_hmac('sha256', code.encode('utf-8'), salt_bytes, iterations).hex()
+
+
+class PasswordHasher:
+    def __init__(self, workers=MAX_WORKERS, queue_size=QUEUE_SIZE, use_processes=USE_PROCESSES):
+        self.workers = workers
+        self.use_processes = use_processes
+        self._pool = None
+        self._slots = threading.BoundedSemaphore(workers + queue_size)
+        self._lock = threading.Lock()
+        self.hashes = 0
+        self.rejected = 0
+        self.in_flight = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.started = None
+
+    @property
+    def mode(self):
+        return 'process' if self.use_processes else 'thread'
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                if self.use_processes:
+                    try:
+                        self._pool = ProcessPoolExecutor(max_workers=self.workers)
+                    except (ImportError, OSError, NotImplementedError) as e:
+                        Logger.warning(f"PasswordHasher: Worker processes unavailable ({e}), using threads")
+                        self.use_processes = False
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='kdf')
+            return self._pool
+
+    def _fall_back_to_threads(self):
+        with self._lock:
+            Logger.warning("PasswordHasher: Worker processes died, using threads")
+            broken, self._pool = self._pool, None
+            self.use_processes = False
+        broken.shutdown(wait=False)
+
+    def hash(self, code, salt, iterations=KDF_ITERATIONS):
+        """Hash code on the worker pool; blocks the caller until it's done.
+
+        Raises HasherBusy if too many hashes are already waiting.
+        """
+        if not self._slots.acquire(timeout=QUEUE_TIMEOUT):
+            with self._lock:
+                self.rejected += 1
+            raise HasherBusy("Too many logins in progress")
+
+        started = time.perf_counter()
+        with self._lock:
+            self.in_flight += 1
+            if self.started is None:
+                self.started = started
+        try:
+            try:
+                digest = self._executor().submit(pbkdf2, code, salt, iterations).result()
+            except BrokenProcessPool:
+                self._fall_back_to_threads()
+                digest = self._executor().submit(pbkdf2, code, salt, iterations).result()
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.in_flight -= 1
+            self._slots.release()
+
+        with self._lock:
+            self.hashes += 1
+            self.total_time += elapsed
+            self.max_time = max(self.max_time, elapsed)
+        return digest
+
+    def verify(self, code, salt, stored_hash, iterations=KDF_ITERATIONS):
+        """Check code against stored_hash in constant time"""
+        return hmac.compare_digest(self.hash(code, salt, iterations), stored_hash)
+
+    @staticmethod
+    def needs_rehash(iterations):
+        """True when a hash was made with other parameters than the current ones"""
+        return iterations != KDF_ITERATIONS
+
+    def metrics(self):
+        """Throughput and latency of the hashes done so far, for diagnostics."""
+        with self._lock:
+            window = time.perf_counter() - self.started if self.started else 0.0
+            return {
+                'mode': self.mode,
+                'workers': self.workers,
+                'hashes': self.hashes,
+                'in_flight': self.in_flight,
+                'rejected': self.rejected,
+                'hashes_per_sec': self.hashes / window if window else 0.0,
+                'avg_ms': self.total_time * 1000 / self.hashes if self.hashes else 0.0,
+                'max_ms': self.max_time * 1000,
+            }
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+# Global instance
+password_hasher = PasswordHasher()
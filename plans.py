@@ -0,0 +1,135 @@
+# plans.py
+"""Investment plan catalog.
+
+The plans table is the single source of truth for plan terms. The catalog
+loads it once into immutable Plan records with every figure precomputed
+(daily return and total payout for each offered amount), so the plan
+screen, Database.add_investment and UPI activation all quote the same
+numbers without redoing the math. Every read first compares a
+trigger-maintained version number with the cached one (a single
+primary-key lookup), so changes made through any connection or process
+are picked up before the next quote. Reads take the caller's connection,
+so they see the same database and transaction as the code asking.
+"""
+import json
+import threading
+from contextlib import nullcontext
+from decimal import Decimal
+from typing import NamedTuple
+from kivy.logger import Logger
+
+from db_connection import connection_pool
+from money import Money
+from queries import CATALOG_VERSION
+
+# Plans a new database is seeded with; amounts in rupees, return_rate in percent per day
+DEFAULT_PLANS = {
+    1: {'name': 'Starter Plan', 'amounts': [599, 1099], 'return_rate': 4, 'days': 80, 'color': '#3b82f6'},
+    2: {'name': 'Growth Plan', 'amounts': [1799, 3050], 'return_rate': 4, 'days': 110, 'color': '#8b5cf6'},
+    3: {'name': 'Premium Plan', 'amounts': [10000, 20000], 'return_rate': 5, 'days': 150, 'color': '#ef4444'},
+}
+
+
+def rate_to_bp(return_rate):
+    """Percent per day as stored: whole basis points (4% -> 400)"""
+    return int(Decimal(str(return_rate)) * 100)
+
+
+class PlanOption(NamedTuple):
+    amount: Money
+    daily_return: Money
+    total_payout: Money
+
+
+class Plan(NamedTuple):
+    id: int
+    name: str
+    return_rate: Decimal        # percent per day
+    days: int
+    color: str
+    active: bool
+    options: tuple              # PlanOption for each offered amount
+
+    def quote(self, amount):
+        """Terms for investing amount; precomputed for the offered amounts"""
+        amount = Money.from_rupees(amount)
+        for option in self.options:
+            if option.amount == amount:
+                return option
+        return _option(amount, self.return_rate, self.days)
+
+
+def _option(amount, return_rate, days):
+    daily_return = amount.percent(return_rate)
+    return PlanOption(amount, daily_return, amount + daily_return * days)
+
+
+class PlanCatalog:
+    def __init__(self):
+        self._catalogs = {}     # database file -> (version, {plan_id: Plan})
+        self._lock = threading.Lock()
+
+    def _load(self, conn):
+        with self._lock:
+            database, version = conn.execute(CATALOG_VERSION).fetchone()
+            plans = {}
+            for plan_id, name, rate_bp, days, amounts, color, active in conn.execute(
+                'SELECT id, name, daily_rate_bp, days, amounts, color, active FROM plans ORDER BY id'
+            ):
+                return_rate = Decimal(rate_bp) / 100
+                options = tuple(_option(Money(paise), return_rate, days) for paise in json.loads(amounts))
+                plans[plan_id] = Plan(plan_id, name, return_rate, days, color, bool(active), options)
+            self._catalogs[database] = (version, plans)
+        Logger.info(f"PlanCatalog: Loaded {len(plans)} plans (version {version})")
+        return plans
+
+    def _catalog(self, conn=None):
+        """conn's plans, reloaded first if its plans table has changed"""
+        conn = conn or connection_pool.get()
+        database, version = conn.execute(CATALOG_VERSION).fetchone()
+        cached = self._catalogs.get(database)
+        if cached is None or cached[0] != version:
+            return self._load(conn)
+        return cached[1]
+
+    def get(self, plan_id, conn=None):
+        """The Plan with plan_id, or None; retired plans are still found.
+
+        conn is the connection to read through, the pool's default
+        database when not given.
+        """
+        return self._catalog(conn).get(plan_id)
+
+    def all(self, conn=None):
+        """Plans currently offered, in id order"""
+        return [plan for plan in self._catalog(conn).values() if plan.active]
+
+    def invalidate(self):
+        """Drop the cached plans; the next read reloads them"""
+        with self._lock:
+            self._catalogs.clear()
+
+    def refresh(self, conn=None):
+        """Reload now if the plans table changed since the catalog was loaded"""
+        self._catalog(conn)
+
+    def save(self, plan_id, name, amounts, return_rate, days, color, active=True, conn=None):
+        """Add or change a plan; amounts in rupees, return_rate in percent per day.
+
+        Investments already made keep the terms they were made with. With
+        conn the write joins the caller's transaction; without it, it is
+        committed on the pool's default database.
+        """
+        amounts = json.dumps([Money.from_rupees(amount).paise for amount in amounts])
+        with (nullcontext(conn) if conn is not None else connection_pool.connection()) as conn:
+            conn.execute('''
+                INSERT INTO plans (id, name, daily_rate_bp, days, amounts, color, active)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (id) DO UPDATE SET
+                    name = excluded.name, daily_rate_bp = excluded.daily_rate_bp, days = excluded.days,
+                    amounts = excluded.amounts, color = excluded.color, active = excluded.active
+            ''', (plan_id, name, rate_to_bp(return_rate), days, amounts, color, int(active)))
+        self.invalidate()
+
+# Global instance
+plan_catalog = PlanCatalog()
@@ -0,0 +1,79 @@
+# projections.py
+"""Forward projection of what active investments still have to be paid.
+
+An active investment pays its daily_return on each of its days_remaining
+next accrual days, so day d of the horizon owes the daily returns of every
+investment with days_remaining > d. Bucketed by days_remaining that is a
+reverse cumulative sum: numpy.bincount folds the buckets onto days and
+numpy.cumsum turns them into curves, so the work is proportional to the
+number of buckets and the horizon, never to investments times days.
+Amounts stay in integer paise throughout.
+"""
+from datetime import timedelta
+
+import numpy as np
+
+from money import Money
+
+
+def _owed_per_day(days, weights, horizon, groups=None, n_groups=1):
+    """Paise owed on each day 0..horizon-1, one row per group"""
+    index = np.minimum(days, horizon)
+    if groups is not None:
+        index = groups * (horizon + 1) + index
+    # Weights are whole paise; float64 holds them exactly up to 2**53
+    ending = np.bincount(index, weights=weights, minlength=n_groups * (horizon + 1))
+    ending = np.rint(ending).astype(np.int64).reshape(n_groups, horizon + 1)
+    # What is still paying on day d is everything that stops paying after d
+    return np.cumsum(ending[:, ::-1], axis=1)[:, ::-1][:, 1:]
+
+
+def project_liabilities(buckets, horizon, start):
+    """Project payouts for the next horizon accrual days, day 0 being start.
+
+    buckets are (plan_id, days_remaining, daily_return_paise, amount_paise,
+    investments) rows, already summed per plan and days_remaining. Returns
+    a dict of per-day paise arrays (daily, cumulative, per plan, maturity
+    calendar) plus Money totals.
+    """
+    horizon = max(int(horizon), 1)
+    if buckets:
+        plan_ids, days, daily_returns, principal, counts = (np.array(column, dtype=np.int64) for column in zip(*buckets))
+    else:
+        plan_ids = days = daily_returns = principal = counts = np.zeros(0, dtype=np.int64)
+
+    daily = _owed_per_day(days, daily_returns, horizon)[0]
+
+    plans, plan_index = np.unique(plan_ids, return_inverse=True)
+    by_plan_daily = _owed_per_day(days, daily_returns, horizon, plan_index, len(plans))
+    by_plan = {
+        int(plan_id): {
+            'daily': by_plan_daily[i],
+            'total': Money(int(by_plan_daily[i].sum())),
+            'outstanding': Money(int(np.dot(daily_returns[plan_index == i], days[plan_index == i]))),
+            'investments': int(counts[plan_index == i].sum()),
+        }
+        for i, plan_id in enumerate(plans)
+    }
+
+    # An investment's last payout is on day days_remaining - 1
+    maturing = days <= horizon
+    last_day = days[maturing] - 1
+    maturities = np.bincount(last_day, weights=counts[maturing], minlength=horizon).astype(np.int64)
+    maturing_principal = np.rint(
+        np.bincount(last_day, weights=principal[maturing], minlength=horizon)
+    ).astype(np.int64)
+
+    return {
+        'start': start,
+        'horizon': horizon,
+        'dates': [start + timedelta(days=d) for d in range(horizon)],
+        'daily': daily,
+        'cumulative': np.cumsum(daily),
+        'total': Money(int(daily.sum())),
+        'outstanding': Money(int(np.dot(daily_returns, days))),
+        'investments': int(counts.sum()),
+        'by_plan': by_plan,
+        'maturities': maturities,
+        'maturing_principal': maturing_principal,
+    }
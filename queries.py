@@ -0,0 +1,92 @@
+# queries.py
+"""SQL for the hot read paths.
+
+The modules that run these queries and schema.HOT_QUERIES, which checks
+their query plans against the current indexes, both import them from
+here, so the plan check always covers the SQL that actually runs.
+"""
+
+# database.py: login and registration
+LOGIN_LOOKUP = 'SELECT id, security_code_hash, salt, kdf_iterations FROM users WHERE phone_index = ?'
+LOGIN_LOOKUP_UNINDEXED = (
+    'SELECT id, security_code_hash, salt, kdf_iterations FROM users WHERE phone = ? AND phone_index IS NULL')
+PHONE_REGISTERED = 'SELECT id FROM users WHERE phone_index = ?'
+PHONE_INDEX_BACKLOG = 'SELECT id, phone FROM users WHERE id > ? AND phone_index IS NULL ORDER BY id LIMIT ?'
+
+# database.py: a user's own investments, transactions and withdrawals
+ACTIVE_INVESTMENTS = '''
+    SELECT * FROM investments
+    WHERE user_id = ? AND status = 'active'
+    ORDER BY created_at DESC
+'''
+USER_TRANSACTIONS = '''
+    SELECT id, user_id, type, amount, description, status, created_at,
+           bank_details_encrypted
+    FROM transactions
+    WHERE user_id = ?
+    ORDER BY created_at DESC
+    LIMIT ?
+'''
+PENDING_WITHDRAWAL_FOR_AMOUNT = '''
+    SELECT id FROM withdrawal_requests
+    WHERE user_id = ? AND amount = ? AND status = 'pending'
+    ORDER BY created_at DESC LIMIT 1
+'''
+USER_PENDING_WITHDRAWALS = '''
+    SELECT * FROM withdrawal_requests
+    WHERE user_id = ? AND status = 'pending'
+    ORDER BY created_at DESC
+'''
+
+# database.py: admin views
+ALL_PENDING_WITHDRAWALS = '''
+    SELECT w.id, w.user_id, w.amount, w.bank_details_encrypted, w.created_at, u.phone
+    FROM withdrawal_requests w
+    JOIN users u ON w.user_id = u.id
+    WHERE w.status = 'pending'
+    ORDER BY w.created_at ASC
+'''
+_USERS_PAGE = 'SELECT id, phone, wallet_balance, referral_code, created_at FROM users'
+USERS_PAGE_FIRST = _USERS_PAGE + ' ORDER BY created_at DESC, id DESC LIMIT ?'
+USERS_PAGE_AFTER = _USERS_PAGE + ' WHERE (created_at, id) < (?, ?) ORDER BY created_at DESC, id DESC LIMIT ?'
+USERS_SEARCH = _USERS_PAGE + ' WHERE referral_code = ? OR id = ? ORDER BY created_at DESC, id DESC LIMIT ?'
+
+
+def ledger_page(conditions):
+    """One page of the transaction ledger, filtered by the ANDed conditions."""
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    return f'''
+        SELECT t.id, t.user_id, t.type, t.amount, t.description, t.status,
+               t.bank_details_encrypted, t.created_at, u.phone
+        FROM transactions t
+        JOIN users u ON t.user_id = u.id
+        {where}
+        ORDER BY t.created_at DESC, t.id DESC
+        LIMIT ?
+    '''
+
+
+# ledger.py: statements
+STATEMENT_CHECKPOINT = '''
+    SELECT period, balance FROM ledger_checkpoints
+    WHERE account_id = ? AND period <= ? ORDER BY period DESC LIMIT 1
+'''
+STATEMENT_POSTINGS_TOTAL = '''
+    SELECT COALESCE(SUM(amount), 0) FROM ledger_postings
+    WHERE account_id = ? AND created_at >= ? AND created_at < ?
+'''
+STATEMENT_ENTRIES = '''
+    SELECT p.created_at, j.kind, j.description, p.amount
+    FROM ledger_postings p JOIN ledger_journal j ON j.id = p.journal_id
+    WHERE p.account_id = ? AND p.created_at >= ? AND p.created_at < ?
+    ORDER BY p.created_at, p.id
+'''
+
+# plans.py: the catalog's version and which database file it lives in, in one lookup
+CATALOG_VERSION = '''
+    SELECT (SELECT file FROM pragma_database_list WHERE name = 'main'), version
+    FROM plan_catalog WHERE id = 1
+'''
+
+# auto_payment.py
+PAYMENT_INTENT_STATUS = 'SELECT status FROM payment_intents WHERE transaction_id = ?'
@@ -0,0 +1,183 @@
+# rate_limiter.py
+"""Sliding-window rate limiting with pluggable storage.
+
+Each (scope, key) pair keeps just three numbers: the start of the current
+window, the attempts in it and the attempts in the previous one. Checks are
+O(1) and the previous window's count is weighted by how much of it still
+overlaps the sliding window.
+"""
+import sys
+import threading
+import time
+from collections import OrderedDict
+from kivy.logger import Logger
+
+from db_connection import connect, connection_pool
+
+MAX_KEYS = 10000       # per scope in memory; least recently used keys go first
+PURGE_EVERY = 500      # SQLite backend sweeps expired rows every N checks
+
+
+def _slide(state, limit, window, now):
+    """Apply one attempt to state [window_start, count, prev_count] in place.
+
+    Returns (allowed, retry_after_seconds). Blocked attempts aren't counted.
+    """
+    elapsed = now - state[0]
+    if elapsed >= 2 * window:
+        state[:] = [now, 0, 0]
+    elif elapsed >= window:
+        state[:] = [state[0] + window, 0, state[1]]
+
+    start, count, prev = state
+    estimate = prev * (1 - (now - start) / window) + count
+    if estimate < limit:
+        state[1] += 1
+        return True, 0.0
+
+    if count >= limit:
+        # Wait for the next window, then for this one's weight to drop enough
+        retry_after = start + window - now + window * (1 - limit / count)
+    else:
+        retry_after = start + window * (1 - (limit - count) / prev) - now
+    return False, max(retry_after, 0.0)
+
+
+def _expired(state, window, now):
+    return now - state[0] >= 2 * window
+
+
+class MemoryBackend:
+    """Per-process store with LRU eviction and lazy expiry"""
+
+    def __init__(self, max_keys=MAX_KEYS):
+        self.max_keys = max_keys
+        self._scopes = {}  # scope -> (window, OrderedDict key -> state)
+        self._lock = threading.Lock()
+        self.evicted = 0
+        self.expired = 0
+
+    def hit(self, scope, key, limit, window, now):
+        with self._lock:
+            entries = self._scopes.setdefault(scope, (window, OrderedDict()))[1]
+
+            # Least recently used first, so expired keys collect at the front
+            while entries:
+                oldest = next(iter(entries.values()))
+                if not _expired(oldest, window, now):
+                    break
+                entries.popitem(last=False)
+                self.expired += 1
+
+            state = entries.get(key)
+            if state is None:
+                state = entries[key] = [now, 0, 0]
+                if len(entries) > self.max_keys:
+                    entries.popitem(last=False)
+                    self.evicted += 1
+            else:
+                entries.move_to_end(key)
+            return _slide(state, limit, window, now)
+
+    def reset(self, scope, key):
+        with self._lock:
+            self._scopes.get(scope, (None, {}))[1].pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            keys = sum(len(entries) for _, entries in self._scopes.values())
+            size = sum(
+                sys.getsizeof(entries) + sum(sys.getsizeof(k) + sys.getsizeof(s) for k, s in entries.items())
+                for _, entries in self._scopes.values()
+            )
+            return {
+                'backend': 'memory',
+                'scopes': len(self._scopes),
+                'keys': keys,
+                'approx_bytes': size,
+                'evicted': self.evicted,
+                'expired': self.expired,
+            }
+
+
+class SQLiteBackend:
+    """Store shared by every process using the same database file"""
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or connection_pool.default_path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._checks = 0
+
+    def _conn(self):
+        # Private autocommit connections, so a check never commits or joins
+        # a transaction the calling thread has open on its pooled connection
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = connect(self.db_path, isolation_level=None, check_same_thread=False)
+        return conn
+
+    def hit(self, scope, key, limit, window, now):
+        with self._lock:
+            self._checks += 1
+            purge = self._checks % PURGE_EVERY == 0
+
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT window_start, count, prev_count FROM rate_limits WHERE scope = ? AND key = ?',
+                (scope, key)
+            ).fetchone()
+            state = list(row) if row else [now, 0, 0]
+            result = _slide(state, limit, window, now)
+            conn.execute('INSERT OR REPLACE INTO rate_limits VALUES (?, ?, ?, ?, ?)', (scope, key, *state))
+            if purge:
+                conn.execute('DELETE FROM rate_limits WHERE scope = ? AND window_start < ?',
+                             (scope, now - 2 * window))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return result
+
+    def reset(self, scope, key):
+        self._conn().execute('DELETE FROM rate_limits WHERE scope = ? AND key = ?', (scope, key))
+
+    def stats(self):
+        keys, scopes = self._conn().execute('SELECT COUNT(*), COUNT(DISTINCT scope) FROM rate_limits').fetchone()
+        return {'backend': 'sqlite', 'scopes': scopes, 'keys': keys}
+
+
+class RateLimiter:
+    def __init__(self, backend=None):
+        self.backend = backend or MemoryBackend()
+        self._lock = threading.Lock()
+        self.checks = 0
+        self.blocked = 0
+
+    def use(self, backend):
+        """Switch storage, e.g. to SQLiteBackend when several processes share a database"""
+        self.backend = backend
+        Logger.info(f"RateLimiter: Using {type(backend).__name__}")
+
+    def check(self, scope, key, limit, window):
+        """Record an attempt; returns (allowed, retry_after_seconds)"""
+        allowed, retry_after = self.backend.hit(scope, key, limit, window, time.time())
+        with self._lock:
+            self.checks += 1
+            if not allowed:
+                self.blocked += 1
+        return allowed, retry_after
+
+    def reset(self, scope, key):
+        self.backend.reset(scope, key)
+
+    def stats(self):
+        """Check counters plus the backend's storage stats, for diagnostics."""
+        with self._lock:
+            counters = {'checks': self.checks, 'blocked': self.blocked}
+        return dict(self.backend.stats(), **counters)
+
+# Global instance
+rate_limiter = RateLimiter()
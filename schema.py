@@ -0,0 +1,591 @@
+# schema.py
+"""Versioned schema for the Invest Kar database.
+
+All DDL lives here. Each migration moves the database one version forward
+and the current version is recorded in SQLite's user_version, so startup
+only does work when the stored version is behind SCHEMA_VERSION.
+"""
+import json
+import re
+from kivy.logger import Logger
+
+from ledger import SYSTEM_ACCOUNTS, OPENING
+from plans import DEFAULT_PLANS, rate_to_bp
+import queries
+
+# Tables the app cannot run without
+REQUIRED_TABLES = ['users', 'investments', 'transactions', 'withdrawal_requests', 'payment_intents', 'otp_store']
+
+# Ciphertext columns; Database.migrate_encryption fills them from the plaintext ones
+ENCRYPTED_COLUMNS = [
+    ('users', 'phone_encrypted'),
+    ('transactions', 'bank_details_encrypted'),
+    ('withdrawal_requests', 'bank_details_encrypted'),
+]
+
+# Aggregates materialized in platform_stats for the admin dashboard.
+# The triggers below keep them current; these queries are only run to seed
+# the table and by the periodic reconciliation.
+PLATFORM_STATS = {
+    'total_users': 'SELECT COUNT(*) FROM users',
+    'total_investments': 'SELECT COUNT(*) FROM investments',
+    'active_investments': "SELECT COUNT(*) FROM investments WHERE status = 'active'",
+    'total_investment_amount': 'SELECT COALESCE(SUM(amount), 0) FROM investments',
+    'total_returns_paid': "SELECT COALESCE(SUM(amount), 0) FROM transactions WHERE type = 'return'",
+    'total_withdrawals': "SELECT COALESCE(SUM(amount), 0) FROM transactions WHERE type = 'withdrawal'",
+    'total_wallet_balance': 'SELECT COALESCE(SUM(wallet_balance), 0) FROM users',
+}
+
+STATS_TRIGGERS = {
+    'trg_stats_users_insert': '''
+        CREATE TRIGGER IF NOT EXISTS trg_stats_users_insert AFTER INSERT ON users
+        BEGIN
+            UPDATE platform_stats SET value = value + CASE name
+                WHEN 'total_users' THEN 1
+                ELSE COALESCE(NEW.wallet_balance, 0) END
+            WHERE name IN ('total_users', 'total_wallet_balance');
+        END
+    ''',
+    'trg_stats_users_delete': '''
+        CREATE TRIGGER IF NOT EXISTS trg_stats_users_delete AFTER DELETE ON users
+        BEGIN
+            UPDATE platform_stats SET value = value - CASE name
+                WHEN 'total_users' THEN 1
+                ELSE COALESCE(OLD.wallet_balance, 0) END
+            WHERE name IN ('total_users', 'total_wallet_balance');
+        END
+    ''',
+    'trg_stats_users_wallet': '''
+        CREATE TRIGGER IF NOT EXISTS trg_stats_users_wallet AFTER UPDATE OF wallet_balance ON users
+        BEGIN
+            UPDATE platform_stats
+            SET value = value + COALESCE(NEW.wallet_balance, 0) - COALESCE(OLD.wallet_balance, 0)
+            WHERE name = 'total_wallet_balance';
+        END
+    ''',
+    'trg_stats_investments_insert': '''
+        CREATE TRIGGER IF NOT EXISTS trg_stats_investments_insert AFTER INSERT ON investments
+        BEGIN
+            UPDATE platform_stats SET value = value + CASE name
+                WHEN 'total_investments' THEN 1
+                WHEN 'active_investments' THEN NEW.status = 'active'
+                ELSE COALESCE(NEW.amount, 0) END
+            WHERE name IN ('total_investments', 'active_investments', 'total_investment_amount');
+        END
+    ''',
+    'trg_stats_investments_delete': '''
+        CREATE TRIGGER IF NOT EXISTS trg_stats_investments_delete AFTER DELETE ON investments
+        BEGIN
+            UPDATE platform_stats SET value = value - CASE name
+                WHEN 'total_investments' THEN 1
+                WHEN 'active_investments' THEN OLD.status = 'active'
+                ELSE COALESCE(OLD.amount, 0) END
+            WHERE name IN ('total_investments', 'active_investments', 'total_investment_amount');
+        END
+    ''',
+    'trg_stats_investments_update': '''
+        CREATE TRIGGER IF NOT EXISTS trg_stats_investments_update AFTER UPDATE OF status, amount ON investments
+        BEGIN
+            UPDATE platform_stats SET value = value + CASE name
+                WHEN 'active_investments' THEN (NEW.status = 'active') - (OLD.status = 'active')
+                ELSE COALESCE(NEW.amount, 0) - COALESCE(OLD.amount, 0) END
+            WHERE name IN ('active_investments', 'total_investment_amount');
+        END
+    ''',
+    'trg_stats_transactions_insert': '''
+        CREATE TRIGGER IF NOT EXISTS trg_stats_transactions_insert AFTER INSERT ON transactions
+        WHEN NEW.type IN ('return', 'withdrawal')
+        BEGIN
+            UPDATE platform_stats SET value = value + COALESCE(NEW.amount, 0)
+            WHERE name = CASE NEW.type WHEN 'return' THEN 'total_returns_paid' ELSE 'total_withdrawals' END;
+        END
+    ''',
+    'trg_stats_transactions_delete': '''
+        CREATE TRIGGER IF NOT EXISTS trg_stats_transactions_delete AFTER DELETE ON transactions
+        WHEN OLD.type IN ('return', 'withdrawal')
+        BEGIN
+            UPDATE platform_stats SET value = value - COALESCE(OLD.amount, 0)
+            WHERE name = CASE OLD.type WHEN 'return' THEN 'total_returns_paid' ELSE 'total_withdrawals' END;
+        END
+    ''',
+}
+
+# Keep the ledger's running totals: every posting moves its account's balance
+# and, for wallet accounts, the user's cached wallet_balance
+LEDGER_TRIGGERS = {
+    'trg_ledger_postings_insert': '''
+        CREATE TRIGGER IF NOT EXISTS trg_ledger_postings_insert AFTER INSERT ON ledger_postings
+        BEGIN
+            UPDATE ledger_accounts SET balance = balance + NEW.amount, last_posting_id = NEW.id
+            WHERE id = NEW.account_id;
+            UPDATE users SET wallet_balance = wallet_balance + NEW.amount
+            WHERE id = (SELECT user_id FROM ledger_accounts WHERE id = NEW.account_id);
+        END
+    ''',
+    'trg_ledger_postings_no_update': '''
+        CREATE TRIGGER IF NOT EXISTS trg_ledger_postings_no_update BEFORE UPDATE ON ledger_postings
+        BEGIN
+            SELECT RAISE(ABORT, 'ledger postings are append-only');
+        END
+    ''',
+    'trg_ledger_postings_no_delete': '''
+        CREATE TRIGGER IF NOT EXISTS trg_ledger_postings_no_delete BEFORE DELETE ON ledger_postings
+        BEGIN
+            SELECT RAISE(ABORT, 'ledger postings are append-only');
+        END
+    ''',
+    'trg_ledger_wallet_account': '''
+        CREATE TRIGGER IF NOT EXISTS trg_ledger_wallet_account AFTER INSERT ON users
+        BEGIN
+            INSERT INTO ledger_accounts (code, kind, user_id) VALUES ('wallet:' || NEW.id, 'wallet', NEW.id);
+        END
+    ''',
+}
+
+
+def _open_ledger(conn):
+    """Give every user a wallet account and carry their balance over as an opening entry"""
+    conn.executemany(
+        "INSERT INTO ledger_accounts (id, code, kind) VALUES (?, ?, 'system')", SYSTEM_ACCOUNTS
+    )
+    conn.execute("INSERT INTO ledger_accounts (code, kind, user_id) SELECT 'wallet:' || id, 'wallet', id FROM users")
+
+    journal_id = conn.execute(
+        "INSERT INTO ledger_journal (kind, description) VALUES ('opening', 'Opening balances')"
+    ).lastrowid
+    conn.execute('''
+        INSERT INTO ledger_postings (journal_id, account_id, amount)
+        SELECT ?, a.id, u.wallet_balance FROM users u JOIN ledger_accounts a ON a.user_id = u.id
+        WHERE u.wallet_balance != 0
+    ''', (journal_id,))
+    conn.execute('''
+        INSERT INTO ledger_postings (journal_id, account_id, amount)
+        SELECT ?, id, -(SELECT COALESCE(SUM(amount), 0) FROM ledger_postings WHERE journal_id = ?)
+        FROM ledger_accounts WHERE code = ?
+    ''', (journal_id, journal_id, OPENING))
+
+    # The triggers come after this, so the totals are set here once
+    conn.execute('''
+        UPDATE ledger_accounts SET balance = total.amount, verified_balance = total.amount, last_posting_id = total.last_id
+        FROM (SELECT account_id, SUM(amount) AS amount, MAX(id) AS last_id FROM ledger_postings GROUP BY account_id) AS total
+        WHERE ledger_accounts.id = total.account_id
+    ''')
+    conn.execute('INSERT INTO ledger_audit (id, last_posting_id) SELECT 1, COALESCE(MAX(id), 0) FROM ledger_postings')
+
+
+# Any change to the plans table bumps the catalog version, so cached
+# catalogs can tell they are stale with a single row read
+PLAN_TRIGGERS = {
+    f'trg_plans_version_{event.lower()}': f'''
+        CREATE TRIGGER IF NOT EXISTS trg_plans_version_{event.lower()} AFTER {event} ON plans
+        BEGIN
+            UPDATE plan_catalog SET version = version + 1 WHERE id = 1;
+        END
+    '''
+    for event in ('INSERT', 'UPDATE', 'DELETE')
+}
+
+
+def _seed_plans(conn):
+    conn.execute('INSERT INTO plan_catalog (id, version) VALUES (1, 1)')
+    conn.executemany(
+        'INSERT INTO plans (id, name, daily_rate_bp, days, amounts, color) VALUES (?, ?, ?, ?, ?, ?)',
+        [
+            (plan_id, plan['name'], rate_to_bp(plan['return_rate']), plan['days'],
+             json.dumps([amount * 100 for amount in plan['amounts']]), plan['color'])
+            for plan_id, plan in DEFAULT_PLANS.items()
+        ]
+    )
+
+# Amounts stored as integer paise (see money.py), per table
+MONEY_COLUMNS = {
+    'users': ['wallet_balance'],
+    'investments': ['amount', 'daily_return', 'total_profit'],
+    'transactions': ['amount'],
+    'withdrawal_requests': ['amount'],
+    'payment_intents': ['amount'],
+    'ledger_accounts': ['balance', 'verified_balance'],
+    'ledger_postings': ['amount'],
+    'ledger_checkpoints': ['balance'],
+}
+
+
+def _store_money_as_paise(conn):
+    """Rebuild every table with money columns as INTEGER paise.
+
+    SQLite can't change a column's type in place, so each table is copied
+    into a new one created from its own stored DDL (keeping columns added
+    by later ALTERs), then swapped in. Triggers reference these tables and
+    would block the renames, so they are dropped first and recreated last.
+    """
+    for name in (*STATS_TRIGGERS, *LEDGER_TRIGGERS):
+        conn.execute(f'DROP TRIGGER IF EXISTS {name}')
+
+    for table, columns in MONEY_COLUMNS.items():
+        create_sql = conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+        ).fetchone()[0]
+        indexes = [sql for (sql,) in conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (table,)
+        )]
+        sequence = conn.execute('SELECT seq FROM sqlite_sequence WHERE name = ?', (table,)).fetchone()
+        names = [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+
+        create_sql = re.sub(rf'^(CREATE TABLE (?:IF NOT EXISTS )?){table}\b', rf'\g<1>{table}_paise', create_sql)
+        for column in columns:
+            create_sql = re.sub(rf'\b{column}(\s+)REAL\b', rf'{column}\g<1>INTEGER', create_sql)
+        conn.execute(create_sql)
+
+        values = ', '.join(
+            f'CAST(ROUND({name} * 100) AS INTEGER)' if name in columns else name for name in names
+        )
+        conn.execute(f"INSERT INTO {table}_paise ({', '.join(names)}) SELECT {values} FROM {table}")
+        conn.execute(f'DROP TABLE {table}')
+        conn.execute(f'ALTER TABLE {table}_paise RENAME TO {table}')
+        for sql in indexes:
+            conn.execute(sql)
+        if sequence:
+            # Keep AUTOINCREMENT from reusing the ids of deleted rows
+            conn.execute('UPDATE sqlite_sequence SET seq = ? WHERE name = ?', (sequence[0], table))
+
+    # Counts and paise totals are both whole numbers now; recompute them exactly
+    conn.execute('DROP TABLE platform_stats')
+    conn.execute('CREATE TABLE platform_stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL DEFAULT 0)')
+    _seed_platform_stats(conn)
+
+    for sql in (*STATS_TRIGGERS.values(), *LEDGER_TRIGGERS.values()):
+        conn.execute(sql)
+
+
+def _add_encrypted_columns(conn):
+    # Tables created before encryption only have the plaintext columns
+    for table, column in ENCRYPTED_COLUMNS:
+        if column not in [col[1] for col in conn.execute(f'PRAGMA table_info({table})')]:
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} TEXT')
+
+
+def _seed_platform_stats(conn):
+    for name, query in PLATFORM_STATS.items():
+        conn.execute(
+            'INSERT OR REPLACE INTO platform_stats (name, value) VALUES (?, (' + query + '))', (name,)
+        )
+
+# (version, description, steps) - a step is a SQL statement or a callable taking the connection
+MIGRATIONS = [
+    (1, 'Base tables and indexes', [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            phone TEXT UNIQUE NOT NULL,
+            security_code_hash TEXT NOT NULL,
+            phone_encrypted TEXT,
+            salt TEXT NOT NULL,
+            wallet_balance REAL DEFAULT 0,
+            referral_code TEXT UNIQUE,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS investments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            plan_id INTEGER,
+            amount REAL,
+            daily_return REAL,
+            total_days INTEGER,
+            days_remaining INTEGER,
+            total_profit REAL DEFAULT 0,
+            status TEXT DEFAULT 'active',
+            payment_method TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            type TEXT,  -- investment, withdrawal, return, referral, withdrawal_payment
+            amount REAL,
+            description TEXT,
+            status TEXT DEFAULT 'completed',
+            bank_details_encrypted TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''',
+        # OTP storage table
+        '''
+        CREATE TABLE IF NOT EXISTS otp_store (
+            phone TEXT PRIMARY KEY,
+            otp TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS withdrawal_requests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            amount REAL,
+            bank_details_encrypted TEXT,
+            status TEXT DEFAULT 'pending',  -- pending, paid, completed, cancelled
+            payment_transaction_id TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''',
+        # Log for daily return processing to prevent multiple runs
+        '''
+        CREATE TABLE IF NOT EXISTS daily_run_log (
+            run_date TEXT PRIMARY KEY,
+            run_timestamp TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        # UPI payment intents awaiting verification
+        '''
+        CREATE TABLE IF NOT EXISTS payment_intents (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            transaction_id TEXT UNIQUE,
+            user_id INTEGER,
+            plan_id INTEGER,
+            amount REAL,
+            status TEXT DEFAULT 'pending',
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            verified_at TEXT,
+            verification_attempts INTEGER DEFAULT 0,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_users_phone ON users(phone)',
+        'CREATE INDEX IF NOT EXISTS idx_investments_user ON investments(user_id)',
+        'CREATE INDEX IF NOT EXISTS idx_transactions_user ON transactions(user_id)',
+        'CREATE INDEX IF NOT EXISTS idx_payment_intents_txn ON payment_intents(transaction_id)',
+    ]),
+    (2, 'Indexes for the hot lookup queries', [
+        # Superseded by the composite indexes below, or duplicates of UNIQUE autoindexes
+        'DROP INDEX IF EXISTS idx_users_phone',
+        'DROP INDEX IF EXISTS idx_investments_user',
+        'DROP INDEX IF EXISTS idx_transactions_user',
+        'DROP INDEX IF EXISTS idx_payment_intents_txn',
+        # The index below needs phone_encrypted, which older databases lack
+        _add_encrypted_columns,
+        # login_user / register_user look up by encrypted phone; covering for the login columns
+        'CREATE INDEX IF NOT EXISTS idx_users_phone_encrypted ON users(phone_encrypted, security_code_hash, salt)',
+        # get_active_investments: user_id + status, newest first
+        'CREATE INDEX IF NOT EXISTS idx_investments_user_status ON investments(user_id, status, created_at)',
+        # get_transactions: user_id, newest first
+        'CREATE INDEX IF NOT EXISTS idx_transactions_user_created ON transactions(user_id, created_at)',
+        # complete_withdrawal_after_payment / get_pending_withdrawals
+        'CREATE INDEX IF NOT EXISTS idx_withdrawals_user_status ON withdrawal_requests(user_id, status, amount, created_at)',
+        # get_all_pending_withdrawals: status, oldest first
+        'CREATE INDEX IF NOT EXISTS idx_withdrawals_status ON withdrawal_requests(status, created_at)',
+    ]),
+    (3, 'Materialized platform stats', [
+        '''
+        CREATE TABLE IF NOT EXISTS platform_stats (
+            name TEXT PRIMARY KEY,
+            value REAL NOT NULL DEFAULT 0
+        )
+        ''',
+        _seed_platform_stats,
+        *STATS_TRIGGERS.values(),
+    ]),
+    (4, 'Keyset pagination index for the admin user list', [
+        'CREATE INDEX IF NOT EXISTS idx_users_created ON users(created_at)',
+    ]),
+    (5, 'Keyset pagination indexes for the transaction ledger', [
+        'CREATE INDEX IF NOT EXISTS idx_transactions_created ON transactions(created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_transactions_type_created ON transactions(type, created_at)',
+    ]),
+    (6, 'Shared rate limiter state', [
+        '''
+        CREATE TABLE IF NOT EXISTS rate_limits (
+            scope TEXT NOT NULL,
+            key TEXT NOT NULL,
+            window_start REAL NOT NULL,
+            count INTEGER NOT NULL,
+            prev_count INTEGER NOT NULL,
+            PRIMARY KEY (scope, key)
+        ) WITHOUT ROWID
+        ''',
+    ]),
+    (7, 'Per-user KDF iterations for transparent re-hashing', [
+        # Every hash before this version was made with 100,000 iterations
+        'ALTER TABLE users ADD COLUMN kdf_iterations INTEGER NOT NULL DEFAULT 100000',
+        'DROP INDEX IF EXISTS idx_users_phone_encrypted',
+        # login_user reads the iteration count too; keep the lookup covering
+        'CREATE INDEX IF NOT EXISTS idx_users_phone_encrypted ON users(phone_encrypted, security_code_hash, salt, kdf_iterations)',
+    ]),
+    (8, 'Blind index for phone lookups', [
+        # Keyed HMAC of the phone; filled for new users on insert and for
+        # existing ones by Database.backfill_phone_index
+        'ALTER TABLE users ADD COLUMN phone_index TEXT',
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_users_phone_index ON users(phone_index)',
+        # Lookups no longer compare ciphertexts
+        'DROP INDEX IF EXISTS idx_users_phone_encrypted',
+    ]),
+    (9, 'Checkpoints for resumable data migrations', [
+        '''
+        CREATE TABLE IF NOT EXISTS migration_checkpoints (
+            name TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL DEFAULT 0,
+            rows_done INTEGER NOT NULL DEFAULT 0,
+            completed INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT
+        )
+        ''',
+    ]),
+    (10, 'Double-entry ledger for wallet balances', [
+        '''
+        CREATE TABLE IF NOT EXISTS ledger_accounts (
+            id INTEGER PRIMARY KEY,
+            code TEXT UNIQUE NOT NULL,
+            kind TEXT NOT NULL,                   -- system, wallet
+            user_id INTEGER UNIQUE,
+            balance REAL NOT NULL DEFAULT 0,      -- running total of the postings
+            verified_balance REAL NOT NULL DEFAULT 0,  -- postings summed by the last reconciliation
+            last_posting_id INTEGER
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS ledger_journal (
+            id INTEGER PRIMARY KEY,
+            kind TEXT NOT NULL,
+            description TEXT,
+            reference TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS ledger_postings (
+            id INTEGER PRIMARY KEY,
+            journal_id INTEGER NOT NULL REFERENCES ledger_journal (id),
+            account_id INTEGER NOT NULL REFERENCES ledger_accounts (id),
+            amount REAL NOT NULL,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_ledger_postings_account ON ledger_postings(account_id, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_ledger_postings_journal ON ledger_postings(journal_id)',
+        '''
+        CREATE TABLE IF NOT EXISTS ledger_audit (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            last_posting_id INTEGER NOT NULL DEFAULT 0,
+            verified_at TEXT
+        )
+        ''',
+        _open_ledger,
+        *LEDGER_TRIGGERS.values(),
+    ]),
+    (11, 'Monthly wallet balance checkpoints for statements', [
+        '''
+        CREATE TABLE IF NOT EXISTS ledger_checkpoints (
+            account_id INTEGER NOT NULL REFERENCES ledger_accounts (id),
+            period TEXT NOT NULL,                 -- first day of the month, YYYY-MM-DD
+            balance REAL NOT NULL,                -- balance before any posting of the period
+            PRIMARY KEY (account_id, period)
+        ) WITHOUT ROWID
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_ledger_checkpoints_period ON ledger_checkpoints(period)',
+    ]),
+    (12, 'Money as integer paise', [
+        _store_money_as_paise,
+    ]),
+    (13, 'Investment plan catalog', [
+        '''
+        CREATE TABLE IF NOT EXISTS plans (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            daily_rate_bp INTEGER NOT NULL,       -- daily return in basis points (400 = 4%)
+            days INTEGER NOT NULL,
+            amounts TEXT NOT NULL,                -- JSON list of offered amounts in paise
+            color TEXT,
+            active INTEGER NOT NULL DEFAULT 1
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS plan_catalog (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+        ''',
+        _seed_plans,
+        *PLAN_TRIGGERS.values(),
+    ]),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+# Hot queries that must never full-scan a table, with sample parameters.
+# The SQL is the same constant the running code executes.
+HOT_QUERIES = {
+    'login_user': (queries.LOGIN_LOOKUP, ('x',)),
+    'login_user_unindexed': (queries.LOGIN_LOOKUP_UNINDEXED, ('x',)),
+    'register_user': (queries.PHONE_REGISTERED, ('x',)),
+    'backfill_phone_index': (queries.PHONE_INDEX_BACKLOG, (0, 1000)),
+    'get_active_investments': (queries.ACTIVE_INVESTMENTS, (1,)),
+    'get_transactions': (queries.USER_TRANSACTIONS, (1, 20)),
+    'complete_withdrawal_after_payment': (queries.PENDING_WITHDRAWAL_FOR_AMOUNT, (1, 100)),
+    'get_pending_withdrawals': (queries.USER_PENDING_WITHDRAWALS, (1,)),
+    'get_all_pending_withdrawals': (queries.ALL_PENDING_WITHDRAWALS, ()),
+    'get_users_page': (queries.USERS_PAGE_AFTER, ('9999', 0, 50)),
+    'get_users_page_search': (queries.USERS_SEARCH, ('ABC123', 1, 50)),
+    'get_ledger_page': (queries.ledger_page(['(t.created_at, t.id) < (?, ?)']), ('9999', 0, 50)),
+    'get_ledger_page_by_type': (queries.ledger_page(['t.type = ?']), ('return', 50)),
+    'get_ledger_page_by_user': (queries.ledger_page(['t.user_id = ?']), (1, 50)),
+    'statement_checkpoint': (queries.STATEMENT_CHECKPOINT, (1, '2024-01-01')),
+    'statement_postings_total': (queries.STATEMENT_POSTINGS_TOTAL, (1, '2023-12-01', '2024-01-01')),
+    'statement_entries': (queries.STATEMENT_ENTRIES, (1, '2024-01-01', '2024-02-01')),
+    'plan_catalog_version': (queries.CATALOG_VERSION, ()),
+    'payment_intent_status': (queries.PAYMENT_INTENT_STATUS, ('x',)),
+}
+
+
+def get_version(conn):
+    """Schema version recorded in the database file."""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn):
+    """Bring the database up to SCHEMA_VERSION. Returns the resulting version."""
+    current = get_version(conn)
+    if current >= SCHEMA_VERSION:
+        return current
+
+    for version, description, steps in MIGRATIONS:
+        if version <= current:
+            continue
+        try:
+            conn.execute('BEGIN')
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(f'PRAGMA user_version = {version}')
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            Logger.error(f"Schema: Migration {version} ({description}) failed - {e}")
+            raise
+        Logger.info(f"Schema: Migrated to version {version} - {description}")
+        current = version
+    return current
+
+
+def find_full_scans(conn):
+    """Run EXPLAIN QUERY PLAN over HOT_QUERIES.
+
+    Returns {query_name: [plan detail, ...]} for every query whose plan
+    scans a table or index end to end instead of searching it. Virtual
+    tables such as pragma_database_list have no index to search.
+    """
+    offenders = {}
+    for name, (sql, params) in HOT_QUERIES.items():
+        plan = conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()
+        scans = [row[3] for row in plan if row[3].startswith('SCAN ')
+                 and row[3] != 'SCAN CONSTANT ROW' and ' VIRTUAL TABLE ' not in row[3]]
+        if scans:
+            offenders[name] = scans
+    return offenders
+
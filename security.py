@@ -1,29 +1,29 @@
 import secrets
 import hashlib
+import hmac
 from datetime import datetime, timedelta
+import math
 import time
 from functools import wraps
 
 from encryption import encryption
+from rate_limiter import rate_limiter
+from key_manager import key_manager
 
 def rate_limit(max_attempts=5, timeout=300):
-    """A decorator to rate-limit a function based on the 'phone' argument."""
+    """A decorator to rate-limit a function based on the 'phone' argument.
+
+    Allows max_attempts per sliding window of timeout seconds; the counts
+    live in rate_limiter's backend rather than in the decorator.
+    """
     def decorator(func):
-        attempts = {}
+        scope = func.__qualname__
         @wraps(func)
         def wrapper(self, phone, *args, **kwargs):
-            current_time = time.time()
-            if phone in attempts:
-                if attempts[phone]['count'] >= max_attempts:
-                    if current_time - attempts[phone]['first_attempt'] < timeout:
-                        # Raise an exception or return an error tuple
-                        return False, f"Too many attempts. Try again in {timeout/60:.0f} minutes."
-                    else: # Reset after timeout
-                        attempts[phone] = {'count': 1, 'first_attempt': current_time}
-                else:
-                    attempts[phone]['count'] += 1
-            else: # First attempt
-                attempts[phone] = {'count': 1, 'first_attempt': current_time}
+            allowed, retry_after = rate_limiter.check(scope, phone, max_attempts, timeout)
+            if not allowed:
+                # Raise an exception or return an error tuple
+                return False, f"Too many attempts. Try again in {math.ceil(retry_after / 60)} minutes."
             return func(self, phone, *args, **kwargs)
         return wrapper
     return decorator
@@ -44,6 +44,12 @@ class Security:
         """Validate Indian phone number"""
         return len(phone) == 10 and phone.isdigit() and phone[0] in '6789'
     
+    @staticmethod
+    def phone_index(phone):
+        """Keyed HMAC of a phone number, for equality lookups without decrypting"""
+        key = key_manager.get_key('phone_index')
+        return hmac.new(key, phone.strip().encode('utf-8'), hashlib.sha256).hexdigest()
+    
     @staticmethod
     def validate_amount(amount):
         """Validate investment amount"""
@@ -1,14 +1,323 @@
 # sms_service.py
 import requests
+from urllib3.exceptions import MaxRetryError
 import os
 import json
+import queue
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError, TimeoutError as FutureTimeout
 from kivy.logger import Logger
 
+FAST2SMS_URL = "https://www.fast2sms.com/dev/bulkV2"
+
+QUEUE_SIZE = 1000       # outbound messages waiting for a worker
+WORKERS = 4             # concurrent requests to the gateway
+MAX_ATTEMPTS = 4        # first try plus retries
+RETRY_BASE_DELAY = 0.5  # seconds; doubles after every failed attempt
+RETRY_MAX_DELAY = 8.0
+OTP_WAIT_TIMEOUT = 10   # how long send_otp waits for its message to go out
+
+BATCH_WINDOW = 2.0      # seconds a notification waits for others with the same text
+MAX_BATCH_SIZE = 200    # recipients per gateway request
+
+# Notification texts carry no per-user details, so everyone receiving the
+# same notification can share one multi-recipient request
+NOTIFICATION_TEMPLATES = {
+    'returns_credited': "Invest Kar: Your daily returns have been credited to your wallet.",
+    'withdrawal_completed': "Invest Kar: Your withdrawal has been completed and sent to your bank account.",
+}
+
+class SMSTransportError(Exception):
+    """A send the gateway did not accept, so retrying can't deliver twice (connect error, 5xx, rate limit)"""
+
+class Fast2SMSTransport:
+    """Fast2SMS bulkV2 API over a keep-alive HTTP session"""
+    
+    def __init__(self, api_key, sender_id='FSTSSM', timeout=10):
+        self.sender_id = sender_id
+        self.timeout = timeout
+        # One session shared by every worker, so TLS connections are reused
+        # instead of being set up again for each message
+        self.session = requests.Session()
+        self.session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=WORKERS))
+        self.session.headers.update({
+            'authorization': api_key,
+            'Content-Type': "application/json"
+        })
+    
+    def send(self, numbers, message, timeout=None):
+        payload = {
+            "sender_id": self.sender_id,
+            "message": message,
+            "route": "v3",
+            "numbers": ','.join(numbers)
+        }
+        
+        try:
+            response = self.session.post(FAST2SMS_URL, json=payload, timeout=min(timeout or self.timeout, self.timeout))
+        except requests.ConnectionError as e:
+            # requests wraps MaxRetryError when no connection could be made, so
+            # the gateway never saw the message. A read timeout or a connection
+            # dropped mid-request may have been delivered and is not retried.
+            if not (e.args and isinstance(e.args[0], MaxRetryError)):
+                raise
+            raise SMSTransportError(str(e)) from e
+        
+        if response.status_code == 429 or response.status_code >= 500:
+            raise SMSTransportError(f"HTTP {response.status_code}")
+        
+        result = response.json()
+        Logger.info(f"SMS Service: API Response - {result}")
+        return result
+
+class LocalTransport:
+    """Stand-in transport that records messages instead of sending them"""
+    
+    def __init__(self, fail_first=0):
+        self.sent = []
+        self.fail_first = fail_first  # simulate that many transient failures
+        self._lock = threading.Lock()
+    
+    def send(self, numbers, message, timeout=None):
+        with self._lock:
+            if self.fail_first > 0:
+                self.fail_first -= 1
+                raise SMSTransportError("simulated gateway failure")
+            self.sent.append((list(numbers), message))
+            request_id = f"local-{len(self.sent)}"
+        Logger.info(f"SMS Service: LOCAL - Would send to {','.join(numbers)}: {message}")
+        return {'return': True, 'request_id': request_id, 'demo': True}
+
+class SMSJob:
+    def __init__(self, numbers, message, timeout=None):
+        self.numbers = numbers
+        self.message = message
+        self.attempts = 0
+        self.queued_at = time.perf_counter()
+        # No attempt starts after the deadline or once the future is cancelled
+        self.deadline = self.queued_at + timeout if timeout is not None else None
+        self.future = Future()
+    
+    def remaining(self):
+        """Seconds left before the deadline, or None without one"""
+        return self.deadline - time.perf_counter() if self.deadline is not None else None
+
+class SMSBatcher:
+    """Coalesces identical messages sent within a short window into multi-recipient requests"""
+    
+    def __init__(self, service, window=BATCH_WINDOW, max_batch=MAX_BATCH_SIZE):
+        self.service = service
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = {}  # message -> (numbers, opened_at)
+        self._timers = {}
+        self._lock = threading.Lock()
+        self.stats = {'queued': 0, 'recipients': 0, 'batches': 0, 'failed_batches': 0,
+                      'total_latency': 0.0, 'max_latency': 0.0}
+    
+    def add(self, numbers, message):
+        """Add recipients for message to the open batch, opening one if needed"""
+        if isinstance(numbers, str):
+            numbers = [numbers]
+        with self._lock:
+            batch = self._pending.get(message)
+            if batch is None:
+                batch = self._pending[message] = ([], time.perf_counter())
+                timer = threading.Timer(self.window, self.flush, (message,))
+                timer.daemon = True
+                timer.start()
+                self._timers[message] = timer
+            batch[0].extend(numbers)
+            self.stats['queued'] += len(numbers)
+            full = len(batch[0]) >= self.max_batch
+        if full:
+            self.flush(message)
+    
+    def flush(self, message=None):
+        """Send the open batch for message now, or every open batch"""
+        with self._lock:
+            messages = [message] if message is not None else list(self._pending)
+            batches = [(m, self._pending.pop(m)) for m in messages if m in self._pending]
+            for m, _ in batches:
+                timer = self._timers.pop(m, None)
+                if timer:
+                    timer.cancel()
+        
+        for message, (numbers, opened_at) in batches:
+            numbers = list(dict.fromkeys(numbers))  # one copy per phone
+            for i in range(0, len(numbers), self.max_batch):
+                self._send(numbers[i:i + self.max_batch], message, opened_at)
+    
+    def _send(self, numbers, message, opened_at):
+        try:
+            future = self.service.send_async(numbers, message)
+        except Exception as e:
+            Logger.error(f"SMS Service: Dropped batch of {len(numbers)} - {e}")
+            with self._lock:
+                self.stats['failed_batches'] += 1
+            return
+        future.add_done_callback(lambda f: self._record(f, len(numbers), opened_at))
+    
+    def _record(self, future, size, opened_at):
+        # Latency runs from the first message joining the batch to the gateway's answer
+        latency = time.perf_counter() - opened_at
+        with self._lock:
+            self.stats['batches'] += 1
+            self.stats['recipients'] += size
+            if future.exception() is not None:
+                self.stats['failed_batches'] += 1
+            self.stats['total_latency'] += latency
+            self.stats['max_latency'] = max(self.stats['max_latency'], latency)
+        Logger.debug(f"SMS Service: Batch of {size} delivered in {latency * 1000:.0f}ms")
+    
+    def metrics(self):
+        """Batch sizes, API calls saved and per-batch latency, for diagnostics."""
+        with self._lock:
+            stats = self.stats
+            batches = stats['batches']
+            return {
+                'batches': batches,
+                'failed_batches': stats['failed_batches'],
+                'recipients': stats['recipients'],
+                'api_calls_saved': stats['recipients'] - batches,
+                'avg_batch_size': stats['recipients'] / batches if batches else 0.0,
+                'avg_latency_ms': stats['total_latency'] * 1000 / batches if batches else 0.0,
+                'max_latency_ms': stats['max_latency'] * 1000,
+                'pending': sum(len(numbers) for numbers, _ in self._pending.values()),
+            }
+
 class SMSService:
-    def __init__(self):
+    def __init__(self, transport=None, workers=WORKERS, queue_size=QUEUE_SIZE):
         # The API key is now set here. For production, use environment variables.
         self.api_key = os.environ.get('FAST2SMS_API_KEY')
         self.sender_id = 'FSTSSM'  # Fast2SMS default sender ID
+        if transport is None and self.api_key:
+            transport = Fast2SMSTransport(self.api_key, self.sender_id)
+        self.transport = transport
+        
+        self.workers = workers
+        self.queue = queue.Queue(maxsize=queue_size)
+        self._threads = []
+        self._lock = threading.Lock()
+        self.stats = {'sent': 0, 'failed': 0, 'retries': 0, 'rejected': 0}
+        self.batcher = SMSBatcher(self)
+    
+    def _start_workers(self):
+        # Started on first use so importing the module never starts threads
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f'sms-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+    
+    def send_async(self, numbers, message, timeout=None):
+        """Queue a message for numbers; returns a Future with the gateway's response.
+        
+        With timeout, no attempt or retry starts more than that many seconds
+        from now. Cancelling the Future drops any attempt not yet started, so
+        a caller that gave up waiting can't have the message arrive later.
+        Raises queue.Full if the outbound queue is at capacity.
+        """
+        if self.transport is None:
+            raise RuntimeError('SMS service is not configured by the administrator.')
+        if isinstance(numbers, str):
+            numbers = [numbers]
+        
+        self._start_workers()
+        job = SMSJob(list(numbers), message, timeout)
+        try:
+            self.queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                self.stats['rejected'] += 1
+            raise
+        return job.future
+    
+    def _worker(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                break
+            try:
+                self._attempt(job)
+            finally:
+                self.queue.task_done()
+    
+    def _attempt(self, job):
+        if job.future.cancelled():
+            Logger.info("SMS Service: Dropped a send its caller stopped waiting for")
+            return
+        remaining = job.remaining()
+        if remaining is not None and remaining <= 0:
+            self._fail(job, SMSTransportError('Timed out before it could be sent'))
+            return
+        
+        job.attempts += 1
+        try:
+            result = self.transport.send(job.numbers, job.message, timeout=remaining)
+        except SMSTransportError as e:
+            delay = min(RETRY_BASE_DELAY * 2 ** (job.attempts - 1), RETRY_MAX_DELAY)
+            remaining = job.remaining()
+            if job.attempts < MAX_ATTEMPTS and (remaining is None or delay < remaining):
+                Logger.warning(f"SMS Service: Send failed ({e}), retry {job.attempts} in {delay:.1f}s")
+                with self._lock:
+                    self.stats['retries'] += 1
+                # Wait on a timer rather than in the worker, so other messages keep flowing
+                timer = threading.Timer(delay, self._requeue, (job,))
+                timer.daemon = True
+                timer.start()
+                return
+            self._fail(job, e)
+        except Exception as e:
+            self._fail(job, e)
+        else:
+            with self._lock:
+                self.stats['sent'] += 1
+            self._settle(job, result=result)
+    
+    def _requeue(self, job):
+        try:
+            self.queue.put_nowait(job)
+        except queue.Full:
+            self._fail(job, SMSTransportError('SMS queue is full'))
+    
+    def _fail(self, job, error):
+        Logger.error(f"SMS Service: Giving up after {job.attempts} attempt(s) - {error}")
+        with self._lock:
+            self.stats['failed'] += 1
+        self._settle(job, error=error)
+    
+    def _settle(self, job, result=None, error=None):
+        # The caller may have cancelled the future meanwhile; nobody is waiting then
+        try:
+            if error is not None:
+                job.future.set_exception(error)
+            else:
+                job.future.set_result(result)
+        except InvalidStateError:
+            pass
+    
+    def metrics(self):
+        """Delivery counters and queue depth, for diagnostics."""
+        with self._lock:
+            return dict(self.stats, queued=self.queue.qsize())
+    
+    def notify(self, numbers, template):
+        """Queue a notification; identical ones within BATCH_WINDOW share one request"""
+        if self.transport is None or not numbers:
+            return
+        self.batcher.add(numbers, NOTIFICATION_TEMPLATES[template])
+    
+    def stop(self):
+        """Send any open batches, let the workers finish what is queued, then exit"""
+        self.batcher.flush()
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for _ in threads:
+            self.queue.put(None)
     
     def send_otp(self, phone, otp, security_code):
         """Send OTP via Fast2SMS API"""
@@ -24,34 +333,26 @@ class SMSService:
     
     def _send_otp_real(self, phone, otp, security_code):
         """Real SMS sending implementation"""
-        if not self.api_key:
+        if self.transport is None:
             Logger.error("SMS Service: FAST2SMS_API_KEY environment variable not set.")
             return {
                 'return': False, 
                 'message': 'SMS service is not configured by the administrator.'
             }
         
-        url = "https://www.fast2sms.com/dev/bulkV2"
-        
         # Format message
         message = f"Your Invest karo verification code is {otp}. Security Code: {security_code}. Do not share with anyone."
         
-        payload = {
-            "sender_id": self.sender_id,
-            "message": message,
-            "route": "v3",
-            "numbers": phone
-        }
-        
-        headers = {
-            'authorization': self.api_key,
-            'Content-Type': "application/json"
-        }
-        
-        response = requests.post(url, json=payload, headers=headers, timeout=10)
-        result = response.json()
-        
-        Logger.info(f"SMS Service: API Response - {result}")
+        try:
+            future = self.send_async(phone, message, timeout=OTP_WAIT_TIMEOUT)
+        except queue.Full:
+            return {'return': False, 'message': 'Too many requests right now, please try again shortly'}
+        try:
+            result = future.result(timeout=OTP_WAIT_TIMEOUT)
+        except FutureTimeout:
+            # The user will ask again; make sure this code doesn't turn up later as well
+            future.cancel()
+            return {'return': False, 'message': 'SMS gateway is not responding, please try again'}
         
         if result.get('return'):
             return {
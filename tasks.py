@@ -0,0 +1,152 @@
+# tasks.py
+"""Background execution for blocking work started from the UI.
+
+Screens submit a callable and get their callbacks back on the Kivy main
+thread, so network calls, key derivation and bulk SQL never freeze the UI.
+"""
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+from kivy.clock import Clock
+from kivy.logger import Logger
+
+MAX_WORKERS = 4
+
+
+class Task:
+    """Handle for one submitted piece of work"""
+
+    def __init__(self, task_id, name):
+        self.id = task_id
+        self.name = name
+        self.future = None
+        self.submitted_at = time.perf_counter()
+        self.started_at = None
+        self.finished_at = None
+        self.cancelled = False
+
+    def cancel(self):
+        """Drop the task if it hasn't started; either way its callbacks won't run"""
+        self.cancelled = True
+        return self.future.cancel() if self.future else False
+
+    @property
+    def done(self):
+        return self.finished_at is not None or self.cancelled
+
+    @property
+    def wait_time(self):
+        """Seconds spent queued before a worker picked the task up"""
+        return (self.started_at or time.perf_counter()) - self.submitted_at
+
+    @property
+    def run_time(self):
+        """Seconds spent running"""
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.perf_counter()) - self.started_at
+
+
+class TaskExecutor:
+    def __init__(self, max_workers=MAX_WORKERS):
+        self.max_workers = max_workers
+        self._pool = None
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.active = {}
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.total_run_time = 0.0
+        self.max_run_time = 0.0
+
+    def _executor(self):
+        # Created on first use so importing the module never starts threads
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='task')
+        return self._pool
+
+    def submit(self, fn, *args, on_success=None, on_error=None, name=None, **kwargs):
+        """Run fn(*args, **kwargs) on a worker thread.
+
+        on_success(result) or on_error(exception) is called on the main
+        thread when it finishes, unless the task was cancelled first.
+        """
+        task = Task(next(self._ids), name or getattr(fn, '__name__', 'task'))
+
+        def run():
+            task.started_at = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                task.finished_at = time.perf_counter()
+
+        with self._lock:
+            self.submitted += 1
+            self.active[task.id] = task
+        task.future = self._executor().submit(run)
+        task.future.add_done_callback(lambda future: self._finish(task, on_success, on_error))
+        return task
+
+    def _finish(self, task, on_success, on_error):
+        try:
+            error = task.future.exception()
+        except CancelledError:
+            error = None
+            task.cancelled = True
+
+        with self._lock:
+            self.active.pop(task.id, None)
+            if task.cancelled:
+                self.cancelled += 1
+            elif error is not None:
+                self.failed += 1
+            else:
+                self.completed += 1
+            self.total_run_time += task.run_time
+            self.max_run_time = max(self.max_run_time, task.run_time)
+
+        if task.cancelled:
+            Logger.info(f"Tasks: {task.name} #{task.id} cancelled")
+            return
+        if error is not None:
+            Logger.error(f"Tasks: {task.name} #{task.id} failed after {task.run_time * 1000:.0f}ms - {error}")
+            if on_error:
+                Clock.schedule_once(lambda dt: self._deliver(task, on_error, error))
+            return
+
+        Logger.debug(f"Tasks: {task.name} #{task.id} waited {task.wait_time * 1000:.1f}ms, "
+                     f"ran {task.run_time * 1000:.1f}ms")
+        if on_success:
+            result = task.future.result()
+            Clock.schedule_once(lambda dt: self._deliver(task, on_success, result))
+
+    def _deliver(self, task, callback, value):
+        # Cancelling after the work finished still suppresses the callback
+        if not task.cancelled:
+            callback(value)
+
+    def metrics(self):
+        """Task counters and run times, for diagnostics."""
+        with self._lock:
+            finished = self.completed + self.failed
+            return {
+                'submitted': self.submitted,
+                'running': len(self.active),
+                'completed': self.completed,
+                'failed': self.failed,
+                'cancelled': self.cancelled,
+                'avg_run_ms': self.total_run_time * 1000 / finished if finished else 0.0,
+                'max_run_ms': self.max_run_time * 1000,
+            }
+
+    def shutdown(self, wait=False):
+        """Stop accepting work and drop anything still queued"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait, cancel_futures=True)
+            self._pool = None
+
+# Global instance
+task_executor = TaskExecutor()
@@ -0,0 +1,30 @@
+# tests/conftest.py
+"""Shared fixtures: every test gets its own fully migrated database."""
+import pytest
+
+from database import Database
+from db_connection import connection_pool
+from key_manager import key_manager
+
+
+@pytest.fixture
+def db(tmp_path):
+    """A fresh Database in tmp_path, with its keys kept next to it"""
+    key_manager.set_key_dir(str(tmp_path))
+    path = str(tmp_path / 'investkar_test.db')
+    connection_pool.set_default_path(path)
+    yield Database(path)
+    connection_pool.close_all()
+
+
+@pytest.fixture
+def make_user(db):
+    """Insert a bare user row and return its id"""
+    def make_user(phone='9000000001'):
+        cursor = db.conn.execute(
+            "INSERT INTO users (phone, security_code_hash, salt, referral_code) VALUES (?, 'x', 'x', ?)",
+            (phone, f'R{phone}')
+        )
+        db.conn.commit()
+        return cursor.lastrowid
+    return make_user
@@ -0,0 +1,104 @@
+# tests/test_daily_returns.py
+import threading
+import time
+from datetime import date, datetime, time as clock, timedelta, timezone
+
+import pytest
+
+DAILY_RETURN = 2396  # paise; 4% of ₹599
+
+
+@pytest.fixture
+def india_time(monkeypatch):
+    """Run with the device clock at IST, 5:30 ahead of the UTC timestamps"""
+    if not hasattr(time, 'tzset'):
+        pytest.skip('needs time.tzset')
+    monkeypatch.setenv('TZ', 'Asia/Kolkata')
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def utc_timestamp(day, at):
+    """created_at as CURRENT_TIMESTAMP writes it, for a local day and time"""
+    local = datetime.combine(day, at).astimezone()
+    return local.astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def add_investment(db, user_id, created_at=None, days_remaining=80):
+    columns = 'user_id, plan_id, amount, daily_return, total_days, days_remaining'
+    values = [user_id, 1, 59900, DAILY_RETURN, 80, days_remaining]
+    if created_at:
+        columns += ', created_at'
+        values.append(created_at)
+    cursor = db.conn.execute(
+        f"INSERT INTO investments ({columns}) VALUES ({', '.join('?' * len(values))})", values
+    )
+    db.conn.commit()
+    return cursor.lastrowid
+
+
+def last_ran(db, days_ago):
+    db.conn.execute('DELETE FROM daily_run_log')
+    db.conn.execute('INSERT INTO daily_run_log (run_date) VALUES (?)',
+                    ((date.today() - timedelta(days=days_ago)).isoformat(),))
+    db.conn.commit()
+
+
+def days_credited(db, investment_id):
+    profit, = db.conn.execute('SELECT total_profit FROM investments WHERE id = ?', (investment_id,)).fetchone()
+    return profit // DAILY_RETURN
+
+
+def test_catch_up_pays_only_days_since_each_investment_was_made(db, make_user, india_time):
+    user_id = make_user()
+    today = date.today()
+    investments = {
+        # (created_at, days_remaining): days owed after missing 3 days
+        'made today, 01:30 IST (previous UTC day)': (add_investment(db, user_id, utc_timestamp(today, clock(1, 30))), 0),
+        'made today, just now': (add_investment(db, user_id), 0),
+        'made yesterday, 01:30 IST': (add_investment(db, user_id, utc_timestamp(today - timedelta(days=1), clock(1, 30))), 1),
+        'made yesterday, 23:00 IST': (add_investment(db, user_id, utc_timestamp(today - timedelta(days=1), clock(23))), 1),
+        'made 10 days ago': (add_investment(db, user_id, utc_timestamp(today - timedelta(days=10), clock(12))), 3),
+        'two days left': (add_investment(db, user_id, utc_timestamp(today - timedelta(days=10), clock(12)), 2), 2),
+    }
+    last_ran(db, 3)
+
+    credited = db.calculate_daily_returns()
+
+    assert {name: days_credited(db, investment_id) for name, (investment_id, _) in investments.items()} == \
+        {name: owed for name, (_, owed) in investments.items()}
+    assert credited == sum(owed for _, owed in investments.values())
+    wallet = db.conn.execute('SELECT wallet_balance FROM users WHERE id = ?', (user_id,)).fetchone()[0]
+    assert wallet == credited * DAILY_RETURN
+    assert db.reconcile_ledger(full=True)['ok']
+
+
+def test_catch_up_logs_every_missed_day(db, make_user):
+    add_investment(db, make_user(), utc_timestamp(date.today() - timedelta(days=30), clock(12)))
+    last_ran(db, 3)
+
+    assert db.calculate_daily_returns() == 3
+
+    logged = [row[0] for row in db.conn.execute('SELECT run_date FROM daily_run_log ORDER BY run_date')]
+    assert logged == [(date.today() - timedelta(days=n)).isoformat() for n in (3, 2, 1, 0)]
+
+
+def test_concurrent_runs_credit_once(db, make_user):
+    user_id = make_user()
+    for _ in range(50):
+        add_investment(db, user_id, utc_timestamp(date.today() - timedelta(days=30), clock(12)))
+    last_ran(db, 1)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(db.calculate_daily_returns())) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(results) == [0, 50]
+    assert db.calculate_daily_returns() == 0
+    wallet = db.conn.execute('SELECT wallet_balance FROM users WHERE id = ?', (user_id,)).fetchone()[0]
+    assert wallet == 50 * DAILY_RETURN
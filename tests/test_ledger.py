@@ -0,0 +1,301 @@
+# tests/test_ledger.py
+import sqlite3
+
+import pytest
+
+import schema
+from database import Database
+from db_connection import connection_pool
+from key_manager import key_manager
+from ledger import ledger, UnbalancedEntry, ADJUSTMENTS, OPENING, RETURNS
+from money import Money
+
+
+def account_balance(db, code):
+    return db.conn.execute('SELECT balance FROM ledger_accounts WHERE code = ?', (code,)).fetchone()[0]
+
+
+def wallet_balance(db, user_id):
+    return db.conn.execute('SELECT wallet_balance FROM users WHERE id = ?', (user_id,)).fetchone()[0]
+
+
+def test_post_records_a_balanced_entry(db, make_user):
+    user_id = make_user()
+    cursor = db.conn.cursor()
+    wallet = ledger.wallet_account(cursor, user_id)
+    journal_id = ledger.post(cursor, 'bonus', 'Welcome bonus', [
+        (wallet, Money(5000)), (ledger.account_ids[ADJUSTMENTS], Money(-5000)),
+    ])
+    db.conn.commit()
+
+    postings = db.conn.execute(
+        'SELECT account_id, amount FROM ledger_postings WHERE journal_id = ? ORDER BY amount', (journal_id,)
+    ).fetchall()
+    assert postings == [(ledger.account_ids[ADJUSTMENTS], -5000), (wallet, 5000)]
+
+
+def test_post_rejects_an_unbalanced_entry(db, make_user):
+    user_id = make_user()
+    cursor = db.conn.cursor()
+    wallet = ledger.wallet_account(cursor, user_id)
+    with pytest.raises(UnbalancedEntry):
+        ledger.post(cursor, 'bonus', 'Welcome bonus', [
+            (wallet, Money(5000)), (ledger.account_ids[ADJUSTMENTS], Money(-4999)),
+        ])
+    db.conn.rollback()
+
+    assert db.conn.execute('SELECT COUNT(*) FROM ledger_journal WHERE kind = ?', ('bonus',)).fetchone()[0] == 0
+    assert wallet_balance(db, user_id) == 0
+
+
+def test_postings_keep_wallet_balance(db, make_user):
+    user_id = make_user()
+    db.update_wallet(user_id, 100)
+    db.update_wallet(user_id, Money(-2550), kind='withdrawal')
+    db.update_wallet(user_id, Money(1), counter=RETURNS, kind='return')
+
+    assert wallet_balance(db, user_id) == 10000 - 2550 + 1
+    assert db.get_wallet_balance(user_id) == ledger.balance(db.conn.cursor(), user_id) == Money(7451)
+    assert account_balance(db, ADJUSTMENTS) == -(10000 - 2550)
+    assert account_balance(db, RETURNS) == -1
+
+
+def test_postings_are_append_only(db, make_user):
+    db.update_wallet(make_user(), 100)
+    with pytest.raises(sqlite3.IntegrityError):
+        db.conn.execute('UPDATE ledger_postings SET amount = amount + 1')
+    with pytest.raises(sqlite3.IntegrityError):
+        db.conn.execute('DELETE FROM ledger_postings')
+
+
+def test_post_wallet_credits_balances_against_the_counter_account(db, make_user):
+    users = [make_user(f'900000000{n}') for n in range(1, 4)]
+    with db.transaction() as cursor:
+        journal_id = ledger.post_wallet_credits(
+            cursor, 'return', 'Daily returns',
+            'SELECT id AS user_id, id * 100 AS amount FROM users WHERE id IN (:a, :b, :c)',
+            dict(zip('abc', users)), RETURNS,
+        )
+
+    assert [wallet_balance(db, user_id) for user_id in users] == [user_id * 100 for user_id in users]
+    assert account_balance(db, RETURNS) == -sum(user_id * 100 for user_id in users)
+    total = db.conn.execute('SELECT SUM(amount) FROM ledger_postings WHERE journal_id = ?', (journal_id,))
+    assert total.fetchone()[0] == 0
+
+
+def test_reconcile_only_sums_new_postings(db, make_user):
+    first, second = make_user('9000000001'), make_user('9000000002')
+    db.update_wallet(first, 100)
+    db.update_wallet(second, 50)
+    assert db.reconcile_ledger()['postings'] == 4
+
+    db.update_wallet(first, -30)
+    incremental = db.reconcile_ledger()
+    assert incremental['ok']
+    assert incremental['postings'] == 2
+
+    full = db.reconcile_ledger(full=True)
+    assert full['ok']
+    assert full['postings'] == db.conn.execute('SELECT COUNT(*) FROM ledger_postings').fetchone()[0]
+    assert full['accounts'] == incremental['accounts']
+
+
+def test_reconcile_reports_tampered_balances(db, make_user):
+    user_id = make_user()
+    db.update_wallet(user_id, 100)
+    db.reconcile_ledger()
+
+    db.conn.execute('UPDATE ledger_accounts SET balance = balance + 1 WHERE user_id = ?', (user_id,))
+    db.conn.commit()
+    for full in (False, True):
+        report = db.reconcile_ledger(full)
+        assert not report['ok']
+        assert report['mismatches'] == [(f'wallet:{user_id}', Money(10001), Money(10000))]
+        assert report['wallet_mismatches'] == [(user_id, Money(10000), Money(10001))]
+
+
+def test_full_reconcile_rebuilds_verified_balances(db, make_user):
+    user_id = make_user()
+    db.update_wallet(user_id, 100)
+    db.reconcile_ledger()
+
+    db.conn.execute('UPDATE ledger_accounts SET verified_balance = 0 WHERE user_id = ?', (user_id,))
+    db.conn.commit()
+    assert not db.reconcile_ledger()['ok']
+    assert db.reconcile_ledger(full=True)['ok']
+    assert db.reconcile_ledger()['ok']
+
+
+# The tables as they were before schema versioning, with money as REAL rupees
+LEGACY_TABLES = '''
+CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, phone TEXT UNIQUE NOT NULL, security_code_hash TEXT NOT NULL,
+    salt TEXT NOT NULL, wallet_balance REAL DEFAULT 0, referral_code TEXT UNIQUE, created_at TEXT DEFAULT CURRENT_TIMESTAMP);
+CREATE TABLE investments (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, plan_id INTEGER, amount REAL,
+    daily_return REAL, total_days INTEGER, days_remaining INTEGER, total_profit REAL DEFAULT 0,
+    status TEXT DEFAULT 'active', payment_method TEXT, created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users (id));
+CREATE TABLE transactions (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, type TEXT, amount REAL,
+    description TEXT, status TEXT DEFAULT 'completed', bank_details TEXT, created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (user_id) REFERENCES users (id));
+CREATE TABLE otp_store (phone TEXT PRIMARY KEY, otp TEXT, created_at TEXT DEFAULT CURRENT_TIMESTAMP);
+CREATE TABLE withdrawal_requests (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, amount REAL,
+    bank_details TEXT, status TEXT DEFAULT 'pending', payment_transaction_id TEXT,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP, FOREIGN KEY (user_id) REFERENCES users (id));
+CREATE TABLE daily_run_log (run_date TEXT PRIMARY KEY, run_timestamp TEXT DEFAULT CURRENT_TIMESTAMP);
+'''
+
+
+@pytest.fixture
+def legacy_db(tmp_path):
+    """A Database opened on a pre-versioning file holding float rupee amounts"""
+    key_manager.set_key_dir(str(tmp_path))
+    path = str(tmp_path / 'investkar_legacy.db')
+    conn = sqlite3.connect(path)
+    conn.executescript(LEGACY_TABLES)
+    conn.executemany(
+        'INSERT INTO users (phone, security_code_hash, salt, wallet_balance, referral_code) VALUES (?, ?, ?, ?, ?)',
+        [('9876543210', 'h', 's', 123.45, 'REF1'), ('9123456780', 'h', 's', 0.1 + 0.2, 'REF2'),
+         ('9000000003', 'h', 's', 0, 'REF3')]
+    )
+    conn.execute(
+        'INSERT INTO investments (user_id, plan_id, amount, daily_return, total_days, days_remaining, total_profit) '
+        'VALUES (1, 1, 599, 23.96, 80, 70, 239.6)'
+    )
+    conn.execute("INSERT INTO withdrawal_requests (user_id, amount) VALUES (1, 200.5)")
+    conn.commit()
+    conn.close()
+
+    connection_pool.set_default_path(path)
+    yield Database(path)
+    connection_pool.close_all()
+
+
+def test_migration_stores_legacy_rupees_as_paise(legacy_db):
+    conn = legacy_db.conn
+    assert schema.get_version(conn) == schema.SCHEMA_VERSION
+
+    assert conn.execute('SELECT wallet_balance, typeof(wallet_balance) FROM users ORDER BY id').fetchall() == [
+        (12345, 'integer'), (30, 'integer'), (0, 'integer')]
+    assert conn.execute('SELECT amount, daily_return, total_profit FROM investments').fetchone() == (59900, 2396, 23960)
+    assert conn.execute('SELECT amount FROM withdrawal_requests').fetchone() == (20050,)
+    for table, columns in schema.MONEY_COLUMNS.items():
+        for column in columns:
+            types = conn.execute(f'SELECT DISTINCT typeof({column}) FROM {table}').fetchall()
+            assert set(types) <= {('integer',)}, f'{table}.{column}'
+
+
+def test_migration_opens_the_ledger_with_legacy_balances(legacy_db):
+    conn = legacy_db.conn
+    assert account_balance(legacy_db, 'wallet:1') == 12345
+    assert account_balance(legacy_db, 'wallet:2') == 30
+    assert account_balance(legacy_db, OPENING) == -(12345 + 30)
+    assert conn.execute("SELECT COUNT(*) FROM ledger_postings WHERE account_id = "
+                        "(SELECT id FROM ledger_accounts WHERE code = 'wallet:3')").fetchone()[0] == 0
+    assert legacy_db.reconcile_ledger(full=True)['ok']
+
+    legacy_db.update_wallet(2, Money(-30))
+    assert wallet_balance(legacy_db, 2) == 0
+    assert legacy_db.reconcile_ledger()['ok']
+
+
+def post_at(db, user_id, amount, created_at, kind='adjustment'):
+    """A wallet entry as if it had been posted at created_at"""
+    cursor = db.conn.cursor()
+    journal_id = cursor.execute(
+        'INSERT INTO ledger_journal (kind, description, created_at) VALUES (?, ?, ?)', (kind, kind, created_at)
+    ).lastrowid
+    cursor.executemany(
+        'INSERT INTO ledger_postings (journal_id, account_id, amount, created_at) VALUES (?, ?, ?, ?)',
+        [(journal_id, ledger.wallet_account(cursor, user_id), amount, created_at),
+         (journal_id, ledger.account_ids[ADJUSTMENTS], -amount, created_at)]
+    )
+    db.conn.commit()
+
+
+def balance_before(db, user_id, moment):
+    return db.conn.execute('''
+        SELECT COALESCE(SUM(p.amount), 0) FROM ledger_postings p
+        JOIN ledger_accounts a ON a.id = p.account_id
+        WHERE a.user_id = ? AND p.created_at < ?
+    ''', (user_id, moment)).fetchone()[0]
+
+
+@pytest.fixture
+def history(db, make_user):
+    """Two wallets with postings spread over January to April 2024"""
+    users = make_user('9000000001'), make_user('9000000002')
+    for n, day in enumerate(['2024-01-03', '2024-01-31', '2024-02-01', '2024-02-14', '2024-03-09', '2024-04-20']):
+        post_at(db, users[0], 1000 * (n + 1), f'{day} 10:00:00')
+        post_at(db, users[1], -100 if n % 2 else 700, f'{day} 23:59:59')
+    return users
+
+
+STATEMENT_RANGES = [
+    ('2024-01-01', '2024-02-01'),
+    ('2024-02-01', '2024-03-01'),
+    ('2024-02-10', '2024-03-20'),
+    ('2024-03-01', '2024-05-01'),
+    ('2023-12-01', '2024-12-01'),
+    ('2024-05-01', '2024-06-01'),
+]
+
+
+def check_statements(db, users):
+    for user_id in users:
+        for start, end in STATEMENT_RANGES:
+            statement = db.get_statement(user_id, start, end)
+            assert statement['opening_balance'] == Money(balance_before(db, user_id, start))
+            assert statement['closing_balance'] == Money(balance_before(db, user_id, end))
+            running = [balance for *_, balance in statement['entries']]
+            assert running == [Money(balance_before(db, user_id, created_at)) + amount
+                               for created_at, _, _, amount, _ in statement['entries']]
+
+
+def test_statement_balances_without_checkpoints(db, history):
+    check_statements(db, history)
+
+
+def test_statement_balances_from_checkpoints(db, history):
+    with db.transaction() as cursor:
+        for period in ('2024-02-01', '2024-03-01', '2024-04-01'):
+            assert ledger.write_checkpoint(cursor, period) == len(history)
+    check_statements(db, history)
+
+
+def test_statement_for_an_unknown_user(db):
+    assert db.get_statement(999, '2024-01-01', '2024-02-01') is None
+
+
+def test_checkpoints_match_the_postings_before_them(db, history):
+    with db.transaction() as cursor:
+        # Out of order and repeated, so each one builds on whatever came before
+        for period in ('2024-03-01', '2024-02-01', '2024-04-01', '2024-03-01'):
+            ledger.write_checkpoint(cursor, period)
+
+    checkpoints = db.conn.execute('''
+        SELECT a.user_id, c.period, c.balance FROM ledger_checkpoints c
+        JOIN ledger_accounts a ON a.id = c.account_id ORDER BY a.user_id, c.period
+    ''').fetchall()
+    assert checkpoints == [
+        (user_id, period, balance_before(db, user_id, period))
+        for user_id in history for period in ('2024-02-01', '2024-03-01', '2024-04-01')
+    ]
+
+
+def test_write_balance_checkpoints_catches_up_to_this_month(db, history):
+    with db.transaction() as cursor:
+        ledger.write_checkpoint(cursor, '2024-02-01')
+    months = db.conn.execute(
+        "SELECT (strftime('%Y', 'now') - 2024) * 12 + strftime('%m', 'now') - 2"
+    ).fetchone()[0]
+    assert db.write_balance_checkpoints() == months
+    assert db.write_balance_checkpoints() == 0
+
+    current = db.conn.execute("SELECT date('now', 'start of month')").fetchone()[0]
+    for user_id in history:
+        checkpoint = db.conn.execute('''
+            SELECT balance FROM ledger_checkpoints
+            WHERE period = ? AND account_id = (SELECT id FROM ledger_accounts WHERE user_id = ?)
+        ''', (current, user_id)).fetchone()[0]
+        assert Money(checkpoint) == ledger.balance(db.conn.cursor(), user_id)
+    check_statements(db, history)
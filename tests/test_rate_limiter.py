@@ -0,0 +1,87 @@
+# tests/test_rate_limiter.py
+import pytest
+
+from rate_limiter import MemoryBackend, SQLiteBackend, _slide
+
+LIMIT = 5
+WINDOW = 60.0
+
+
+def attempts(state, now, times=1):
+    return [_slide(state, LIMIT, WINDOW, now)[0] for _ in range(times)]
+
+
+def test_allows_the_limit_then_blocks():
+    state = [0.0, 0, 0]
+    assert attempts(state, 1.0, LIMIT) == [True] * LIMIT
+    allowed, retry_after = _slide(state, LIMIT, WINDOW, 2.0)
+    assert not allowed
+    assert retry_after > 0
+    assert state == [0.0, LIMIT, 0]  # blocked attempts aren't counted
+
+
+def test_previous_window_is_weighted_by_its_overlap():
+    state = [0.0, 0, 0]
+    attempts(state, 59.0, LIMIT)
+
+    # A fifth of the way into the next window, 4/5 of the old attempts still count
+    assert attempts(state, 72.0, 2) == [True, False]
+    assert state == [60.0, 1, LIMIT]
+    # Halfway in, only 2.5 of them do
+    assert attempts(state, 90.0, 3) == [True, True, False]
+
+
+def test_state_resets_after_two_idle_windows():
+    state = [0.0, 0, 0]
+    attempts(state, 1.0, LIMIT)
+    assert attempts(state, 2 * WINDOW, LIMIT) == [True] * LIMIT
+    assert state == [2 * WINDOW, LIMIT, 0]
+
+
+@pytest.mark.parametrize('history', [
+    [(1.0, LIMIT)],                 # blocked by this window's own attempts
+    [(59.0, LIMIT), (70.0, 1)],     # blocked by the previous window's weight
+    [(10.0, 4), (65.0, 2)],
+])
+def test_retry_after_is_when_the_next_attempt_is_allowed(history):
+    state = [0.0, 0, 0]
+    for now, times in history:
+        attempts(state, now, times)
+    now = history[-1][0]
+    allowed, retry_after = _slide(state, LIMIT, WINDOW, now)
+    assert not allowed
+
+    assert not _slide(list(state), LIMIT, WINDOW, now + retry_after - 0.01)[0]
+    assert _slide(list(state), LIMIT, WINDOW, now + retry_after + 0.01)[0]
+
+
+def test_memory_backend_evicts_least_recently_used_keys():
+    backend = MemoryBackend(max_keys=2)
+    backend.hit('login', 'a', LIMIT, WINDOW, 0.0)
+    backend.hit('login', 'b', LIMIT, WINDOW, 1.0)
+    backend.hit('login', 'a', LIMIT, WINDOW, 2.0)
+    backend.hit('login', 'c', LIMIT, WINDOW, 3.0)
+
+    assert backend.stats()['keys'] == 2
+    assert backend.evicted == 1
+    assert set(backend._scopes['login'][1]) == {'a', 'c'}
+
+
+def test_memory_backend_drops_expired_keys():
+    backend = MemoryBackend()
+    backend.hit('login', 'a', LIMIT, WINDOW, 0.0)
+    backend.hit('login', 'b', LIMIT, WINDOW, 50.0)
+    backend.hit('login', 'c', LIMIT, WINDOW, 2 * WINDOW + 10)
+
+    assert backend.expired == 1
+    assert set(backend._scopes['login'][1]) == {'b', 'c'}
+
+
+def test_sqlite_backend_matches_memory_backend(db):
+    memory, shared = MemoryBackend(), SQLiteBackend(db.db_path)
+    for now in (0.0, 1.0, 2.0, 30.0, 59.0, 61.0, 75.0, 90.0, 119.0, 200.0):
+        for key in ('9000000001', '9000000002'):
+            assert shared.hit('otp', key, 3, WINDOW, now) == memory.hit('otp', key, 3, WINDOW, now)
+
+    shared.reset('otp', '9000000001')
+    assert shared.stats()['keys'] == 1
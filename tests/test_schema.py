@@ -0,0 +1,9 @@
+import sqlite3
+
+import schema
+
+
+def test_hot_queries_use_indexes():
+    conn = sqlite3.connect(':memory:')
+    schema.migrate(conn)
+    assert schema.find_full_scans(conn) == {}
@@ -0,0 +1,65 @@
+# tests/test_sms_service.py
+import time
+
+import pytest
+
+import sms_service
+from sms_service import SMSService, LocalTransport
+
+
+@pytest.fixture
+def service():
+    def start(transport):
+        started.append(SMSService(transport=transport, workers=1))
+        return started[-1]
+    started = []
+    yield start
+    for running in started:
+        running.stop()
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        assert time.perf_counter() < deadline, 'timed out waiting'
+        time.sleep(0.01)
+
+
+def test_otp_retry_that_fits_the_wait_is_delivered(service, monkeypatch):
+    monkeypatch.setattr(sms_service, 'RETRY_BASE_DELAY', 0.05)
+    transport = LocalTransport(fail_first=1)
+
+    result = service(transport).send_otp('9000000001', '123456', '7890')
+
+    assert result['return'] is True
+    assert len(transport.sent) == 1
+
+
+def test_timed_out_otp_is_not_delivered_later(service, monkeypatch):
+    # The retry would come after the caller stops waiting
+    monkeypatch.setattr(sms_service, 'OTP_WAIT_TIMEOUT', 0.2)
+    monkeypatch.setattr(sms_service, 'RETRY_BASE_DELAY', 0.3)
+    transport = LocalTransport(fail_first=1)
+
+    result = service(transport).send_otp('9000000001', '123456', '7890')
+    time.sleep(0.6)
+
+    assert result['return'] is False
+    assert transport.sent == []
+
+
+def test_cancelled_send_drops_its_pending_retry(service, monkeypatch):
+    monkeypatch.setattr(sms_service, 'RETRY_BASE_DELAY', 0.3)
+    transport = LocalTransport(fail_first=1)
+    sms = service(transport)
+
+    future = sms.send_async('9000000001', 'hello')
+    wait_for(lambda: sms.metrics()['retries'] == 1)
+    assert future.cancel()
+    time.sleep(0.6)
+
+    assert transport.sent == []
+
+
+def test_otp_wait_stays_within_the_old_request_timeout():
+    assert sms_service.OTP_WAIT_TIMEOUT <= 10
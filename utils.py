@@ -3,8 +3,9 @@ from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.label import Label
 from kivy.uix.button import Button
 from kivy.uix.modalview import ModalView
-import sqlite3
 from kivy.logger import Logger
+from db_connection import connection_pool
+import schema
 
 def show_popup(title, message):
     """Show a simple popup message using Kivy's Popup widget."""
@@ -39,47 +40,46 @@ def hide_loading(popup_instance):
     if popup_instance:
         popup_instance.dismiss()
 
-def validate_database(db_path="investkar_data.db"):
-    """Checks if all required database tables exist."""
+def validate_database(db_path=None):
+    """Checks if all required database tables exist and the schema is current."""
     try:
-        conn = sqlite3.connect(db_path)
+        conn = connection_pool.get(db_path)
         cursor = conn.cursor()
         
         # Check all tables exist
-        tables = ['users', 'investments', 'transactions', 'withdrawal_requests', 'payment_intents', 'otp_store']
         all_ok = True
-        for table in tables:
+        for table in schema.REQUIRED_TABLES:
             cursor.execute(f"SELECT name FROM sqlite_master WHERE type='table' AND name='{table}'")
             if not cursor.fetchone():
                 Logger.error(f"Database Validation: Missing table: {table}")
                 all_ok = False
         
+        version = schema.get_version(conn)
+        if version < schema.SCHEMA_VERSION:
+            Logger.error(f"Database Validation: Schema version {version} is behind {schema.SCHEMA_VERSION}")
+            all_ok = False
+        
+        # Hot queries should always be served by an index
+        for name, scans in schema.find_full_scans(conn).items():
+            Logger.warning(f"Database Validation: {name} full-scans - {'; '.join(scans)}")
+        
         if all_ok:
             Logger.info("Database Validation: All tables are present.")
         
-        conn.close()
         return all_ok
     except Exception as e:
         Logger.error(f"Database Validation: Failed to connect or validate - {e}")
         return False
 
-def optimize_app(db_path="investkar_data.db"):
-    """Adds database indexes for performance optimization."""
+def optimize_app(db_path=None):
+    """Makes sure the schema (including indexes) is current and refreshes planner statistics."""
     try:
-        # 1. Add database indexes
-        indexes = [
-            "CREATE INDEX IF NOT EXISTS idx_users_phone ON users(phone)",
-            "CREATE INDEX IF NOT EXISTS idx_investments_user ON investments(user_id)",
-            "CREATE INDEX IF NOT EXISTS idx_transactions_user ON transactions(user_id)",
-            "CREATE INDEX IF NOT EXISTS idx_payment_intents_txn ON payment_intents(transaction_id)"
-        ]
+        # 1. Indexes are owned by the schema migrations; this is a no-op when current
+        conn = connection_pool.get(db_path)
+        schema.migrate(conn)
         
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        for index in indexes:
-            cursor.execute(index)
-        conn.commit()
-        conn.close()
+        # 2. Let SQLite refresh statistics for any index that needs it
+        conn.execute("PRAGMA optimize")
         Logger.info("Database Optimization: Indexes applied successfully.")
     except Exception as e:
         Logger.error(f"Database Optimization: Failed to apply indexes - {e}")